@@ -0,0 +1,59 @@
+import numpy as np
+from zfnetwork import grn
+
+"""
+Network construction benchmarks.
+
+Classes follow the airspeed velocity (asv) conventions, so they can be run either with `asv run`
+or offline with `benchmarks/run_benchmarks.py`.
+"""
+
+
+def random_edge_list(n_edges, seed=0):
+    """Random TF/ZF -> ZF/TE edge list with roughly sqrt(n_edges) nodes of each type.
+
+    Returns:
+        edge_list: list of (source, target) label tuples
+        node_types: dictionary mapping labels to 'TF', 'ZF' or 'TE'
+    """
+    rng = np.random.RandomState(seed)
+    n_nodes = max(2, int(np.sqrt(n_edges)))
+    node_types = {}
+    for ntype in 'TF', 'ZF', 'TE':
+        node_types.update({f'{ntype}_{i}': ntype for i in range(n_nodes)})
+    sources = np.array([f'TF_{i}' for i in range(n_nodes)] + [f'ZF_{i}' for i in range(n_nodes)])
+    targets = np.array([f'ZF_{i}' for i in range(n_nodes)] + [f'TE_{i}' for i in range(n_nodes)])
+    edge_list = list(zip(sources[rng.randint(sources.size, size=n_edges)],
+                         targets[rng.randint(targets.size, size=n_edges)]))
+    return edge_list, node_types
+
+
+class ErdosRenyi:
+    params = ([10, 30, 100, 300], [0.01, 0.1, 0.5])
+    param_names = ['n_nodes', 'p']
+
+    def setup(self, n_nodes, p):
+        np.random.seed(0)
+        self.zf_grn = grn.ZincFingerGRN(n_nodes, n_nodes, n_nodes)
+
+    def time_generate_erdos_renyi(self, n_nodes, p):
+        self.zf_grn.generate_erdos_renyi(p)
+
+    def track_n_edges(self, n_nodes, p):
+        self.zf_grn.generate_erdos_renyi(p)
+        return len(self.zf_grn.edges)
+    track_n_edges.unit = 'edges'
+
+
+class FromEdgeList:
+    params = [10**3, 10**4, 10**5, 10**6]
+    param_names = ['n_edges']
+    timeout = 600
+    repeat = 1
+
+    def setup(self, n_edges):
+        self.edge_list, self.node_types = random_edge_list(n_edges)
+
+    def time_from_edge_list(self, n_edges):
+        zf_grn = grn.ZincFingerGRN()
+        zf_grn.from_edge_list(self.edge_list, self.node_types)
@@ -0,0 +1,59 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts', 'grn'))
+import cres_to_network
+
+"""
+Benchmarks of the FIMO parsers in scripts/grn/cres_to_network.py on generated FIMO output.
+"""
+
+FIMO_HEADER = ('motif_id\tmotif_alt_id\tsequence_name\tstart\tstop\tstrand\tscore\tp-value\t'
+               'q-value\tmatched_sequence\n')
+
+
+def write_fimo(outfile, n_hits, kzfp_targets=False, n_motifs=500, n_sequences=5000, seed=0):
+    """Write synthetic FIMO TSV file with n_hits rows, followed by FIMO's trailing comment block.
+
+    If kzfp_targets is True, sequence names have the form of KZFP promoter cCREs
+    ('EH38E0000000;PLS;ZNF1;'), as parsed by parse_tf_kzfp_fimo.
+    """
+    rng = np.random.RandomState(seed)
+    motifs = rng.randint(n_motifs, size=n_hits)
+    sequences = rng.randint(n_sequences, size=n_hits)
+    starts = rng.randint(1, 1000, size=n_hits)
+    pvalues = 10**rng.uniform(-9, -4, size=n_hits)
+    qvalues = np.minimum(1.0, pvalues*1e3)
+    with open(outfile, 'w') as output:
+        output.write(FIMO_HEADER)
+        for motif, seq, start, pvalue, qvalue in zip(motifs, sequences, starts, pvalues, qvalues):
+            if kzfp_targets:
+                seq_name = f'EH38E{seq:07d};PLS;ZNF{seq % 700};'
+            else:
+                seq_name = f'chr1:{seq*1000}-{seq*1000 + 500}::L1HS_{seq}'
+            output.write(f'M{motif:05d}_2.00\tTF_{motif}\t{seq_name}\t{start}\t{start + 11}\t+\t'
+                         f'15.0\t{pvalue:.3g}\t{qvalue:.3g}\tACGTACGTACGT\n')
+        output.write('\n# FIMO (Find Individual Motif Occurrences): Version 5.4.1\n'
+                     '# The format of this file is described at https://meme-suite.org\n')
+
+
+class FimoParsers:
+    params = [10**4, 10**5, 10**6]
+    param_names = ['n_hits']
+    timeout = 600
+
+    def setup_cache(self):
+        # Run once in a scratch working directory shared by the benchmarks, as in asv
+        paths = {}
+        for n_hits in self.params:
+            paths[n_hits] = (f'te_{n_hits}.tsv', f'kzfp_{n_hits}.tsv')
+            write_fimo(paths[n_hits][0], n_hits)
+            write_fimo(paths[n_hits][1], n_hits, kzfp_targets=True)
+        return paths
+
+    def time_parse_tf_te_fimo(self, paths, n_hits):
+        cres_to_network.parse_tf_te_fimo(paths[n_hits][0], 0.05)
+
+    def time_parse_tf_kzfp_fimo(self, paths, n_hits):
+        cres_to_network.parse_tf_kzfp_fimo(paths[n_hits][1], 0.05)
@@ -0,0 +1,42 @@
+import time
+import numpy as np
+from zfnetwork import grn
+from zfnetwork import ssa
+
+"""
+Stochastic simulation benchmarks on Erdos-Renyi networks.
+"""
+
+
+def erdos_renyi_grn(n_nodes, p, seed=0):
+    """ZincFingerGRN with n_nodes TFs, ZFs and TEs and Erdos-Renyi edges."""
+    np.random.seed(seed)
+    zf_grn = grn.ZincFingerGRN(n_nodes, n_nodes, n_nodes)
+    zf_grn.generate_erdos_renyi(p)
+    return zf_grn
+
+
+class GillespieRun:
+    params = ([3, 10, 30], [1, 4])
+    param_names = ['n_nodes', 'replicates']
+    duration = 10
+    repeat = 1
+
+    def setup(self, n_nodes, replicates):
+        self.zf_grn = erdos_renyi_grn(n_nodes, 0.1)
+
+    def _run(self, replicates):
+        np.random.seed(0)
+        simulation = ssa.GillespieSSA(self.zf_grn)
+        simulation.run(self.duration, replicates, progress=False)
+        return simulation
+
+    def time_run(self, n_nodes, replicates):
+        self._run(replicates)
+
+    def track_events_per_second(self, n_nodes, replicates):
+        start = time.perf_counter()
+        simulation = self._run(replicates)
+        return simulation.n_events/(time.perf_counter() - start)
+    track_events_per_second.unit = 'events/s'
+    track_events_per_second.higher_is_better = True
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+"""
+Startup benchmark for the zfnetwork simulation core.
+
+Measures (1) the wall time of a fresh interpreter importing a module, (2) the cumulative import time
+of the slowest modules it pulls in, as reported by `python -X importtime`, and (3) the overhead of
+spawning a pool of worker processes that each import the simulation core and return a trivial
+result, which is the fixed cost paid by every short parameter-sweep job.
+"""
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _env():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([REPO, env.get('PYTHONPATH', '')]).rstrip(os.pathsep)
+    return env
+
+
+def import_time(module, repeat=10):
+    """Wall times (seconds) of `python -c 'import module'`, minus a bare interpreter start."""
+    def run(code):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], env=_env(), check=True)
+        return time.perf_counter() - start
+
+    baseline = np.median([run('pass') for _ in range(repeat)])
+    return [run(f'import {module}') - baseline for _ in range(repeat)]
+
+
+def import_breakdown(module, top=10):
+    """Slowest top-level and first-level imports of module, from `python -X importtime`.
+
+    Returns:
+        list of (cumulative microseconds, package) tuples, slowest first
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            env=_env(), check=True, capture_output=True, text=True)
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # Record modules imported at the top level or directly by them (indent of 1 or 3 spaces)
+        depth = (len(name) - len(name.lstrip()) - 1)//2
+        if depth <= 1:
+            packages[name.strip()] = int(cumulative_us)
+    return sorted(((us, name) for name, us in packages.items()), reverse=True)[:top]
+
+
+def _worker_task(module):
+    __import__(module)
+    return os.getpid()
+
+
+def spawn_overhead(module, n_workers=4, start_method='spawn'):
+    """Seconds from creating a process pool to every worker having imported module."""
+    context = multiprocessing.get_context(start_method)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=context) as pool:
+        list(pool.map(_worker_task, [module]*n_workers))
+    return time.perf_counter() - start
+
+
+class Startup:
+    params = ['zfnetwork.grn', 'zfnetwork.ssa']
+    param_names = ['module']
+    repeat = 1
+
+    def track_import_time(self, module):
+        return 1e3*float(np.median(import_time(module, repeat=5)))
+    track_import_time.unit = 'ms'
+
+    def track_spawn_overhead(self, module):
+        return 1e3*spawn_overhead(module)
+    track_spawn_overhead.unit = 'ms'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark zfnetwork import and spawn time.')
+    parser.add_argument('--modules', nargs='+', default=['zfnetwork.grn', 'zfnetwork.ssa'])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    sys.path.insert(0, REPO)
+    results = {}
+    for module in args.modules:
+        times = import_time(module, args.repeat)
+        results[module] = {
+            'import_s': float(np.median(times)),
+            'spawn_s': spawn_overhead(module, args.workers),
+            'slowest_imports': import_breakdown(module),
+        }
+    if args.json:
+        json.dump(results, sys.stdout, indent=1)
+        sys.stdout.write('\n')
+    else:
+        for module, result in results.items():
+            sys.stdout.write(f'{module}\timport {1e3*result["import_s"]:.1f} ms\t'
+                             f'spawn {args.workers} workers {1e3*result["spawn_s"]:.1f} ms\n')
+            for us, name in result['slowest_imports']:
+                sys.stdout.write(f'\t{us/1e3:8.1f} ms\t{name}\n')
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import json
+import time
+import inspect
+import tempfile
+import argparse
+import datetime
+import platform
+import itertools
+import importlib
+import subprocess
+import numpy as np
+
+"""
+Offline runner for the benchmarks in this directory.
+
+Benchmark modules (bench_*.py) follow the airspeed velocity (asv) conventions: classes or functions
+whose names start with `time_` (wall time per call, lower is better) or `track_` (any returned value),
+with optional `params`, `param_names`, `setup`, `setup_cache`, `repeat` and `number` attributes. The
+same modules can be run with `asv run` where asv is installed; this runner needs nothing beyond the
+packages zfnetwork already depends on and does not touch the network.
+
+Results are written to .benchmarks/<commit>.json in the repository root and compared against the
+results of the most recent earlier commit that has them (or --compare), flagging any benchmark that
+became slower (or, for `higher_is_better` track benchmarks, smaller) by more than --factor.
+"""
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(REPO, '.benchmarks')
+
+
+class Benchmark:
+    """A single time_ or track_ benchmark, possibly over a grid of parameters."""
+
+    def __init__(self, name, func, cls=None):
+        self.name = name
+        self.func = func
+        self.cls = cls
+        self.kind = func.__name__.split('_')[0]
+        source = cls if cls is not None else func
+        params = getattr(source, 'params', [])
+        # As in asv, a flat list is a single parameter
+        if params and not isinstance(params[0], (list, tuple)):
+            params = [params]
+        self.params = [list(p) for p in params]
+        self.param_names = list(getattr(source, 'param_names',
+                                        [f'param{i+1}' for i in range(len(self.params))]))
+        self.repeat = getattr(func, 'repeat', getattr(source, 'repeat', 5))
+        self.number = getattr(func, 'number', getattr(source, 'number', 0))
+        self.unit = getattr(func, 'unit', 'seconds' if self.kind == 'time' else 'unit')
+        self.higher_is_better = getattr(func, 'higher_is_better', False)
+
+    def param_sets(self):
+        return list(itertools.product(*self.params))
+
+    @staticmethod
+    def param_key(param_set):
+        return ', '.join(repr(p) for p in param_set)
+
+    def _measure(self, call, quick):
+        """Median seconds per call, calibrating the number of calls per sample to ~10 ms."""
+        number = self.number
+        if quick:
+            number, repeat = 1, 1
+        else:
+            repeat = self.repeat
+            if number <= 0:
+                start = time.perf_counter()
+                call()
+                elapsed = time.perf_counter() - start
+                number = max(1, int(0.01/max(elapsed, 1e-9)))
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                call()
+            samples.append((time.perf_counter() - start)/number)
+        return float(np.median(samples))
+
+    def run(self, cache=None, quick=False, log=sys.stderr):
+        """Run benchmark over all parameter sets.
+
+        Args:
+            cache: value returned by the class's setup_cache, passed as first argument if set
+            quick: time a single call of each benchmark instead of several samples
+
+        Returns:
+            dictionary mapping parameter keys to results, or None where setup raised
+            NotImplementedError (the asv way to skip a parameter set) or the benchmark failed
+        """
+        values = {}
+        extra = () if cache is None else (cache,)
+        for param_set in self.param_sets():
+            key = self.param_key(param_set)
+            args = extra + tuple(param_set)
+            instance = self.cls() if self.cls is not None else None
+            func = getattr(instance, self.func.__name__) if instance is not None else self.func
+            try:
+                if instance is not None and hasattr(instance, 'setup'):
+                    instance.setup(*args)
+                if self.kind == 'time':
+                    values[key] = self._measure(lambda: func(*args), quick)
+                else:
+                    values[key] = float(func(*args))
+            except NotImplementedError:
+                values[key] = None
+            except Exception as error:
+                log.write(f'{self.name}({key}) failed: {error!r}\n')
+                values[key] = None
+            finally:
+                if instance is not None and hasattr(instance, 'teardown'):
+                    instance.teardown(*args)
+        return values
+
+
+def discover(bench_dir=BENCH_DIR, pattern=None):
+    """Find benchmarks in bench_*.py modules of bench_dir.
+
+    Args:
+        pattern: optional regular expression; only benchmarks whose names match are returned
+
+    Returns:
+        list of (Benchmark, setup_cache function or None) tuples
+    """
+    if bench_dir not in sys.path:
+        sys.path.insert(0, bench_dir)
+    benchmarks = []
+    for filename in sorted(os.listdir(bench_dir)):
+        if not (filename.startswith('bench_') and filename.endswith('.py')):
+            continue
+        module_name = filename[:-3]
+        module = importlib.import_module(module_name)
+        for obj_name, obj in inspect.getmembers(module):
+            if getattr(obj, '__module__', None) != module.__name__:
+                continue
+            if inspect.isclass(obj):
+                setup_cache = getattr(obj, 'setup_cache', None)
+                for func_name, func in inspect.getmembers(obj, inspect.isfunction):
+                    if func_name.startswith(('time_', 'track_')):
+                        name = f'{module_name}.{obj_name}.{func_name}'
+                        benchmarks.append((Benchmark(name, func, obj), setup_cache))
+            elif inspect.isfunction(obj) and obj_name.startswith(('time_', 'track_')):
+                benchmarks.append((Benchmark(f'{module_name}.{obj_name}', obj), None))
+    if pattern is not None:
+        benchmarks = [(b, c) for b, c in benchmarks if re.search(pattern, b.name)]
+    return benchmarks
+
+
+def run_all(benchmarks, quick=False, log=sys.stderr):
+    """Run benchmarks, calling each class's setup_cache once in a scratch working directory.
+
+    Returns:
+        dictionary mapping benchmark names to {'unit', 'higher_is_better', 'params', 'values'}
+    """
+    results = {}
+    caches = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='zfnetwork_bench_') as scratch:
+        os.chdir(scratch)
+        try:
+            for benchmark, setup_cache in benchmarks:
+                cache = None
+                if setup_cache is not None:
+                    if benchmark.cls not in caches:
+                        caches[benchmark.cls] = setup_cache(benchmark.cls())
+                    cache = caches[benchmark.cls]
+                log.write(f'{benchmark.name}\n')
+                results[benchmark.name] = {
+                    'unit': benchmark.unit,
+                    'higher_is_better': benchmark.higher_is_better,
+                    'param_names': benchmark.param_names,
+                    'values': benchmark.run(cache, quick, log),
+                }
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def git_commit(repo=REPO):
+    """Current commit hash, suffixed with '-dirty' if tracked files have uncommitted changes."""
+    commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=repo, check=True,
+                            capture_output=True, text=True).stdout.strip()
+    status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=repo,
+                            check=True, capture_output=True, text=True).stdout
+    return commit + '-dirty' if status.strip() else commit
+
+
+def save_results(results, commit, results_dir=RESULTS_DIR):
+    """Write results and machine information to results_dir/<commit>.json."""
+    os.makedirs(results_dir, exist_ok=True)
+    outfile = os.path.join(results_dir, f'{commit}.json')
+    with open(outfile, 'w') as output:
+        json.dump({'commit': commit,
+                   'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                   'machine': platform.node(),
+                   'python': platform.python_version(),
+                   'results': results}, output, indent=1)
+    return outfile
+
+
+def load_results(commit, results_dir=RESULTS_DIR):
+    """Read results of commit, or None if it has not been benchmarked."""
+    infile = os.path.join(results_dir, f'{commit}.json')
+    if not os.path.exists(infile):
+        return None
+    with open(infile) as input:
+        return json.load(input)
+
+
+def previous_results(commit, results_dir=RESULTS_DIR, repo=REPO):
+    """Results of the most recent ancestor of commit that has been benchmarked, or None."""
+    base = commit[:-len('-dirty')] if commit.endswith('-dirty') else commit
+    ancestors = subprocess.run(['git', 'rev-list', base], cwd=repo, check=True,
+                               capture_output=True, text=True).stdout.split()
+    if commit == base:
+        ancestors = ancestors[1:]
+    for ancestor in ancestors:
+        previous = load_results(ancestor, results_dir)
+        if previous is not None:
+            return previous
+    return None
+
+
+def compare(old, new, factor=1.1):
+    """Compare two sets of results.
+
+    Args:
+        old, new: 'results' dictionaries as returned by run_all
+        factor: ratio beyond which a change is reported
+
+    Returns:
+        list of (name, param key, old value, new value, status) tuples for benchmarks present in
+        both, where status is 'regression', 'improvement' or '' (within factor)
+    """
+    changes = []
+    for name, result in new.items():
+        if name not in old:
+            continue
+        for key, value in result['values'].items():
+            old_value = old[name]['values'].get(key)
+            if value is None or old_value is None or old_value == 0 or value == 0:
+                continue
+            ratio = value/old_value
+            if result['higher_is_better']:
+                ratio = 1.0/ratio
+            if ratio > factor:
+                status = 'regression'
+            elif ratio < 1.0/factor:
+                status = 'improvement'
+            else:
+                status = ''
+            changes.append((name, key, old_value, value, status))
+    return changes
+
+
+def format_value(value, unit):
+    if value is None:
+        return 'n/a'
+    if unit == 'seconds':
+        for scale, suffix in (1.0, 's'), (1e-3, 'ms'), (1e-6, 'us'):
+            if value >= scale:
+                return f'{value/scale:.3g} {suffix}'
+        return f'{value/1e-9:.3g} ns'
+    return f'{value:.4g} {unit}'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run zfnetwork benchmarks and flag regressions.')
+    parser.add_argument('-b', '--bench', default=None,
+                        help='regular expression selecting benchmarks to run')
+    parser.add_argument('--quick', action='store_true',
+                        help='time each benchmark once, and do not save results')
+    parser.add_argument('--compare', default=None,
+                        help='commit to compare against (default: latest benchmarked ancestor)')
+    parser.add_argument('--factor', type=float, default=1.1,
+                        help='report changes larger than this ratio (default: 1.1)')
+    parser.add_argument('--results-dir', default=RESULTS_DIR)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    sys.path.insert(0, REPO)
+    commit = git_commit()
+    results = run_all(discover(pattern=args.bench), quick=args.quick)
+    if not args.quick:
+        sys.stderr.write(f'Saved {save_results(results, commit, args.results_dir)}\n')
+
+    if args.compare is not None:
+        ref = subprocess.run(['git', 'rev-parse', args.compare], cwd=REPO, check=True,
+                             capture_output=True, text=True).stdout.strip()
+        previous = load_results(ref, args.results_dir)
+    else:
+        previous = previous_results(commit, args.results_dir)
+
+    changes = {}
+    if previous is not None:
+        sys.stdout.write(f'Comparing with {previous["commit"]}\n')
+        changes = {(name, key): (old, status)
+                   for name, key, old, _, status in compare(previous['results'], results,
+                                                            args.factor)}
+    for name, result in results.items():
+        for key, value in result['values'].items():
+            old, status = changes.get((name, key), (None, ''))
+            line = f'{name}({key})\t{format_value(value, result["unit"])}'
+            if old is not None:
+                line += f'\t(was {format_value(old, result["unit"])})'
+            if status:
+                line += f'\t{status.upper()}'
+            sys.stdout.write(line + '\n')
+    if any(status == 'regression' for _, status in changes.values()):
+        sys.exit(1)
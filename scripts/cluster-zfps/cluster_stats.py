@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+"""
+This script computes inter-ZNF distance distributions, cluster-size histograms and percentile-based
+clustering thresholds for many species at once, and writes them to a compact cross-species table.
+All species are concatenated into a single set of sorted midpoint arrays so that statistics are
+computed in one vectorized pass rather than one BED file at a time.
+"""
+
+
+def read_midpoints(bedfile):
+    """Read BED file and return chromosome labels and gene midpoints.
+
+    Only BED is supported: start and end are taken from the second and third columns as 0-based,
+    half-open coordinates, so GFF files (1-based, start and end in columns 4 and 5) must be
+    converted first. Midpoints are calculated in the same way as ZFGenome._extract_midpoint.
+    """
+    chroms, midpoints = [], []
+    with open(bedfile) as infile:
+        for line in infile:
+            if line.startswith(('#', 'track', 'browser')) or line == '\n':
+                continue
+            line = line.split('\t')
+            start, stop = int(line[1]), int(line[2])
+            chroms.append(line[0])
+            midpoints.append(start + (stop-start)//2)
+    return np.array(chroms, dtype=str), np.array(midpoints, dtype=np.int64)
+
+
+class ZFMidpoints:
+    """Sorted gene midpoints for many species, stored as flat arrays.
+
+    Attributes:
+        species: list of species names, indexed by species code
+        species_idx: species code of each gene
+        chrom_idx: globally unique chromosome code of each gene
+        midpoints: midpoint coordinate of each gene
+    """
+
+    def __init__(self, species, species_idx, chrom_idx, midpoints):
+        self.species = list(species)
+        order = np.lexsort((midpoints, chrom_idx, species_idx))
+        self.species_idx = np.asarray(species_idx)[order]
+        self.chrom_idx = np.asarray(chrom_idx)[order]
+        self.midpoints = np.asarray(midpoints)[order]
+
+    @classmethod
+    def from_bedfiles(cls, bedfiles, n_jobs=None):
+        """Load midpoints from a dictionary mapping species to ZNF bedfiles."""
+        species = list(bedfiles)
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            parsed = list(pool.map(read_midpoints, [bedfiles[s] for s in species], chunksize=16))
+        species_idx = np.concatenate([np.full(len(m), i) for i, (c, m) in enumerate(parsed)] +
+                                     [np.zeros(0, dtype=int)])
+        # Chromosome names are only unique within a species
+        chrom_keys = np.concatenate([np.char.add(f'{i}:', c) for i, (c, m) in enumerate(parsed)] +
+                                    [np.zeros(0, dtype=str)])
+        chrom_idx = np.unique(chrom_keys, return_inverse=True)[1]
+        midpoints = np.concatenate([m for c, m in parsed] + [np.zeros(0, dtype=np.int64)])
+        return cls(species, species_idx, chrom_idx, midpoints)
+
+    @property
+    def n_species(self):
+        return len(self.species)
+
+    def gene_counts(self):
+        """Number of genes per species."""
+        return np.bincount(self.species_idx, minlength=self.n_species)
+
+    def inter_znf_distances(self):
+        """Distances between adjacent genes on the same chromosome.
+
+        Returns:
+            species_idx: species code of each distance
+            distances: array of inter-gene distances
+        """
+        same_chrom = self.chrom_idx[1:] == self.chrom_idx[:-1]
+        distances = np.diff(self.midpoints)[same_chrom]
+        return self.species_idx[1:][same_chrom], distances
+
+    def distance_percentiles(self, percentiles):
+        """Percentiles of the inter-ZNF distance distribution of each species.
+
+        Returns:
+            array of shape (n_species, len(percentiles)); NaN for species with fewer than two genes
+                on any one chromosome.
+        """
+        species_idx, distances = self.inter_znf_distances()
+        return grouped_percentiles(species_idx, distances, percentiles, self.n_species)
+
+    def thresholds(self, percentile=75, default=118000):
+        """Per-species clustering thresholds taken from the inter-ZNF distance distribution."""
+        thresholds = self.distance_percentiles([percentile])[:, 0]
+        return np.where(np.isnan(thresholds), default, thresholds)
+
+    def cluster_sizes(self, maxdist):
+        """Assign genes to clusters using single-linkage with maximum distance maxdist.
+
+        Equivalent to `bedtools merge -d maxdist` on midpoints, as used by
+        ZFGenome.extract_zf_clusters.
+
+        Arguments:
+            maxdist: scalar, or array of per-species thresholds
+
+        Returns:
+            species_idx: species code of each cluster
+            sizes: number of genes in each cluster
+        """
+        if self.midpoints.size == 0:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        maxdist = np.broadcast_to(np.asarray(maxdist, dtype=float), (self.n_species,))
+        breaks = np.ones(self.midpoints.size, dtype=bool)
+        # Midpoints are one base long, so bedtools merge compares the gap between features
+        gaps = np.diff(self.midpoints) - 1
+        breaks[1:] = (self.chrom_idx[1:] != self.chrom_idx[:-1]) | \
+                     (gaps > maxdist[self.species_idx[1:]])
+        cluster_idx = np.cumsum(breaks) - 1
+        sizes = np.bincount(cluster_idx)
+        return self.species_idx[breaks], sizes
+
+    def cluster_size_histogram(self, maxdist):
+        """Cluster-size histogram of each species.
+
+        Returns:
+            species_idx, sizes, counts: arrays such that species species_idx[i] has counts[i]
+                clusters containing sizes[i] genes.
+        """
+        species_idx, sizes = self.cluster_sizes(maxdist)
+        pairs, counts = np.unique(np.stack([species_idx, sizes]), axis=1, return_counts=True)
+        return pairs[0], pairs[1], counts
+
+    def summary(self, percentiles=(25, 50, 75, 90), threshold_percentile=75, default=118000):
+        """Compute cross-species summary table.
+
+        Returns:
+            columns: list of column names
+            rows: list of rows, one per species
+        """
+        n_genes = self.gene_counts()
+        dist_percentiles = self.distance_percentiles(percentiles)
+        thresholds = self.thresholds(threshold_percentile, default)
+        species_idx, sizes = self.cluster_sizes(thresholds)
+        n_clusters = np.bincount(species_idx, minlength=self.n_species)
+        n_singletons = np.bincount(species_idx[sizes == 1], minlength=self.n_species)
+        max_size = np.zeros(self.n_species, dtype=int)
+        np.maximum.at(max_size, species_idx, sizes)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_size = n_genes/n_clusters
+            frac_clustered = (n_genes - n_singletons)/n_genes
+
+        columns = ['species', 'n_znfs'] + [f'dist_p{q:g}' for q in percentiles] + \
+                  ['threshold', 'n_clusters', 'n_singletons', 'mean_cluster_size',
+                   'max_cluster_size', 'frac_clustered']
+        rows = []
+        for i, species in enumerate(self.species):
+            rows.append([species, n_genes[i]] + list(dist_percentiles[i]) +
+                        [thresholds[i], n_clusters[i], n_singletons[i], mean_size[i],
+                         max_size[i], frac_clustered[i]])
+        return columns, rows
+
+
+def grouped_percentiles(groups, values, percentiles, n_groups):
+    """Linearly interpolated percentiles of values within each group, as per np.percentile."""
+    percentiles = np.asarray(percentiles, dtype=float)
+    result = np.full((n_groups, percentiles.size), np.nan)
+    if values.size == 0:
+        return result
+    order = np.lexsort((values, groups))
+    values = values[order].astype(float)
+    counts = np.bincount(groups, minlength=n_groups)
+    offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    present = counts > 0
+    position = (counts[present, None] - 1)*percentiles[None, :]/100.0
+    lo = np.floor(position).astype(int)
+    hi = np.ceil(position).astype(int)
+    frac = position - lo
+    base = offsets[present, None]
+    result[present] = values[base + lo]*(1 - frac) + values[base + hi]*frac
+    return result
+
+
+def write_summary(columns, rows, outfile):
+    """Write cross-species summary table in tab-separated format."""
+    with open(outfile, 'w') as output:
+        output.write('\t'.join(columns) + '\n')
+        for row in rows:
+            output.write('\t'.join(_format(val) for val in row) + '\n')
+
+
+def write_histogram(zf_midpoints, maxdist, outfile):
+    """Write cluster-size histograms in long format: species, cluster size, count."""
+    species_idx, sizes, counts = zf_midpoints.cluster_size_histogram(maxdist)
+    with open(outfile, 'w') as output:
+        output.write('species\tcluster_size\tcount\n')
+        for i, size, count in zip(species_idx, sizes, counts):
+            output.write(f'{zf_midpoints.species[i]}\t{size}\t{count}\n')
+
+
+def read_summary(infile):
+    """Read summary table into a dictionary mapping species to dictionaries of column values."""
+    summary = {}
+    with open(infile) as input:
+        header = input.readline().strip('\n').split('\t')
+        for line in input:
+            line = line.strip('\n').split('\t')
+            summary[line[0]] = {key: _parse(val) for key, val in zip(header[1:], line[1:])}
+    return summary
+
+
+def _format(val):
+    if isinstance(val, (float, np.floating)):
+        return 'nan' if np.isnan(val) else f'{val:.6g}'
+    return str(val)
+
+
+def _parse(val):
+    try:
+        val = float(val)
+    except ValueError:
+        return val
+    return int(val) if val.is_integer() else val
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Inter-ZNF distance and cluster-size statistics.')
+    parser.add_argument('--species-file', default='../../data/parsed_metazoans.out')
+    parser.add_argument('--bed-dir', default='../../data/beds',
+                        help='directory containing {species}_znfs.bed files')
+    parser.add_argument('--percentiles', type=float, nargs='+', default=[25, 50, 75, 90])
+    parser.add_argument('--threshold-percentile', type=float, default=75,
+                        help='percentile of inter-ZNF distances used as clustering threshold')
+    parser.add_argument('--default-threshold', type=float, default=118000,
+                        help='threshold for species without any inter-ZNF distances')
+    parser.add_argument('--out', default='zf_cluster_stats.tsv')
+    parser.add_argument('--hist', default='zf_cluster_size_hist.tsv')
+    parser.add_argument('-j', '--jobs', type=int, default=None)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    from cluster_zfps import read_species_list
+    args = parse_args()
+    bedfiles = {}
+    for species in read_species_list(args.species_file):
+        bedfile = os.path.join(args.bed_dir, f'{species}_znfs.bed')
+        if not os.path.exists(bedfile):
+            sys.stderr.write(f'WARNING: no bedfile for {species}\n')
+            continue
+        bedfiles[species] = bedfile
+    zf_midpoints = ZFMidpoints.from_bedfiles(bedfiles, n_jobs=args.jobs)
+    columns, rows = zf_midpoints.summary(args.percentiles, args.threshold_percentile,
+                                         args.default_threshold)
+    write_summary(columns, rows, args.out)
+    write_histogram(zf_midpoints,
+                    zf_midpoints.thresholds(args.threshold_percentile, args.default_threshold),
+                    args.hist)
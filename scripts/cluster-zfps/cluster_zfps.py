@@ -1,9 +1,13 @@
 #!/usr/bin/env python3
 
+import os
 import re
+import sys
+import time
+import argparse
 import pybedtools as pb
-from scipy import stats
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 """
 This script extracts ZNF clusters from bed/gff files of gene coordinates and prints to bedfile
@@ -56,6 +60,9 @@ class ZFGenome:
 
         maxdist = int(maxdist)
         margin = int(margin)
+        # Restart cluster numbering so repeated calls (e.g. maxdist sweeps) name clusters identically
+        self._chroms = set()
+        self._clust_idx = 0
         # HACK: redundant 'counts' needed to insure BED intervals have
         merged_bed = self.zf_bed.merge(d=maxdist, 
                                        c=(4, 4, 4, 4), 
@@ -68,27 +75,150 @@ class ZFGenome:
     def __repr__(self):
         return str(self.merged_bed)
 
-if __name__ == '__main__':
-
-    max_inter_znf_dist = 118000 # 75th percentile
-    use_midpoint = True
 
-    with open('../../data/parsed_metazoans.out') as infile:
+def read_species_list(metazoan_file, assembly_types=('Chromosome', 'Scaffold')):
+    """Return species from parsed_metazoans.out with a usable assembly level."""
+    species_list = []
+    with open(metazoan_file) as infile:
         for line in infile:
             species = line.split('\t')[0]
             assembly_type = line.strip().split('\t')[-1]
-            if assembly_type not in ['Chromosome', 'Scaffold']:
+            if assembly_type not in assembly_types:
                 continue
-            try:
-                print(species)
-                zf_genome = ZFGenome(f'/Users/jonwells/Projects/feschottelab/metazoan-znfs/data/beds/{species}_znfs.bed',
-                                     f'/Users/jonwells/Projects/feschottelab/metazoan-znfs/data/genomes/{species}.genome',
-                                     use_midpoint=use_midpoint)
-                zf_genome.extract_zf_clusters(maxdist=max_inter_znf_dist)
-                with open(f'../../data/beds/{species}_zf_clusters.bed', 'w') as outfile:
-                    outfile.write(str(zf_genome))
-            except:
-                print(f'WARNING: issue parsing {species}')
-
+            species_list.append(species)
+    return species_list
+
+
+def cluster_outfile(out_dir, species, maxdist):
+    """Path of cluster BED file for species clustered at maxdist."""
+    return os.path.join(out_dir, f'{species}_zf_clusters_d{int(maxdist)}.bed')
+
+
+def is_up_to_date(outfiles, infiles):
+    """True if every output exists and is newer than every input."""
+    if not all(os.path.exists(f) for f in outfiles):
+        return False
+    newest_input = max(os.path.getmtime(f) for f in infiles)
+    return min(os.path.getmtime(f) for f in outfiles) >= newest_input
+
+
+def process_species(species, bed_dir, genome_dir, out_dir, maxdists, use_midpoint=True,
+                    margin=1e4, force=False):
+    """Extract ZF clusters for one species at one or more values of maxdist.
+
+    The ZNF bedfile is loaded (and midpoints extracted) once, then merged at each maxdist. Any
+    exception is caught and reported in the returned status record, so that a single malformed
+    assembly cannot bring down a whole batch.
+
+    Arguments:
+        species: species name, as used in bed and genome file names
+        bed_dir: directory containing {species}_znfs.bed files
+        genome_dir: directory containing {species}.genome files
+        out_dir: directory to write cluster bedfiles to
+        maxdists: list of maximum inter-gene distances to cluster at
+        use_midpoint: cluster on gene midpoints rather than full gene coordinates
+        margin: size of margins around each cluster
+        force: recompute even if outputs are newer than inputs
+
+    Returns:
+        status: dictionary with species, status ('ok', 'skipped' or 'failed'), n_clusters per
+            maxdist, wall time in seconds and an error message, if any.
+    """
+    start = time.perf_counter()
+    status = {'species': species, 'status': 'ok', 'maxdists': list(maxdists), 'n_clusters': [],
+              'seconds': 0.0, 'message': ''}
+    zf_bedfile = os.path.join(bed_dir, f'{species}_znfs.bed')
+    genomefile = os.path.join(genome_dir, f'{species}.genome')
+    outfiles = [cluster_outfile(out_dir, species, d) for d in maxdists]
+    try:
+        if not force and is_up_to_date(outfiles, [zf_bedfile, genomefile]):
+            status['status'] = 'skipped'
+            return status
+        zf_genome = ZFGenome(zf_bedfile, genomefile, use_midpoint=use_midpoint)
+        for maxdist, outfile in zip(maxdists, outfiles):
+            merged_bed = zf_genome.extract_zf_clusters(maxdist=maxdist, margin=margin)
+            contents = str(merged_bed)
+            with open(outfile, 'w') as output:
+                output.write(contents)
+            status['n_clusters'].append(contents.count('\n'))
+    except Exception as err:
+        status['status'] = 'failed'
+        status['message'] = f'{type(err).__name__}: {err}'.replace('\t', ' ').replace('\n', ' ')
+    finally:
+        status['seconds'] = time.perf_counter() - start
+        pb.cleanup()
+    return status
+
+
+def write_manifest(statuses, manifest):
+    """Write per-species status and timing records as a tab-separated table."""
+    with open(manifest, 'w') as output:
+        output.write('species\tstatus\tmaxdist\tn_clusters\tseconds\tmessage\n')
+        for status in sorted(statuses, key=lambda x: x['species']):
+            n_clusters = ','.join(str(n) for n in status['n_clusters']) or '.'
+            maxdists = ','.join(str(int(d)) for d in status['maxdists'])
+            output.write(f'{status["species"]}\t{status["status"]}\t{maxdists}\t{n_clusters}\t'
+                         f'{status["seconds"]:.3f}\t{status["message"] or "."}\n')
+
+
+def run_batch(species_list, bed_dir, genome_dir, out_dir, maxdists, manifest, use_midpoint=True,
+              margin=1e4, force=False, n_jobs=None):
+    """Extract ZF clusters for many species across a process pool.
+
+    Arguments:
+        maxdists: list of maximum inter-gene distances shared by all species, or dictionary mapping
+            each species to its own list (e.g. thresholds from cluster_stats.py)
+
+    Returns:
+        statuses: list of status dictionaries, as returned by process_species
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    statuses = []
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        futures = [pool.submit(process_species, species, bed_dir, genome_dir, out_dir,
+                               maxdists[species] if isinstance(maxdists, dict) else maxdists,
+                               use_midpoint, margin, force)
+                   for species in species_list]
+        for future in as_completed(futures):
+            status = future.result()
+            statuses.append(status)
+            sys.stderr.write(f'{len(statuses)}/{len(futures)}\t{status["species"]}\t'
+                             f'{status["status"]}\n')
+    write_manifest(statuses, manifest)
+    return statuses
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Extract ZNF clusters for many species.')
+    parser.add_argument('--species-file', default='../../data/parsed_metazoans.out',
+                        help='parsed_metazoans.out table of species and assembly levels')
+    parser.add_argument('--bed-dir', default='../../data/beds',
+                        help='directory containing {species}_znfs.bed files')
+    parser.add_argument('--genome-dir', default='../../data/genomes',
+                        help='directory containing {species}.genome files')
+    parser.add_argument('--out-dir', default='../../data/beds',
+                        help='directory to write {species}_zf_clusters_d{maxdist}.bed files to')
+    parser.add_argument('--maxdist', type=float, nargs='+', default=[118000],
+                        help='one or more maximum inter-ZNF distances (default: 75th percentile)')
+    parser.add_argument('--threshold-table', default=None,
+                        help='per-species thresholds from cluster_stats.py, overrides --maxdist')
+    parser.add_argument('--margin', type=float, default=1e4)
+    parser.add_argument('--no-midpoint', dest='use_midpoint', action='store_false')
+    parser.add_argument('--manifest', default='zf_clusters_manifest.tsv')
+    parser.add_argument('--force', action='store_true', help='ignore up-to-date outputs')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes')
+    return parser.parse_args()
 
 
+if __name__ == '__main__':
+    args = parse_args()
+    species_list = read_species_list(args.species_file)
+    maxdists = args.maxdist
+    if args.threshold_table:
+        from cluster_stats import read_summary
+        summary = read_summary(args.threshold_table)
+        species_list = [species for species in species_list if species in summary]
+        maxdists = {species: [summary[species]['threshold']] for species in species_list}
+    run_batch(species_list, args.bed_dir, args.genome_dir, args.out_dir, maxdists,
+              args.manifest, use_midpoint=args.use_midpoint, margin=args.margin, force=args.force,
+              n_jobs=args.jobs)
@@ -1,25 +1,179 @@
 #!/usr/bin/env python3
 
+import os
+import sys
+import json
+import hashlib
+import threading
+import argparse
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+This script downloads Dfam TE libraries (FASTA format) for a set of species. Results are paged
+through and written to disk as they arrive, species are fetched concurrently over a bounded pool of
+connections, and every page is stored in an on-disk cache keyed by the hash of its query, so that
+re-running the script does not re-download anything.
+"""
 
 species_dict = {
     'Limnephilus_lunatus': '1218281', # Cinnamon sedge
     'Ctenocephalides_felis': '7515', # Cat flea
     'Rana_temporaria': '8407', # Common frog
     'Scyliorhinus_canicula': '7830', # Small-spotted catshark
-    'Archivesica_marissinica': '2291877' # Cold seep clam 
+    'Archivesica_marissinica': '2291877' # Cold seep clam
     }
 
-url = 'https://dfam.org/api/families'
-for species, taxid in species_dict.items():
-    params = {
-        'clade': taxid,
-        'format': 'fasta',
-        'clade_relatives': 'both',
-        'include_raw': 'true'
-    }
-    response = requests.get(url, params=params)
-    results = response.json()['body']
-    with open(f'{species}_dfam_library.fa', 'w') as outfile:
-        for record in results:
-            outfile.write(record)
+DFAM_URL = 'https://dfam.org/api/families'
+
+
+class DfamFetcher:
+    """Paged, cached and concurrent client for the Dfam families API."""
+
+    def __init__(self, url=DFAM_URL, cache_dir='dfam_cache', page_size=1000, max_workers=4,
+                 retries=3, timeout=120):
+        """DfamFetcher constructor
+
+        Args:
+            url: Dfam families endpoint
+            cache_dir: directory in which raw API responses are cached
+            page_size: number of families requested per page
+            max_workers: maximum number of concurrent requests (and pooled connections)
+            retries: number of retries for failed connections and 429/5xx responses
+            timeout: request timeout in seconds
+        """
+        self.url = url
+        self.cache_dir = cache_dir
+        self.page_size = page_size
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.n_requests = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+        retry = Retry(total=retries, backoff_factor=1.0, status_forcelist=(429, 500, 502, 503, 504))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def query_params(self, taxid, start=0, **query):
+        """Query parameters for one page of a species' library."""
+        params = {
+            'clade': taxid,
+            'format': 'fasta',
+            'clade_relatives': 'both',
+            'include_raw': 'true',
+            'start': start,
+            'limit': self.page_size
+        }
+        params.update(query)
+        return params
+
+    def cache_path(self, params):
+        """Location of cached response, addressed by the hash of URL and query parameters."""
+        key = json.dumps([self.url, sorted((k, str(v)) for k, v in params.items())])
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f'{digest}.json')
+
+    def get_page(self, params):
+        """Return decoded JSON response for query, downloading it only if not already cached.
+
+        Responses are streamed to a temporary file, which only replaces the cache entry once
+        complete.
+        """
+        path = self.cache_path(params)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.{id(params)}.tmp'
+            try:
+                with self.session.get(self.url, params=params, stream=True,
+                                      timeout=self.timeout) as response:
+                    with self._lock:
+                        self.n_requests += 1
+                    response.raise_for_status()
+                    with open(tmp_path, 'wb') as output:
+                        for chunk in response.iter_content(chunk_size=1 << 16):
+                            output.write(chunk)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            os.replace(tmp_path, path)
+        with open(path) as input:
+            return json.load(input)
+
+    def fetch_species(self, taxid, outfile, **query):
+        """Download all families for taxid and write them to outfile in FASTA format.
+
+        Returns:
+            n_records: number of FASTA records written
+        """
+        n_records = 0
+        start = 0
+        tmp_outfile = f'{outfile}.tmp'
+        try:
+            with open(tmp_outfile, 'w') as output:
+                while True:
+                    page = self.get_page(self.query_params(taxid, start, **query))
+                    body = page['body']
+                    # Body is a single FASTA string, but older API versions returned a list
+                    records = body if isinstance(body, str) else ''.join(body)
+                    output.write(records)
+                    n_page = records.count('>')
+                    n_records += n_page
+                    start += self.page_size
+                    # total_count is not reliable, so page until a page comes back short
+                    if n_page < self.page_size:
+                        break
+        except Exception:
+            os.remove(tmp_outfile)
+            raise
+        os.replace(tmp_outfile, outfile)
+        return n_records
+
+    def fetch_all(self, species_taxids, out_dir='.', **query):
+        """Concurrently download libraries for every species in dictionary of species to taxids.
+
+        A failure for one species does not stop the others.
+
+        Returns:
+            results: dictionary mapping species to number of records written, or to the exception
+                raised while fetching it.
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {species: pool.submit(self.fetch_species, taxid,
+                                            os.path.join(out_dir, f'{species}_dfam_library.fa'),
+                                            **query)
+                       for species, taxid in species_taxids.items()}
+            for species, future in futures.items():
+                try:
+                    results[species] = future.result()
+                except Exception as err:
+                    results[species] = err
+        return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Download Dfam TE libraries for species.')
+    parser.add_argument('--url', default=DFAM_URL)
+    parser.add_argument('--out-dir', default='.')
+    parser.add_argument('--cache-dir', default='dfam_cache')
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('-j', '--jobs', type=int, default=4,
+                        help='maximum number of concurrent requests')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    fetcher = DfamFetcher(args.url, args.cache_dir, args.page_size, args.jobs)
+    for species, result in fetcher.fetch_all(species_dict, args.out_dir).items():
+        if isinstance(result, Exception):
+            sys.stderr.write(f'WARNING: issue fetching {species}: {result}\n')
+        else:
+            sys.stderr.write(f'{species}\t{result} families\n')
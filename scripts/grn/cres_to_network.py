@@ -46,45 +46,49 @@ def parse_kzfp_targets(qthresh):
                 kzfp_to_te[kzfp].add(te)
     return kzfp_to_te
 
-def parse_tf_te_fimo(fimofile, qthresh):
-    tf_to_target = {}
+def read_fimo_records(fimofile):
+    """Yield (motif, sequence, qvalue) records from FIMO TSV file.
+
+    Motifs are named by their alt ID (e.g. TF name), or by motif ID if they have none, as in
+    scan_motifs.Hit.record().
+    """
     with open(fimofile) as input:
         header = input.readline()
         for line in input:
             if line == '\n':
                 break
-            line = line.strip().split('\t')
-            tf = line[1]
-            target = line[2]
-            qvalue = float(line[8])
-            if qvalue > qthresh:
-                continue
-            if tf not in tf_to_target:
-                tf_to_target[tf] = set()
-            tf_to_target[tf].add(target)
-        return tf_to_target
+            line = line.rstrip('\n').split('\t')
+            yield line[1] or line[0], line[2], float(line[8])
+
+def _fimo_records(fimo):
+    """Accept either path to FIMO TSV file or iterable of records, e.g. from scan_motifs.py."""
+    if isinstance(fimo, str):
+        return read_fimo_records(fimo)
+    return fimo
+
+def parse_tf_te_fimo(fimofile, qthresh):
+    tf_to_target = {}
+    for tf, target, qvalue in _fimo_records(fimofile):
+        if qvalue > qthresh:
+            continue
+        if tf not in tf_to_target:
+            tf_to_target[tf] = set()
+        tf_to_target[tf].add(target)
+    return tf_to_target
 
 def parse_tf_kzfp_fimo(fimofile, qthresh):
     tf_to_target = {}
     zfp_pattern = re.compile(r'[\w-]+;PLS;(.+)?;')
-    with open(fimofile) as input:
-        header = input.readline()
-        for line in input:
-            if line == '\n':
-                break
-            line = line.strip().split('\t')
-            tf = line[1]
-            target = line[2]
-            qvalue = float(line[8])
-            if qvalue > qthresh:
-                continue
-            kzfphit = re.match(zfp_pattern, target)
-            if kzfphit:
-                target = kzfphit.group(1)
-            if tf not in tf_to_target:
-                tf_to_target[tf] = set()
-            tf_to_target[tf].add(target)
-        return tf_to_target
+    for tf, target, qvalue in _fimo_records(fimofile):
+        if qvalue > qthresh:
+            continue
+        kzfphit = re.match(zfp_pattern, target)
+        if kzfphit:
+            target = kzfphit.group(1)
+        if tf not in tf_to_target:
+            tf_to_target[tf] = set()
+        tf_to_target[tf].add(target)
+    return tf_to_target
 
 def write_edges(znf_to_te, outfile):
     """Convert znf_to_te dictionary into tab-separated list of KZFP-TE pairs."""
@@ -30,12 +30,6 @@ rg --ignore-case -f mincount_names.txt motif_dict.txt |
     > meme_names.txt
 cat $(cat meme_names.txt) > ../../data/cis-reg/ipsc_motifs.meme
 
-# Get genome background for motif scanning
-/usr/local/meme-5.3.3/meme/libexec/meme-5.3.3/fasta-get-markov \
-    -dna \
-    ~/Genomes/Mammalia/Hominoidea/GCF_009914755.1/GCF_009914755.1_T2T-CHM13v2.0_genomic.fna \
-    genome_background.bg
-
 # Extract TEs targeted by at least one KZFP and combine with KZFP candidate promoters
 if [ -f te_fimo_sequences.txt ]; then
     rm te_fimo_sequences.txt
@@ -52,19 +46,9 @@ seqkit grep -f te_fimo_sequences.txt  ../../data/genome/ucsc_hg38_reps.fa > te_f
 
 cat ../../data/cis-reg/kzfp_candidate_promoters.fa > kzfp_fimo_sequences.fa
 
-# Run FIMO to identify expressed iPSC TF motifs against TE and KZFP sequences
-fimo \
-    -oc ../../data/cis-reg/te-fimo \
-    -bfile genome_background.bg \
-    ../../data/cis-reg/ipsc_motifs.meme \
-    te_fimo_sequences.fa
-fimo \
-    -oc ../../data/cis-reg/kzfp-fimo \
-    -bfile genome_background.bg \
-    ../../data/cis-reg/ipsc_motifs.meme \
-    kzfp_fimo_sequences.fa
+# FIMO scans of expressed iPSC TF motifs against TE and KZFP sequences (te_fimo and kzfp_fimo),
+# using the shared genome background, are run as separate stages by pipeline.py.
 
-# rm genome_background.bg
 # rm te_fimo_sequences.{fa,txt}
 # rm kzfp_fimo_sequences.{fa,txt}
 # rm motif_dict.txt search_names.txt mincount_names.txt omit_kzfps.txt meme_names.txt
@@ -12,11 +12,8 @@ bedtools getfasta \
     -bed ../../data/cis-reg/cCRE-bed/kzfp_TRIM28_regions.bed \
     -name > ../../data/cis-reg/kzfp_TRIM28_regions.fa
 
-# Extract background letter freqs for meme
-/usr/local/meme-5.3.3/meme/libexec/meme-5.3.3/fasta-get-markov \
-    -dna \
-    ~/Genomes/Mammalia/Hominoidea/GCF_009914755.1/GCF_009914755.1_T2T-CHM13v2.0_genomic.fna \
-    genome_background.bg
+# Background letter freqs (genome_background.bg) are generated by the 'background' stage of
+# pipeline.py.
 
 # Clear pre-exisiting motif file
 if [ -f ../../data/cis-reg/kzfp_motifs.meme ]; then
@@ -34,18 +31,7 @@ while read -r line; do
         sed "s/MOTIF 1/MOTIF $kzfp/" >> ../../data/cis-reg/kzfp_motifs.meme
 done < <(./parse_cisbp.py)
 
-# # Run FIMO to identify KZFPs targeting KZFP-TRIM28 peaks
-fimo \
-    -oc ../../data/cis-reg/kzfp-trim28-fimo \
-    -bfile genome_background.bg \
-    ../../data/cis-reg/kzfp_motifs.meme \
-    ../../data/cis-reg/kzfp_TRIM28_regions.fa
-
-fimo \
-    -oc ../../data/cis-reg/kzfp-trim28-noTE-fimo \
-    -bfile genome_background.bg \
-    ../../data/cis-reg/kzfp_motifs.meme \
-    ../../data/cis-reg/kzfp_TRIM28_regions_noTE.fa
+# FIMO scans of KZFP motifs against KZFP-TRIM28 peaks (kzfp_trim28_fimo and
+# kzfp_trim28_noTE_fimo) are run as separate stages by pipeline.py.
 
 rm tmp.pwm
-rm genome_background.bg
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+"""
+Incremental runner for the KZFP-TE network pipeline, replacing the unconditional `runall.sh`.
+
+Each stage declares the files it reads and writes. A stage is skipped when the content hashes of its
+inputs (and its command) match those recorded the last time it ran successfully and all of its
+outputs still exist. Stages whose dependencies are satisfied run concurrently, and the wall time of
+every stage is recorded.
+"""
+
+STATE_FILE = '.pipeline_state.json'
+
+
+class Stage:
+    """Single step of the pipeline."""
+
+    def __init__(self, name, command, inputs=(), outputs=(), after=()):
+        """Stage constructor
+
+        Args:
+            name: unique name of stage
+            command: shell command string, or list of arguments to execute without a shell
+            inputs: files or directories read by the stage
+            outputs: files written by the stage
+            after: names of stages that must complete first, in addition to those producing inputs
+        """
+        self.name = name
+        self.command = command
+        self.inputs = [os.path.expanduser(path) for path in inputs]
+        self.outputs = [os.path.expanduser(path) for path in outputs]
+        self.after = list(after)
+
+    def __repr__(self):
+        return f'Stage({self.name})'
+
+
+class Pipeline:
+    """Runs stages in dependency order, skipping those whose inputs are unchanged."""
+
+    def __init__(self, stages, workdir='.', state_file=STATE_FILE, max_workers=None, log=sys.stderr):
+        """Pipeline constructor
+
+        Args:
+            stages: list of Stage instances
+            workdir: directory in which commands are run and relative paths are resolved
+            state_file: JSON file recording input hashes and timings of completed stages
+            max_workers: maximum number of stages to run concurrently
+            log: stream to write progress to, or None
+        """
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError('Stage names must be unique')
+        self.workdir = workdir
+        self.state_file = os.path.join(workdir, state_file)
+        self.max_workers = max_workers
+        self.log = log
+        self.dependencies = self._resolve_dependencies()
+        self._lock = threading.Lock()
+        self.state = self._load_state()
+
+    def _resolve_dependencies(self):
+        """Map each stage to the set of stages that produce its inputs or are listed in after."""
+        producers = {}
+        for stage in self.stages.values():
+            for output in stage.outputs:
+                producers[os.path.normpath(output)] = stage.name
+        dependencies = {}
+        for stage in self.stages.values():
+            deps = set(stage.after)
+            for path in stage.inputs:
+                path = os.path.normpath(path)
+                for output, producer in producers.items():
+                    # Directory inputs depend on any stage writing inside them
+                    if output == path or output.startswith(path + os.sep):
+                        deps.add(producer)
+            deps.discard(stage.name)
+            unknown = deps - set(self.stages)
+            if unknown:
+                raise ValueError(f'{stage.name} depends on unknown stages {sorted(unknown)}')
+            dependencies[stage.name] = deps
+        self._check_acyclic(dependencies)
+        return dependencies
+
+    def _check_acyclic(self, dependencies):
+        visited, visiting = set(), set()
+
+        def visit(name):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f'Dependency cycle involving {name}')
+            visiting.add(name)
+            for dep in dependencies[name]:
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in dependencies:
+            visit(name)
+
+    def _load_state(self):
+        if not os.path.exists(self.state_file):
+            return {'stages': {}, 'files': {}}
+        with open(self.state_file) as input:
+            return json.load(input)
+
+    def _save_state(self):
+        tmp_file = f'{self.state_file}.tmp'
+        with open(tmp_file, 'w') as output:
+            json.dump(self.state, output, indent=1, sort_keys=True)
+        os.replace(tmp_file, self.state_file)
+
+    def _path(self, path):
+        return os.path.join(self.workdir, path)
+
+    def file_hash(self, path):
+        """SHA-256 of file contents.
+
+        Hashes are memoised against file size and modification time, so large unchanged inputs
+        (e.g. genomes) are only read once.
+        """
+        stat = os.stat(self._path(path))
+        signature = [stat.st_size, stat.st_mtime_ns]
+        with self._lock:
+            memo = self.state['files'].get(path)
+        if memo and memo[0] == signature:
+            return memo[1]
+        digest = hashlib.sha256()
+        with open(self._path(path), 'rb') as input:
+            for chunk in iter(lambda: input.read(1 << 20), b''):
+                digest.update(chunk)
+        digest = digest.hexdigest()
+        with self._lock:
+            self.state['files'][path] = [signature, digest]
+        return digest
+
+    def input_hash(self, stage):
+        """Combined hash of a stage's command and the contents of all of its inputs."""
+        digest = hashlib.sha256(json.dumps(stage.command).encode())
+        for path in stage.inputs:
+            if os.path.isdir(self._path(path)):
+                files = sorted(os.path.join(path, os.path.relpath(os.path.join(root, f),
+                                                                  self._path(path)))
+                               for root, _, filenames in os.walk(self._path(path))
+                               for f in filenames)
+            else:
+                files = [path]
+            for f in files:
+                digest.update(f'{f}\t{self.file_hash(f)}\n'.encode())
+        return digest.hexdigest()
+
+    def is_up_to_date(self, stage, input_hash):
+        record = self.state['stages'].get(stage.name)
+        if record is None or record['hash'] != input_hash:
+            return False
+        return all(os.path.exists(self._path(output)) for output in stage.outputs)
+
+    def run_stage(self, stage, force=False):
+        """Run a single stage if its inputs have changed.
+
+        Returns:
+            record: dictionary with stage name, status ('ran', 'skipped' or 'failed'), wall time
+                in seconds and error message.
+        """
+        start = time.perf_counter()
+        record = {'stage': stage.name, 'status': 'ran', 'seconds': 0.0, 'message': ''}
+        try:
+            input_hash = self.input_hash(stage)
+            if not force and self.is_up_to_date(stage, input_hash):
+                record['status'] = 'skipped'
+            else:
+                for output in stage.outputs:
+                    os.makedirs(os.path.dirname(self._path(output)) or '.', exist_ok=True)
+                subprocess.run(stage.command, shell=isinstance(stage.command, str),
+                               cwd=self.workdir, check=True)
+                missing = [output for output in stage.outputs
+                           if not os.path.exists(self._path(output))]
+                if missing:
+                    raise FileNotFoundError(f'{stage.name} did not produce {missing}')
+        except Exception as err:
+            record['status'] = 'failed'
+            record['message'] = f'{type(err).__name__}: {err}'
+        record['seconds'] = time.perf_counter() - start
+        if record['status'] == 'ran':
+            with self._lock:
+                self.state['stages'][stage.name] = {'hash': input_hash,
+                                                    'seconds': record['seconds'],
+                                                    'finished': time.time()}
+                self._save_state()
+        return record
+
+    def run(self, stages=None, force=False):
+        """Run pipeline, or the named stages and everything they depend on.
+
+        Returns:
+            records: list of stage records (see run_stage), in order of completion. Stages that
+                could not run because a dependency failed have status 'blocked'.
+        """
+        selected = self._with_dependencies(stages or list(self.stages))
+        pending = {name: set(self.dependencies[name]) & selected for name in selected}
+        records, failed = [], set()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            running = {}
+            while pending or running:
+                for name in [n for n, deps in pending.items() if deps & failed]:
+                    del pending[name]
+                    failed.add(name)
+                    records.append({'stage': name, 'status': 'blocked', 'seconds': 0.0,
+                                    'message': 'upstream stage failed'})
+                for name in [n for n, deps in pending.items() if not deps]:
+                    del pending[name]
+                    self._write_log(f'starting {name}')
+                    running[pool.submit(self.run_stage, self.stages[name], force)] = name
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    record = future.result()
+                    records.append(record)
+                    self._write_log(f'{name}\t{record["status"]}\t{record["seconds"]:.2f}s\t'
+                                    f'{record["message"]}')
+                    if record['status'] == 'failed':
+                        failed.add(name)
+                        continue
+                    for deps in pending.values():
+                        deps.discard(name)
+        with self._lock:
+            self._save_state()
+        return records
+
+    def _with_dependencies(self, names):
+        selected = set()
+        stack = list(names)
+        while stack:
+            name = stack.pop()
+            if name not in self.stages:
+                raise KeyError(f'Unknown stage {name}')
+            if name not in selected:
+                selected.add(name)
+                stack.extend(self.dependencies[name])
+        return selected
+
+    def _write_log(self, message):
+        if self.log is not None:
+            self.log.write(message.rstrip() + '\n')
+
+
+def fimo_stage(name, outdir, motifs, sequences, scanner='fimo'):
+    """Stage scanning motifs against a set of sequences using the shared genome background.
+
+    Args:
+        scanner: 'fimo' to run MEME suite FIMO, or 'python' to use the in-process scan_motifs.py,
+            which writes the same fimo.tsv output
+    """
+    if scanner == 'fimo':
+        command, inputs = 'fimo', []
+    elif scanner == 'python':
+        command, inputs = './scan_motifs.py', ['scan_motifs.py']
+    else:
+        raise ValueError(f'Unknown motif scanner {scanner}')
+    return Stage(name,
+                 f'{command} -oc {outdir} -bfile genome_background.bg {motifs} {sequences}',
+                 inputs=inputs + ['genome_background.bg', motifs, sequences],
+                 outputs=[f'{outdir}/fimo.tsv'])
+
+
+def grn_stages(scanner='fimo'):
+    """Stages of the KZFP-TE network pipeline, relative to scripts/grn."""
+    data = '../../data'
+    genome = '~/Genomes/Mammalia/Hominoidea/GCF_009914755.1'
+    return [
+        Stage('background',
+              '/usr/local/meme-5.3.3/meme/libexec/meme-5.3.3/fasta-get-markov -dna '
+              f'{genome}/GCF_009914755.1_T2T-CHM13v2.0_genomic.fna genome_background.bg',
+              inputs=[f'{genome}/GCF_009914755.1_T2T-CHM13v2.0_genomic.fna'],
+              outputs=['genome_background.bg']),
+        Stage('te_cres', './extract_te_cres.sh',
+              inputs=['extract_te_cres.sh',
+                      f'{data}/gffs/kzfp_transcripts_only.gff',
+                      f'{data}/cis-reg/cCRE-bed/ENCFF653NZY_T2T_ncbi.bed',
+                      f'{data}/cis-reg/cCRE-bed/GSM2067350_KAP1_exo_H1_peaks_ncbi_T2T.bed',
+                      f'{data}/genome/GCF_009914755.1.genome',
+                      f'{genome}/GCF_009914755.1_T2T-CHM13v2.0_rm.bed'],
+              outputs=[f'{data}/gffs/kzfp_transcripts_tss.gff',
+                       f'{data}/cis-reg/cCRE-bed/kzfp_candidate_promoters.bed',
+                       f'{data}/cis-reg/cCRE-bed/kzfp_candidate_proximal_enhancers.bed',
+                       f'{data}/cis-reg/cCRE-bed/kzfp_TRIM28_regions.bed']),
+        Stage('putative_tfs', './extract_putative_tfs.sh',
+              inputs=['extract_putative_tfs.sh',
+                      f'{data}/cis-reg/JASPAR2022_CORE_non-redundant_pfms_meme',
+                      f'{data}/cis-reg/ipsc-expression/TEcount-out/ERR947017.cntTable',
+                      f'{data}/cis-reg/kzfp_list.txt',
+                      f'{data}/cis-reg/enrich_kzfp_perSubfam',
+                      f'{data}/genome/ucsc_hg38_reps.fa',
+                      f'{data}/cis-reg/kzfp_candidate_promoters.fa'],
+              outputs=[f'{data}/cis-reg/ipsc_motifs.meme',
+                       'te_fimo_sequences.fa',
+                       'kzfp_fimo_sequences.fa']),
+        fimo_stage('te_fimo', f'{data}/cis-reg/te-fimo',
+                   f'{data}/cis-reg/ipsc_motifs.meme', 'te_fimo_sequences.fa', scanner),
+        fimo_stage('kzfp_fimo', f'{data}/cis-reg/kzfp-fimo',
+                   f'{data}/cis-reg/ipsc_motifs.meme', 'kzfp_fimo_sequences.fa', scanner),
+        Stage('zfp_targets', './extract_zfp_targets.sh',
+              inputs=['extract_zfp_targets.sh', 'parse_cisbp.py', 'genome_background.bg',
+                      f'{data}/cis-reg/cCRE-bed/kzfp_TRIM28_regions.bed',
+                      f'{data}/cis-reg/CisBP_Homo_sapiens_2023_12_08_10_56_am',
+                      f'{data}/cis-reg/kzfp_list.txt',
+                      f'{genome}/GCF_009914755.1_T2T-CHM13v2.0_genomic.fna'],
+              outputs=[f'{data}/cis-reg/kzfp_TRIM28_regions.fa',
+                       f'{data}/cis-reg/kzfp_motifs.meme']),
+        fimo_stage('kzfp_trim28_fimo', f'{data}/cis-reg/kzfp-trim28-fimo',
+                   f'{data}/cis-reg/kzfp_motifs.meme', f'{data}/cis-reg/kzfp_TRIM28_regions.fa',
+                   scanner),
+        fimo_stage('kzfp_trim28_noTE_fimo', f'{data}/cis-reg/kzfp-trim28-noTE-fimo',
+                   f'{data}/cis-reg/kzfp_motifs.meme',
+                   f'{data}/cis-reg/kzfp_TRIM28_regions_noTE.fa', scanner),
+        Stage('network', './cres_to_network.py',
+              inputs=['cres_to_network.py',
+                      f'{data}/cis-reg/te-fimo/fimo.tsv',
+                      f'{data}/cis-reg/kzfp-fimo/fimo.tsv',
+                      f'{data}/cis-reg/enrich_kzfp_perSubfam',
+                      f'{data}/cis-reg/cCRE-bed/kzfp_TRIM28_regions.bed'],
+              outputs=[f'{data}/cis-reg/final_edge_list.txt']),
+    ]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run KZFP-TE network pipeline incrementally.')
+    parser.add_argument('stages', nargs='*', help='stages to run (default: all)')
+    parser.add_argument('--force', action='store_true', help='rerun stages even if up to date')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='maximum number of concurrent stages')
+    parser.add_argument('--scanner', choices=('fimo', 'python'), default='fimo',
+                        help='motif scanner used by FIMO stages')
+    parser.add_argument('--list', action='store_true', help='list stages and exit')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    pipeline = Pipeline(grn_stages(args.scanner), workdir=os.path.dirname(os.path.abspath(__file__)),
+                        max_workers=args.jobs)
+    if args.list:
+        for name, deps in pipeline.dependencies.items():
+            sys.stdout.write(f'{name}\t{",".join(sorted(deps)) or "."}\n')
+        sys.exit(0)
+    records = pipeline.run(args.stages, force=args.force)
+    sys.exit(int(any(record['status'] in ('failed', 'blocked') for record in records)))
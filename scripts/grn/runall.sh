@@ -1,6 +1,4 @@
 #!/usr/bin/env bash
 
-./extract_te_cres.sh
-./extract_putative_tfs.sh
-./extract_zfp_targets.sh
-./cres_to_network.py
+# Stages are only rerun when their inputs change; see pipeline.py for details.
+./pipeline.py "$@"
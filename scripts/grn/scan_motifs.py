@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import argparse
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+"""
+In-process alternative to FIMO for scanning position weight matrices against DNA sequences.
+
+Sequences are encoded as integer letter codes, and every motif (and its reverse complement) is
+scored against all windows at once: for each motif column, the scores of the letters at that offset
+are gathered from a small lookup table and summed over columns, i.e. a log-odds convolution.
+Log-odds are taken relative to a Markov background model as produced by `fasta-get-markov`. Scores
+are computed on an integer grid, so that p-values can be read off the exact distribution of window
+scores under the background, obtained by dynamic programming. q-values are Benjamini-Hochberg
+adjusted p-values over all windows tested. Output is written in FIMO's TSV layout so that it can be
+consumed directly by cres_to_network.py.
+"""
+
+ALPHABET = 'ACGT'
+FIMO_COLUMNS = ['motif_id', 'motif_alt_id', 'sequence_name', 'start', 'stop', 'strand', 'score',
+                'p-value', 'q-value', 'matched_sequence']
+
+# Lookup table from ASCII to sequence codes, with anything other than ACGT coded as 4
+_CODES = np.full(256, 4, dtype=np.int8)
+for _i, _letter in enumerate(ALPHABET):
+    _CODES[ord(_letter)] = _i
+    _CODES[ord(_letter.lower())] = _i
+
+_COMPLEMENT = str.maketrans('ACGTacgt', 'TGCAtgca')
+
+
+class Motif:
+    """Position probability matrix of a single motif."""
+
+    def __init__(self, motif_id, probs, alt_id=''):
+        """Motif constructor
+
+        Args:
+            motif_id: motif identifier
+            probs: array of shape (width, 4) of letter probabilities in ACGT order
+            alt_id: alternative name, e.g. name of TF
+        """
+        self.motif_id = motif_id
+        self.alt_id = alt_id
+        probs = np.asarray(probs, dtype=float)
+        self.probs = probs/probs.sum(axis=1, keepdims=True)
+
+    @property
+    def width(self):
+        return self.probs.shape[0]
+
+    def reverse_complement(self):
+        return Motif(self.motif_id, self.probs[::-1, ::-1], self.alt_id)
+
+    def __repr__(self):
+        return f'Motif({self.motif_id}, {self.alt_id}, w={self.width})'
+
+
+class Background:
+    """Markov background model of DNA sequence."""
+
+    def __init__(self, freqs):
+        """Background constructor
+
+        Args:
+            freqs: dictionary mapping k-mers to their frequencies, for k = 1 to order + 1, as in
+                the files produced by fasta-get-markov.
+        """
+        self.order = max(len(kmer) for kmer in freqs) - 1
+        self.joint = []
+        self.log_cond = []
+        for k in range(1, self.order + 2):
+            joint = np.array([freqs.get(''.join(kmer), 0.0)
+                              for kmer in itertools.product(ALPHABET, repeat=k)], dtype=float)
+            joint = np.maximum(joint, 1e-12)
+            joint /= joint.sum()
+            # Conditional probability of last letter given preceding k-1 letters
+            cond = joint.reshape(-1, 4)
+            cond = cond/cond.sum(axis=1, keepdims=True)
+            self.joint.append(joint)
+            self.log_cond.append(np.log2(cond))
+
+    @classmethod
+    def uniform(cls):
+        return cls({letter: 0.25 for letter in ALPHABET})
+
+    @classmethod
+    def from_file(cls, bfile):
+        """Read background file in MEME (fasta-get-markov) format."""
+        freqs = {}
+        with open(bfile) as input:
+            for line in input:
+                if line.startswith('#') or not line.strip():
+                    continue
+                kmer, freq = line.split()[:2]
+                freqs[kmer.upper()] = float(freq)
+        return cls(freqs)
+
+    @property
+    def letter_freqs(self):
+        return self.joint[0]
+
+    def log_probs(self, codes):
+        """Log2 probability of each position of a coded sequence given its preceding context.
+
+        Positions with fewer than `order` preceding letters use the highest available order.
+        Positions that are, or follow, an ambiguous letter within the context are given the order-0
+        probability, and ambiguous positions themselves are given zero.
+        """
+        valid = codes < 4
+        safe = np.where(valid, codes, 0).astype(np.int64)
+        result = self.log_cond[0][0][safe]
+        context = np.zeros(codes.size, dtype=np.int64)
+        context_valid = np.ones(codes.size, dtype=bool)
+        for k in range(1, self.order + 1):
+            # Extend context of each position by the letter k positions upstream
+            prev = np.zeros(codes.size, dtype=np.int64)
+            prev_valid = np.zeros(codes.size, dtype=bool)
+            prev[k:] = safe[:-k]
+            prev_valid[k:] = valid[:-k]
+            context = context + prev*4**(k-1)
+            context_valid &= prev_valid
+            result = np.where(context_valid, self.log_cond[k][context, safe], result)
+        return np.where(valid, result, 0.0)
+
+
+class ScoreTable:
+    """Integer log-odds scores of a motif, and their exact null distribution."""
+
+    def __init__(self, motif, background, scale=100, pseudocount=0.1):
+        """ScoreTable constructor
+
+        Args:
+            motif: Motif instance
+            background: Background instance
+            scale: number of integer score units per bit
+            pseudocount: weight of background letter frequencies mixed into motif probabilities
+        """
+        self.motif = motif
+        self.scale = scale
+        probs = (motif.probs + pseudocount*background.letter_freqs)/(1.0 + pseudocount)
+        self.motif_scores = np.rint(scale*np.log2(probs)).astype(np.int64)
+        self.bg_scores = [np.rint(scale*lc).astype(np.int64) for lc in background.log_cond]
+        self.offset, self.tail = self._null_distribution(background)
+
+    def _null_distribution(self, background):
+        """Upper tail probabilities of window scores under the background, by dynamic programming.
+
+        The state is the current background context (last `order` letters) together with the
+        score so far. The initial context is drawn from the background k-mer frequencies.
+        """
+        order = background.order
+        n_ctx = 4**order
+        bg_scores = self.bg_scores[order].reshape(n_ctx, 4)
+        cond = np.exp2(background.log_cond[order]).reshape(n_ctx, 4)
+        contributions = self.motif_scores[:, None, :] - bg_scores[None, :, :]
+        lo = int(contributions.min(axis=(1, 2)).sum())
+        hi = int(contributions.max(axis=(1, 2)).sum())
+        size = hi - lo + 1
+
+        dist = np.zeros((n_ctx, size))
+        dist[:, -lo] = background.joint[order - 1] if order > 0 else 1.0
+        for column in contributions:
+            new = np.zeros_like(dist)
+            for ctx in range(n_ctx):
+                for letter in range(4):
+                    shift = column[ctx, letter]
+                    next_ctx = (ctx*4 + letter) % n_ctx
+                    if shift >= 0:
+                        new[next_ctx, shift:] += cond[ctx, letter]*dist[ctx, :size-shift]
+                    else:
+                        new[next_ctx, :shift] += cond[ctx, letter]*dist[ctx, -shift:]
+            dist = new
+        pmf = dist.sum(axis=0)
+        tail = np.cumsum(pmf[::-1])[::-1]
+        return lo, np.minimum(tail, 1.0)
+
+    def pvalues(self, scores):
+        """P(S >= score) for integer window scores."""
+        idx = np.clip(scores - self.offset, 0, self.tail.size - 1)
+        return np.where(scores - self.offset >= self.tail.size, 0.0, self.tail[idx])
+
+
+class Hit:
+    """Motif match, as reported in a FIMO TSV file."""
+
+    def __init__(self, motif, sequence_name, start, stop, strand, score, pvalue, qvalue, matched):
+        self.motif = motif
+        self.sequence_name = sequence_name
+        self.start = start
+        self.stop = stop
+        self.strand = strand
+        self.score = score
+        self.pvalue = pvalue
+        self.qvalue = qvalue
+        self.matched = matched
+
+    def record(self):
+        """(motif, sequence, qvalue) record, as consumed by cres_to_network.py."""
+        return self.motif.alt_id or self.motif.motif_id, self.sequence_name, self.qvalue
+
+    def row(self):
+        return [self.motif.motif_id, self.motif.alt_id, self.sequence_name, self.start, self.stop,
+                self.strand, f'{self.score:.4g}', f'{self.pvalue:.3g}', f'{self.qvalue:.3g}',
+                self.matched]
+
+    def __repr__(self):
+        return f'Hit({self.motif.motif_id}, {self.sequence_name}, {self.start}, {self.strand})'
+
+
+def encode(sequence):
+    """Encode DNA string as array of integer codes (A=0, C=1, G=2, T=3, other=4)."""
+    return _CODES[np.frombuffer(sequence.encode('ascii'), dtype=np.uint8)]
+
+
+def reverse_complement(sequence):
+    """Reverse complement of DNA string; letters other than ACGT (either case) are kept as is."""
+    return sequence[::-1].translate(_COMPLEMENT)
+
+
+def read_meme(memefile):
+    """Read motifs from MEME format file."""
+    motifs = []
+    with open(memefile) as input:
+        lines = iter(input)
+        for line in lines:
+            if not line.startswith('MOTIF'):
+                continue
+            fields = line.split()
+            motif_id = fields[1]
+            alt_id = fields[2] if len(fields) > 2 else ''
+            for line in lines:
+                if line.startswith('letter-probability matrix'):
+                    break
+            width = int(line.split('w=')[1].split()[0])
+            rows = [[float(x) for x in next(lines).split()] for _ in range(width)]
+            motifs.append(Motif(motif_id, rows, alt_id))
+    return motifs
+
+
+def read_cisbp_motifs(cisbp_dir, motif_table):
+    """Read CisBP PWMs listed in table of names and motif IDs (output of parse_cisbp.py)."""
+    motifs = []
+    with open(motif_table) as input:
+        for line in input:
+            name, motif_id = line.split()[:2]
+            with open(os.path.join(cisbp_dir, 'pwms_all_motifs', f'{motif_id}.txt')) as pwm:
+                header = pwm.readline()
+                rows = [[float(x) for x in l.split()[1:5]] for l in pwm if l.strip()]
+            motifs.append(Motif(name, rows))
+    return motifs
+
+
+def read_fasta(fastafile):
+    """Yield (name, sequence) tuples from FASTA file."""
+    name, seq = None, []
+    with open(fastafile) as input:
+        for line in input:
+            line = line.strip()
+            if line.startswith('>'):
+                if name is not None:
+                    yield name, ''.join(seq)
+                name, seq = line[1:].split()[0] if len(line) > 1 else '', []
+            elif line:
+                seq.append(line)
+    if name is not None:
+        yield name, ''.join(seq)
+
+
+def score_windows(codes, tables, bg_logp):
+    """Integer scores of every window of a coded sequence against every score table.
+
+    Returns:
+        list of integer score arrays, one per table, of length len(codes) - width + 1, with
+        windows containing ambiguous letters set to the minimum integer.
+    """
+    invalid = np.concatenate([[0], np.cumsum(codes >= 4)])
+    bg_cumsum = np.concatenate([[0], np.cumsum(bg_logp)])
+    codes = codes.astype(np.intp)
+    scores = []
+    for table in tables:
+        width = table.motif.width
+        n_windows = codes.size - width + 1
+        if n_windows <= 0:
+            scores.append(np.zeros(0, dtype=np.int64))
+            continue
+        # Scores indexed by letter code; ambiguous letters (code 4) score zero and are masked below
+        letter_scores = np.zeros((width, 5), dtype=np.int64)
+        letter_scores[:, :4] = table.motif_scores
+        window = np.zeros(n_windows, dtype=np.int64)
+        for j in range(width):
+            window += letter_scores[j, codes[j:j+n_windows]]
+        window -= bg_cumsum[width:] - bg_cumsum[:n_windows]
+        window[invalid[width:] - invalid[:n_windows] > 0] = np.iinfo(np.int64).min
+        scores.append(window)
+    return scores
+
+
+def _scan_chunk(sequences, tables, background, thresh, scale):
+    """Scan a chunk of sequences, returning hits below p-value threshold and number of tests.
+
+    Tables alternate between forward and reverse complement versions of each motif.
+    """
+    hits = []
+    n_tests = 0
+    for name, sequence in sequences:
+        codes = encode(sequence)
+        bg_logp = np.rint(scale*background.log_probs(codes)).astype(np.int64)
+        for t, scores in enumerate(score_windows(codes, tables, bg_logp)):
+            table = tables[t]
+            valid = scores > np.iinfo(np.int64).min
+            n_tests += int(valid.sum())
+            pvalues = np.ones(scores.size)
+            pvalues[valid] = table.pvalues(scores[valid])
+            for i in np.flatnonzero(valid & (pvalues < thresh)):
+                matched = sequence[i:i+table.motif.width]
+                if t % 2:
+                    # As in FIMO, '-' hits report the sequence of the strand the motif matched
+                    matched = reverse_complement(matched)
+                hits.append((t//2, name, int(i) + 1, int(i) + table.motif.width,
+                             '-' if t % 2 else '+', scores[i]/scale, float(pvalues[i]), matched))
+    return hits, n_tests
+
+
+def benjamini_hochberg(pvalues, n_tests):
+    """Benjamini-Hochberg adjusted p-values of the smallest p-values out of n_tests tests."""
+    pvalues = np.asarray(pvalues, dtype=float)
+    order = np.argsort(pvalues)
+    ranked = pvalues[order]*n_tests/np.arange(1, pvalues.size + 1)
+    ranked = np.minimum.accumulate(ranked[::-1])[::-1]
+    qvalues = np.empty_like(pvalues)
+    qvalues[order] = np.minimum(ranked, 1.0)
+    return qvalues
+
+
+def _chunks(sequences, chunk_size):
+    chunk, length = [], 0
+    for name, sequence in sequences:
+        chunk.append((name, sequence))
+        length += len(sequence)
+        if length >= chunk_size:
+            yield chunk
+            chunk, length = [], 0
+    if chunk:
+        yield chunk
+
+
+def scan(motifs, sequences, background=None, thresh=1e-4, scale=100, pseudocount=0.1,
+         n_jobs=1, chunk_size=1000000):
+    """Scan motifs against sequences on both strands.
+
+    Args:
+        motifs: list of Motif instances
+        sequences: iterable of (name, sequence) tuples
+        background: Background instance, defaults to uniform
+        thresh: p-value threshold for reporting hits
+        scale: number of integer score units per bit
+        pseudocount: weight of background frequencies mixed into motif probabilities
+        n_jobs: number of worker processes
+        chunk_size: approximate number of bases scanned per task
+
+    Returns:
+        hits: list of Hit instances, sorted by p-value
+    """
+    background = background or Background.uniform()
+    tables = []
+    for motif in motifs:
+        tables.append(ScoreTable(motif, background, scale, pseudocount))
+        tables.append(ScoreTable(motif.reverse_complement(), background, scale, pseudocount))
+    args = (tables, background, thresh, scale)
+    if n_jobs == 1:
+        results = [_scan_chunk(chunk, *args) for chunk in _chunks(sequences, chunk_size)]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            futures = [pool.submit(_scan_chunk, chunk, *args)
+                       for chunk in _chunks(sequences, chunk_size)]
+            results = [future.result() for future in futures]
+
+    raw_hits = [hit for hits, _ in results for hit in hits]
+    n_tests = sum(n for _, n in results)
+    qvalues = benjamini_hochberg([hit[6] for hit in raw_hits], n_tests)
+    hits = [Hit(motifs[m], name, start, stop, strand, score, pvalue, qvalue, matched)
+            for (m, name, start, stop, strand, score, pvalue, matched), qvalue
+            in zip(raw_hits, qvalues)]
+    hits.sort(key=lambda hit: (hit.pvalue, hit.motif.motif_id, hit.sequence_name, hit.start))
+    return hits
+
+
+def write_fimo_tsv(hits, outfile):
+    """Write hits in FIMO TSV format."""
+    with open(outfile, 'w') as output:
+        output.write('\t'.join(FIMO_COLUMNS) + '\n')
+        for hit in hits:
+            output.write('\t'.join(str(x) for x in hit.row()) + '\n')
+        output.write('\n# Scanned in-process by scan_motifs.py\n')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Scan PWMs against sequences (FIMO-compatible).')
+    parser.add_argument('motifs', help='MEME motif file, or motif table if --cisbp is given')
+    parser.add_argument('sequences', help='FASTA file of sequences to scan')
+    parser.add_argument('-oc', '--oc', required=True, help='output directory for fimo.tsv')
+    parser.add_argument('-bfile', '--bfile', default=None,
+                        help='Markov background from fasta-get-markov')
+    parser.add_argument('--cisbp', default=None,
+                        help='CisBP directory; motifs is then a table of names and motif IDs')
+    parser.add_argument('-thresh', '--thresh', type=float, default=1e-4, help='p-value threshold')
+    parser.add_argument('-j', '--jobs', type=int, default=1)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.cisbp:
+        motifs = read_cisbp_motifs(args.cisbp, args.motifs)
+    else:
+        motifs = read_meme(args.motifs)
+    background = Background.from_file(args.bfile) if args.bfile else Background.uniform()
+    hits = scan(motifs, read_fasta(args.sequences), background, args.thresh, n_jobs=args.jobs)
+    os.makedirs(args.oc, exist_ok=True)
+    write_fimo_tsv(hits, os.path.join(args.oc, 'fimo.tsv'))
+    sys.stderr.write(f'{len(hits)} hits written to {args.oc}/fimo.tsv\n')
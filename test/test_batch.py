@@ -0,0 +1,100 @@
+import io
+import os
+import tempfile
+import unittest
+import numpy as np
+from zfnetwork import grn, batch
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.networks = {}
+        for i, n_nodes in enumerate([1, 3, 2]):
+            np.random.seed(i)
+            zf_grn = grn.ZincFingerGRN(n_nodes, n_nodes, n_nodes)
+            zf_grn.generate_erdos_renyi(0.5)
+            for tf in zf_grn.tfs:
+                tf.pop = 5
+            path = os.path.join(self.tmpdir.name, f'species_{i}.json')
+            batch.save_network(zf_grn, path)
+            self.networks[f'species_{i}'] = path
+        self.store = batch.ResultStore(os.path.join(self.tmpdir.name, 'results.sqlite'))
+
+    def tearDown(self):
+        self.store.close()
+        self.tmpdir.cleanup()
+
+    def test_network_roundtrip(self):
+        netdict = batch.load_network(self.networks['species_1'])
+        zf_grn = grn.ZincFingerGRN.from_dict(netdict)
+        self.assertEqual(zf_grn.n_tfs, 3)
+        self.assertEqual(batch.network_size(netdict), len(zf_grn.nodes) + len(zf_grn.edges))
+
+    def test_simulate_batch(self):
+        log = io.StringIO()
+        summary = batch.simulate_batch(self.networks, self.store, 10, 5, sample_interval=0.5,
+                                       chunk_size=2, n_jobs=1, log=log)
+        self.assertEqual(summary['networks'], 3)
+        self.assertGreater(summary['events_per_second'], 0)
+        self.assertIn('networks/s', log.getvalue())
+        # Largest network completes first when run in order
+        self.assertTrue(log.getvalue().startswith('species_1'))
+        self.assertEqual(self.store.networks(), ['species_0', 'species_1', 'species_2'])
+
+        time_log, pop_log, labels = self.store.load('species_2')
+        netdict = batch.load_network(self.networks['species_2'])
+        self.assertEqual(labels, [node['label'] for node in netdict['nodes']])
+        self.assertEqual(pop_log.shape, (5, 20, len(labels)))
+        self.assertTrue(np.allclose(time_log, np.arange(20)*0.5))
+        self.assertTrue(np.all(pop_log[:, 0, 0] == 5))
+        self.assertGreater(self.store.info('species_2')['n_events'], 0)
+        self.assertEqual(summary['events'], sum(self.store.info(name)['n_events']
+                                                for name in self.networks))
+
+        # Chunks are seeded independently, so replicates differ
+        self.assertFalse(np.array_equal(pop_log[0], pop_log[2]))
+
+        # Completed networks are skipped
+        summary = batch.simulate_batch(self.networks, self.store, 10, 5, n_jobs=1)
+        self.assertEqual((summary['networks'], summary['skipped']), (0, 3))
+
+    def test_seeds_independent_of_batch(self):
+        batch.simulate_batch({'species_2': self.networks['species_2']}, self.store, 10, 4,
+                             chunk_size=2, n_jobs=1)
+        alone = self.store.load('species_2')[1]
+        other = batch.ResultStore(os.path.join(self.tmpdir.name, 'all.sqlite'))
+        batch.simulate_batch(self.networks, other, 10, 4, chunk_size=2, n_jobs=1)
+        self.assertTrue(np.array_equal(other.load('species_2')[1], alone))
+        other.close()
+        self.assertNotEqual(batch.chunk_seed(0, 'species_2', 0), batch.chunk_seed(0, 'species_2', 2))
+        self.assertNotEqual(batch.chunk_seed(0, 'species_2', 0), batch.chunk_seed(0, 'species_1', 0))
+
+    def test_failed_network(self):
+        networks = dict(self.networks)
+        # Edge to a node that does not exist
+        networks['broken'] = {'nodes': [], 'edges': [(0, 1, 1.0, 2.0)]}
+        log = io.StringIO()
+        for n_jobs in 1, 2:
+            store = batch.ResultStore(os.path.join(self.tmpdir.name, f'failed_{n_jobs}.sqlite'))
+            summary = batch.simulate_batch(networks, store, 10, 2, n_jobs=n_jobs, log=log)
+            self.assertEqual((summary['networks'], summary['failed']), (3, 1))
+            self.assertEqual(store.networks(), ['species_0', 'species_1', 'species_2'])
+            store.close()
+        self.assertIn('broken\tfailed: IndexError', log.getvalue())
+
+    def test_parallel_matches_serial(self):
+        networks = {name: path for name, path in self.networks.items() if name != 'species_0'}
+        batch.simulate_batch(networks, self.store, 10, 3, chunk_size=1, n_jobs=1)
+        serial = self.store.load('species_1')[1]
+        other = batch.ResultStore(os.path.join(self.tmpdir.name, 'parallel.sqlite'))
+        summary = batch.simulate_batch(networks, other, 10, 3, chunk_size=1, n_jobs=2)
+        self.assertTrue(np.array_equal(other.load('species_1')[1], serial))
+        self.assertEqual(summary['events'], sum(self.store.info(name)['n_events']
+                                                for name in networks))
+        other.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
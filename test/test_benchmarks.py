@@ -0,0 +1,89 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+import run_benchmarks
+
+
+BENCH_MODULE = '''
+class Sizes:
+    params = ([1, 2], ['a', 'b'])
+    param_names = ['n', 'label']
+    number = 1
+    repeat = 2
+
+    def setup_cache(self):
+        with open('shared.txt', 'w') as output:
+            output.write('shared')
+        return 'shared.txt'
+
+    def setup(self, path, n, label):
+        if n == 2 and label == 'b':
+            raise NotImplementedError
+        self.contents = open(path).read()
+
+    def time_sum(self, path, n, label):
+        sum(range(n))
+
+    def track_length(self, path, n, label):
+        return len(self.contents)*n
+    track_length.unit = 'chars'
+    track_length.higher_is_better = True
+
+
+def time_module_function():
+    pass
+'''
+
+
+class TestBenchmarkRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.tmpdir.name, 'bench_toy.py'), 'w') as output:
+            output.write(BENCH_MODULE)
+
+    def tearDown(self):
+        if self.tmpdir.name in sys.path:
+            sys.path.remove(self.tmpdir.name)
+        sys.modules.pop('bench_toy', None)
+        self.tmpdir.cleanup()
+
+    def test_discover_and_run(self):
+        benchmarks = run_benchmarks.discover(self.tmpdir.name)
+        self.assertEqual([b.name for b, _ in benchmarks],
+                         ['bench_toy.Sizes.time_sum', 'bench_toy.Sizes.track_length',
+                          'bench_toy.time_module_function'])
+        self.assertEqual(benchmarks[0][0].param_sets(), [(1, 'a'), (1, 'b'), (2, 'a'), (2, 'b')])
+
+        with open(os.devnull, 'w') as log:
+            results = run_benchmarks.run_all(benchmarks, log=log)
+        self.assertEqual(results['bench_toy.Sizes.track_length']['values'],
+                         {"1, 'a'": 6.0, "1, 'b'": 6.0, "2, 'a'": 12.0, "2, 'b'": None})
+        self.assertTrue(results['bench_toy.Sizes.track_length']['higher_is_better'])
+        self.assertEqual(results['bench_toy.Sizes.time_sum']['unit'], 'seconds')
+        self.assertGreater(results['bench_toy.time_module_function']['values'][''], 0.0)
+
+        # Results round trip through the per-commit store
+        results_dir = os.path.join(self.tmpdir.name, 'results')
+        run_benchmarks.save_results(results, 'abc123', results_dir)
+        self.assertEqual(run_benchmarks.load_results('abc123', results_dir)['results'], results)
+        self.assertIsNone(run_benchmarks.load_results('def456', results_dir))
+
+    def test_compare(self):
+        old = {'time_x': {'higher_is_better': False, 'values': {'1': 1.0, '2': 1.0, '3': 1.0}},
+               'track_y': {'higher_is_better': True, 'values': {'': 100.0}},
+               'time_removed': {'higher_is_better': False, 'values': {'': 1.0}}}
+        new = {'time_x': {'higher_is_better': False, 'values': {'1': 1.5, '2': 1.05, '3': 0.5}},
+               'track_y': {'higher_is_better': True, 'values': {'': 50.0}},
+               'time_new': {'higher_is_better': False, 'values': {'': 1.0}}}
+        statuses = {(name, key): status
+                    for name, key, _, _, status in run_benchmarks.compare(old, new, factor=1.1)}
+        self.assertEqual(statuses, {('time_x', '1'): 'regression', ('time_x', '2'): '',
+                                    ('time_x', '3'): 'improvement', ('track_y', ''): 'regression'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts', 'cluster-zfps'))
+import cluster_stats
+
+
+class TestZFMidpoints(unittest.TestCase):
+
+    # Two species; chromosome names overlap between species but must not be merged
+    species = ['A', 'B']
+    species_idx = np.array([0, 0, 0, 0, 0, 1, 1, 1])
+    chrom_idx = np.array([0, 0, 0, 0, 1, 2, 2, 3])
+    midpoints = np.array([5000, 0, 100, 1000, 50, 10, 20, 0])
+    zf_midpoints = cluster_stats.ZFMidpoints(species, species_idx, chrom_idx, midpoints)
+
+    def test_sorting(self):
+        self.assertEqual(list(self.zf_midpoints.midpoints), [0, 100, 1000, 5000, 50, 10, 20, 0])
+
+    def test_inter_znf_distances(self):
+        species_idx, distances = self.zf_midpoints.inter_znf_distances()
+        self.assertEqual(list(species_idx), [0, 0, 0, 1])
+        self.assertEqual(list(distances), [100, 900, 4000, 10])
+
+    def test_distance_percentiles(self):
+        percentiles = self.zf_midpoints.distance_percentiles([25, 50, 75])
+        np.testing.assert_allclose(percentiles[0], np.percentile([100, 900, 4000], [25, 50, 75]))
+        np.testing.assert_allclose(percentiles[1], [10, 10, 10])
+
+    def test_thresholds_default(self):
+        zf_midpoints = cluster_stats.ZFMidpoints(['A', 'B'], [0, 1], [0, 1], [0, 0])
+        self.assertEqual(list(zf_midpoints.thresholds(default=7)), [7, 7])
+
+    def test_cluster_sizes(self):
+        # Features are merged when the gap between 1bp midpoints is <= maxdist
+        species_idx, sizes = self.zf_midpoints.cluster_sizes(900)
+        self.assertEqual(list(species_idx), [0, 0, 0, 1, 1])
+        self.assertEqual(list(sizes), [3, 1, 1, 2, 1])
+        species_idx, sizes = self.zf_midpoints.cluster_sizes(898)
+        self.assertEqual(list(sizes), [2, 1, 1, 1, 2, 1])
+        species_idx, sizes = self.zf_midpoints.cluster_sizes([5000, 0])
+        self.assertEqual(list(sizes), [4, 1, 1, 1, 1])
+
+    def test_histogram(self):
+        species_idx, sizes, counts = self.zf_midpoints.cluster_size_histogram(900)
+        self.assertEqual(list(zip(species_idx, sizes, counts)), [(0, 1, 2), (0, 3, 1), (1, 1, 1),
+                                                                 (1, 2, 1)])
+
+    def test_summary_roundtrip(self):
+        columns, rows = self.zf_midpoints.summary(percentiles=[50], threshold_percentile=50)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            outfile = os.path.join(tmpdir, 'stats.tsv')
+            cluster_stats.write_summary(columns, rows, outfile)
+            summary = cluster_stats.read_summary(outfile)
+        self.assertEqual(summary['A']['n_znfs'], 5)
+        self.assertEqual(summary['A']['threshold'], 900)
+        self.assertEqual(summary['A']['n_clusters'], 3)
+        self.assertEqual(summary['B']['max_cluster_size'], 2)
+
+    def test_from_bedfiles(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            bedfiles = {}
+            for species, lines in (('A', ['chr1\t0\t10\tZNF1\n', 'chr1\t100\t110\tZNF2\n']),
+                                   ('B', ['chr1\t0\t2\tZNF1\n'])):
+                bedfiles[species] = os.path.join(tmpdir, f'{species}_znfs.bed')
+                with open(bedfiles[species], 'w') as output:
+                    output.writelines(lines)
+            zf_midpoints = cluster_stats.ZFMidpoints.from_bedfiles(bedfiles, n_jobs=1)
+        self.assertEqual(list(zf_midpoints.midpoints), [5, 105, 1])
+        self.assertEqual(list(zf_midpoints.chrom_idx), [0, 0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts', 'cluster-zfps'))
+import cluster_zfps
+from zfnetwork import grn
+
+
+class FakeGenome:
+    """Stands in for ZFGenome where bedtools is not needed, recording the clusterings requested."""
+
+    calls = []
+
+    def __init__(self, zf_bedfile, genomefile, use_midpoint=True):
+        pass
+
+    def extract_zf_clusters(self, maxdist, margin=1e4):
+        FakeGenome.calls.append(maxdist)
+        return 'chr1\t0\t100\tchr1_0\t2\t.\tZNF1_0,ZNF2_1\n'
+
+
+class TestClusterBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.bed_dir = os.path.join(self.tmpdir.name, 'beds')
+        self.out_dir = os.path.join(self.tmpdir.name, 'clusters')
+        os.makedirs(self.bed_dir)
+        os.makedirs(self.out_dir)
+        with open(os.path.join(self.bed_dir, 'A_znfs.bed'), 'w') as output:
+            output.write('chr1\t0\t10\tZNF1\t0\t+\nchr1\t50\t60\tZNF2\t0\t-\n'
+                         'chr1\t100000\t100010\tZNF3\t0\t+\n')
+        with open(os.path.join(self.bed_dir, 'A.genome'), 'w') as output:
+            output.write('chr1\t200000\n')
+        FakeGenome.calls = []
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def process(self, species, maxdists, force=False):
+        return cluster_zfps.process_species(species, self.bed_dir, self.bed_dir, self.out_dir,
+                                            maxdists, force=force)
+
+    def test_cluster_outfile(self):
+        # The name depends only on maxdist, not on how many distances are requested
+        self.assertEqual(os.path.basename(cluster_zfps.cluster_outfile('.', 'A', 118000.0)),
+                         'A_zf_clusters_d118000.bed')
+        with mock.patch.object(cluster_zfps, 'ZFGenome', FakeGenome):
+            self.process('A', [1000, 5000])
+            sweep = sorted(os.listdir(self.out_dir))
+            self.process('A', [1000])
+        self.assertEqual(sweep, ['A_zf_clusters_d1000.bed', 'A_zf_clusters_d5000.bed'])
+        self.assertEqual(sorted(os.listdir(self.out_dir)), sweep)
+
+    def test_up_to_date(self):
+        with mock.patch.object(cluster_zfps, 'ZFGenome', FakeGenome):
+            status = self.process('A', [1000, 5000])
+            self.assertEqual(status['status'], 'ok')
+            self.assertEqual(status['n_clusters'], [1, 1])
+            self.assertEqual(self.process('A', [1000, 5000])['status'], 'skipped')
+            self.assertEqual(self.process('A', [1000, 5000], force=True)['status'], 'ok')
+            self.assertEqual(FakeGenome.calls, [1000, 5000, 1000, 5000])
+
+            # A newer input invalidates the outputs
+            outfile = cluster_zfps.cluster_outfile(self.out_dir, 'A', 1000)
+            mtime = os.path.getmtime(outfile)
+            os.utime(os.path.join(self.bed_dir, 'A_znfs.bed'), (mtime + 10, mtime + 10))
+            self.assertEqual(self.process('A', [1000, 5000])['status'], 'ok')
+            self.assertEqual(len(FakeGenome.calls), 6)
+
+    def test_failed_species_in_manifest(self):
+        manifest = os.path.join(self.tmpdir.name, 'manifest.tsv')
+        # B has no input files; A is up to date, so neither needs bedtools
+        for maxdist in 1000, 5000:
+            with open(cluster_zfps.cluster_outfile(self.out_dir, 'A', maxdist), 'w') as output:
+                output.write('chr1\t0\t100\tchr1_0\t2\t.\tZNF1_0,ZNF2_1\n')
+        with mock.patch('sys.stderr'):
+            statuses = cluster_zfps.run_batch(['A', 'B'], self.bed_dir, self.bed_dir, self.out_dir,
+                                              [1000, 5000], manifest, n_jobs=1)
+        self.assertEqual(len(statuses), 2)
+        with open(manifest) as input:
+            rows = [line.rstrip('\n').split('\t') for line in input]
+        self.assertEqual(rows[0][:2], ['species', 'status'])
+        self.assertEqual([row[:3] for row in rows[1:]],
+                         [['A', 'skipped', '1000,5000'], ['B', 'failed', '1000,5000']])
+        self.assertNotEqual(rows[2][-1], '.')
+
+    @unittest.skipUnless(shutil.which('bedtools'), 'bedtools is not installed')
+    def test_extract_zf_clusters(self):
+        status = self.process('A', [100])
+        self.assertEqual(status['status'], 'ok')
+        with open(cluster_zfps.cluster_outfile(self.out_dir, 'A', 100)) as input:
+            rows = [line.rstrip('\n').split('\t') for line in input]
+        self.assertEqual([row[3] for row in rows], ['chr1_0', 'chr1_1'])
+        self.assertEqual(rows[0][-1], 'ZNF1_0,ZNF2_1')
+
+    @unittest.skipUnless(shutil.which('bedtools'), 'bedtools is not installed')
+    def test_read_cluster_bed(self):
+        """ZincFingerGRN reads the clusters written by ZFGenome.extract_zf_clusters."""
+        zf_bedfile = os.path.join(self.bed_dir, 'B_znfs.bed')
+        genomefile = os.path.join(self.bed_dir, 'B.genome')
+        with open(zf_bedfile, 'w') as output:
+            output.write('chr19\t1000\t1010\tZNF1\t0\t+\nchr19\t2000\t2010\tZNF2\t0\t+\n'
+                         'chr19\t3000\t3010\tZNF3\t0\t-\nchr19\t11000\t11010\tZNF4\t0\t+\n')
+        with open(genomefile, 'w') as output:
+            output.write('chr19\t20000\n')
+        bedfile = os.path.join(self.out_dir, 'B_clusters.bed')
+        with open(bedfile, 'w') as output:
+            output.write(str(cluster_zfps.ZFGenome(zf_bedfile, genomefile)
+                             .extract_zf_clusters(maxdist=5000, margin=100)))
+        with open(bedfile) as input:
+            self.assertEqual(input.read().split('\n')[:2],
+                             ['chr19\t905\t3106\tchr19_0\t3\t.\tZNF1_0,ZNF2_1,ZNF3_2',
+                              'chr19\t10905\t11106\tchr19_1\t1\t.\tZNF4_3'])
+        self.assertEqual(grn.read_cluster_bed(bedfile),
+                         [('chr19_0', ['ZNF1_0', 'ZNF2_1', 'ZNF3_2']), ('chr19_1', ['ZNF4_3'])])
+
+
+if __name__ == '__main__':
+    unittest.main()
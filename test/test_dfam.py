@@ -0,0 +1,134 @@
+import os
+import sys
+import json
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts', 'cluster-zfps'))
+import extract_dfam_libraries as dfam
+
+
+# Canned Dfam libraries, keyed by taxid
+LIBRARIES = {
+    '7515': [f'>DF00000{i}.1 TE_{i}\nACGTACGT\n' for i in range(5)],
+    '8407': ['>DF0000100.1 TE_A\nTTTT\n'],
+    '9606': [f'>DF00002{i}.1 TE_{i}\nGGCC\n' for i in range(4)],
+}
+# Taxids whose total_count only covers the first page, and whose responses are cut off mid-stream
+SHORT_COUNT = {'9606'}
+TRUNCATED = {'666'}
+
+
+class DfamStubHandler(BaseHTTPRequestHandler):
+    """Serves paged FASTA responses in the same JSON layout as the Dfam families API."""
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        self.server.requests.append(query)
+        taxid = query['clade'][0]
+        if taxid in TRUNCATED:
+            self.send_response(200)
+            self.send_header('Content-Length', '1000')
+            self.end_headers()
+            self.wfile.write(b'{"total_count": 1, "body": ">DF')
+            self.close_connection = True
+            return
+        if taxid not in LIBRARIES:
+            self.send_response(404)
+            self.end_headers()
+            return
+        start, limit = int(query['start'][0]), int(query['limit'][0])
+        records = LIBRARIES[taxid]
+        total_count = limit if taxid in SHORT_COUNT else len(records)
+        body = json.dumps({'total_count': total_count,
+                           'body': ''.join(records[start:start+limit])}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestDfamFetcher(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), DfamStubHandler)
+        cls.server.requests = []
+        cls.url = f'http://127.0.0.1:{cls.server.server_address[1]}/api/families'
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.requests.clear()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmpdir.name, 'cache')
+        self.out_dir = os.path.join(self.tmpdir.name, 'out')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def fetcher(self):
+        return dfam.DfamFetcher(self.url, self.cache_dir, page_size=2, max_workers=2, retries=0)
+
+    def test_paging(self):
+        fetcher = self.fetcher()
+        outfile = os.path.join(self.tmpdir.name, 'flea.fa')
+        self.assertEqual(fetcher.fetch_species('7515', outfile), 5)
+        with open(outfile) as input:
+            self.assertEqual(input.read(), ''.join(LIBRARIES['7515']))
+        self.assertEqual([q['start'][0] for q in self.server.requests], ['0', '2', '4'])
+        self.assertEqual(self.server.requests[0]['format'], ['fasta'])
+
+        # Paging does not trust total_count, and a full last page is followed by an empty one
+        self.server.requests.clear()
+        self.assertEqual(fetcher.fetch_species('9606', outfile), 4)
+        self.assertEqual([q['start'][0] for q in self.server.requests], ['0', '2', '4'])
+
+    def test_cache(self):
+        results = self.fetcher().fetch_all({'flea': '7515', 'frog': '8407'}, self.out_dir)
+        self.assertEqual(results, {'flea': 5, 'frog': 1})
+        n_requests = len(self.server.requests)
+        self.assertEqual(n_requests, 4)
+
+        fetcher = self.fetcher()
+        results = fetcher.fetch_all({'flea': '7515', 'frog': '8407'}, self.out_dir)
+        self.assertEqual(results, {'flea': 5, 'frog': 1})
+        self.assertEqual(fetcher.n_requests, 0)
+        self.assertEqual(len(self.server.requests), n_requests)
+
+        # Changing query parameters changes the cache key
+        fetcher.fetch_species('8407', os.path.join(self.out_dir, 'frog.fa'),
+                              clade_relatives='ancestors')
+        self.assertEqual(fetcher.n_requests, 1)
+
+    def test_failure_isolation(self):
+        results = self.fetcher().fetch_all({'flea': '7515', 'missing': '1'}, self.out_dir)
+        self.assertEqual(results['flea'], 5)
+        self.assertIsInstance(results['missing'], Exception)
+        self.assertEqual(sorted(os.listdir(self.out_dir)), ['flea_dfam_library.fa'])
+        cached = [f for _, _, files in os.walk(self.cache_dir) for f in files]
+        self.assertEqual(len(cached), 3)
+        self.assertTrue(all(f.endswith('.json') for f in cached))
+
+    def test_interrupted_download(self):
+        results = self.fetcher().fetch_all({'cut': '666'}, self.out_dir)
+        self.assertIsInstance(results['cut'], Exception)
+        self.assertEqual(os.listdir(self.out_dir), [])
+        cached = [f for _, _, files in os.walk(self.cache_dir) for f in files]
+        self.assertEqual(cached, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+import numpy as np
+from zfnetwork import ode, evolution
+
+
+class TestEvolution(unittest.TestCase):
+
+    def setUp(self):
+        self.model = evolution.ArmsRaceModel(n_tfs=2, max_zfs=4, n_tes=3)
+        self.population = evolution.Population.initial(self.model, 20, n_zfs=2)
+
+    def test_layout(self):
+        model = self.model
+        nodes = model.zf_grn.nodes
+        self.assertTrue(all(nodes[i].ntype == 'ZF' for i in model.zf_nodes))
+        self.assertTrue(all(nodes[i].ntype == 'Het' for i in model.het_nodes.ravel()))
+        self.assertTrue(all(nodes[i].ntype == 'TE' for i in model.te_nodes))
+        for z in range(model.max_zfs):
+            for t in range(model.n_tes):
+                binding = model.zf_grn.edges[model.binding_edges[z, t]]
+                silencing = model.zf_grn.edges[model.silencing_edges[z, t]]
+                self.assertIs(binding.x, nodes[model.zf_nodes[z]])
+                self.assertIs(binding.y, silencing.x)
+                self.assertIs(silencing.y, nodes[model.te_nodes[t]])
+
+    def test_to_grn_matches_masks(self):
+        population = self.population
+        population.zf_edges[0, 0, [0, 2]] = True
+        population.zf_edges[0, 3, 1] = True  # Absent ZF, so inactive
+        population.beta[0, self.model.zf_nodes[0]] = 2.0
+        evolver = evolution.Evolution(self.model, population)
+        _, te_load = evolver.fitness(population)
+
+        zf_grn = self.model.to_grn(population, 0)
+        self.assertEqual((zf_grn.n_tfs, zf_grn.n_zfs, zf_grn.n_tes), (2, 2, 3))
+        self.assertEqual(len(zf_grn.het), 2)
+        self.assertEqual(len(zf_grn.edges), 2*2 + 2*2)
+        self.assertEqual(zf_grn['ZF_0'].beta, 2.0)
+        compiled = ode.CompiledGRN.from_grn(zf_grn)
+        steady = compiled.steady_state()
+        self.assertAlmostEqual(steady[0, compiled.indices(ntype='TE')].sum(), te_load[0])
+        # Unrepressed TEs are at beta/gamma
+        self.assertAlmostEqual(te_load[1], 3*1.0/0.1)
+
+    def test_mutations(self):
+        evolver = evolution.Evolution(self.model, self.population, duplication=1.0, loss=0.0,
+                                      gain=1.0, escape=0.0, drift=0.0)
+        evolver.mutate(self.population)
+        population = self.population
+        self.assertTrue(np.all(population.zf_present.sum(axis=1) == 3))
+        self.assertTrue(np.all(population.zf_edges.sum(axis=(1, 2)) == 1))
+        # Duplicates inherit regulation and parameters
+        self.assertTrue(np.all(population.tf_edges))
+        self.assertTrue(np.allclose(population.beta, self.model.compiled.beta))
+
+        evolver = evolution.Evolution(self.model, population, duplication=0.0, loss=1.0,
+                                      gain=0.0, escape=1.0, drift=1.0)
+        k = population.k.copy()
+        evolver.mutate(population)
+        self.assertTrue(np.all(population.zf_present.sum(axis=1) == 2))
+        self.assertEqual(population.zf_edges.sum(), 0)
+        silencing = self.model.silencing_edges.ravel()
+        self.assertFalse(np.allclose(population.k[:, silencing], k[:, silencing]))
+        self.assertTrue(np.array_equal(population.k[:, self.model.tf_edges.ravel()],
+                                       k[:, self.model.tf_edges.ravel()]))
+
+    def test_escape_non_contiguous(self):
+        population = self.population
+        # Edge arrays need not be contiguous, e.g. when stored TE-major
+        zf_edges = np.zeros((population.size, self.model.n_tes, self.model.max_zfs), dtype=bool)
+        population.zf_edges = zf_edges.transpose(0, 2, 1)
+        population.zf_edges[:, 0, :] = True
+        evolver = evolution.Evolution(self.model, population, duplication=0.0, loss=0.0,
+                                      gain=0.0, escape=1.0, drift=0.0)
+        evolver.mutate(population)
+        self.assertTrue(np.all(population.zf_edges.sum(axis=(1, 2)) == 2))
+        self.assertTrue(np.all(zf_edges.sum(axis=(1, 2)) == 2))
+
+    def test_selection_reduces_te_load(self):
+        evolver = evolution.Evolution(self.model, self.population, seed=1)
+        history = evolver.run(30)
+        self.assertEqual(len(history['mean_fitness']), 30)
+        self.assertLess(history['mean_te_load'][-1], 0.5*history['mean_te_load'][0])
+        self.assertGreater(history['mean_targets'][-1], 0)
+
+    def test_parallel_fitness(self):
+        population = self.population
+        population.zf_edges[::2, 0, :] = True
+        serial = evolution.Evolution(self.model, population)
+        parallel = evolution.Evolution(self.model, population, n_jobs=2)
+        history = parallel.run(1)
+        self.assertAlmostEqual(history['mean_fitness'][0], serial.fitness(population)[0].mean())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+from zfnetwork import expression, grn
+import os
+import tempfile
+import unittest
+import numpy as np
+
+
+TABLES = {
+    'S1': [('"gene-ZNF91"', 50), ('"gene-POU5F1"', 200), ('"gene-SOX2"', 3), ('"L1HS:L1:LINE"', 40)],
+    'S2': [('"gene-ZNF91"', 5), ('"gene-POU5F1"', 150), ('"gene-NANOG"', 12),
+           ('"L1HS:L1:LINE"', 0), ('"SVA_D:SVA:Retroposon"', 30)],
+}
+
+
+class TestExpressionMatrix(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.paths = []
+        for sample, rows in TABLES.items():
+            path = os.path.join(self.tmpdir.name, f'{sample}.cntTable')
+            with open(path, 'w') as output:
+                output.write(f'gene/TE\t{sample}.bam\n')
+                for feature, count in rows:
+                    output.write(f'{feature}\t{count}\n')
+            self.paths.append(path)
+        self.cache = os.path.join(self.tmpdir.name, 'counts.npz')
+        self.matrix = expression.ExpressionMatrix.from_cnt_tables(self.paths, cache=self.cache,
+                                                                  n_jobs=1)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_normalize_label(self):
+        self.assertEqual(expression.normalize_label('"gene-ZNF91"'), 'ZNF91')
+        self.assertEqual(expression.normalize_label('L1HS:L1:LINE'), 'L1HS')
+
+    def test_matrix(self):
+        self.assertEqual(self.matrix.shape, (6, 2))
+        self.assertEqual(self.matrix.samples, ['S1', 'S2'])
+        self.assertEqual(len(set(self.matrix.features)), 6)
+        # Zero counts are not stored
+        self.assertEqual(self.matrix.counts.nnz, 8)
+        self.assertEqual(self.matrix.sample_counts('S2')['POU5F1'], 150)
+        self.assertNotIn('L1HS', self.matrix.sample_counts('S2'))
+
+    def test_expressed(self):
+        self.assertEqual(self.matrix.expressed(10), {'ZNF91', 'POU5F1', 'NANOG', 'L1HS', 'SVA_D'})
+        self.assertEqual(self.matrix.expressed(10, min_samples=2), {'POU5F1'})
+        self.assertEqual(self.matrix.expressed(10, samples=['S2'], kind='gene'),
+                         {'POU5F1', 'NANOG'})
+        self.assertEqual(self.matrix.expressed(10, kind='TE'), {'L1HS', 'SVA_D'})
+        self.assertEqual(self.matrix.expressed(10, exclude=['znf91'], kind='gene'),
+                         {'POU5F1', 'NANOG'})
+
+    def test_cache(self):
+        self.assertTrue(os.path.exists(self.cache))
+        cached = expression.ExpressionMatrix.load(self.cache)
+        self.assertEqual(list(cached.features), list(self.matrix.features))
+        self.assertEqual((cached.counts != self.matrix.counts).nnz, 0)
+
+        # Modified tables invalidate the cache
+        with open(self.paths[0], 'a') as output:
+            output.write('"gene-KLF4"\t99\n')
+        os.utime(self.paths[0], (0, 0))
+        matrix = expression.ExpressionMatrix.from_cnt_tables(self.paths, cache=self.cache,
+                                                             n_jobs=1)
+        self.assertIn('KLF4', matrix.expressed(10))
+
+    def test_apply_to_grn(self):
+        edges = expression.filter_edge_list([('POU5F1', 'ZNF91'), ('SOX2', 'ZNF91'),
+                                             ('ZNF91', 'L1HS')],
+                                            self.matrix.expressed(10))
+        self.assertEqual(edges, [('POU5F1', 'ZNF91'), ('ZNF91', 'L1HS')])
+        znf_grn = grn.ZincFingerGRN()
+        znf_grn.from_edge_list(edges, {'POU5F1': 'TF', 'ZNF91': 'ZF', 'L1HS': 'TE'})
+        missing = self.matrix.apply_to_grn(znf_grn, 'S1', scale=0.1)
+        self.assertEqual(missing, [])
+        self.assertAlmostEqual(znf_grn['POU5F1'].pop, 20.0)
+        self.assertAlmostEqual(znf_grn['POU5F1'].beta, 20.0*znf_grn['POU5F1'].gamma)
+        self.assertEqual(znf_grn['L1HS'].pop, 4)
+        self.assertEqual(znf_grn['Het_1'].pop, 0.0)
+        # Populations are whole molecules, and only TF production is set from counts
+        self.assertEqual(znf_grn['ZNF91'].pop, 5)
+        self.assertIsInstance(znf_grn['ZNF91'].pop, int)
+        self.assertEqual(znf_grn['ZNF91'].beta, 1.0)
+        self.matrix.apply_to_grn(znf_grn, 'S1', scale=0.33)
+        self.assertEqual(znf_grn['L1HS'].pop, 13)
+
+        self.matrix.counts[0, 0] = -50
+        with self.assertRaises(ValueError):
+            self.matrix.apply_to_grn(znf_grn, 'S1')
+
+
+if __name__ == '__main__':
+    unittest.main()
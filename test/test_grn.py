@@ -1,5 +1,15 @@
-from zfnetwork import grn, ssa
+from zfnetwork import grn, ssa, ode
+import os
+import subprocess
+import sys
+import tempfile
 import unittest
+import numpy as np
+
+# Two rows of cluster_zfps.ZFGenome.extract_zf_clusters output: cluster name, gene count (score),
+# strand and collapsed gene names
+CLUSTER_BED = ['chr19\t100\t5000\tchr19_0\t3\t.\tZNF1_0,ZNF2_1,ZNF3_2\n',
+               'chr19\t9000\t12000\tchr19_1\t1\t.\tZNF4_3\n']
 
 
 class TestNode(unittest.TestCase):
@@ -98,6 +108,108 @@ class TestZincFingerGRN(unittest.TestCase):
     def test_getitem(self):
         self.assertEqual(self.znf_grn[1], self.znf_grn.tfs[0])
 
+    def test_dict_roundtrip(self):
+        self.znf_grn['Het_1'].pop = 3.0
+        copy = grn.ZincFingerGRN.from_dict(self.znf_grn.to_dict())
+        self.assertEqual([n.label for n in copy.nodes], [n.label for n in self.znf_grn.nodes])
+        self.assertEqual(copy.save_state(), self.znf_grn.save_state())
+        self.assertEqual([repr(e) for e in copy.edges], [repr(e) for e in self.znf_grn.edges])
+        self.assertEqual((copy.n_tfs, copy.n_zfs, copy.n_tes), (1, 1, 1))
+        self.assertEqual(copy['Het_2'].mode, 'repressor')
+        self.znf_grn['Het_1'].pop = 0.0
+
+    def test_generate_erdos_renyi(self):
+        znf_grn = grn.ZincFingerGRN(2, 2, 2)
+        znf_grn.generate_erdos_renyi(1.0)
+        # TF edges are direct, ZF edges pass through a heterochromatin node
+        self.assertEqual(len(znf_grn.het), 8)
+        self.assertEqual(len(znf_grn.edges), 8 + 2*8)
+        znf_grn.generate_erdos_renyi(0.0)
+        self.assertEqual(len(znf_grn.edges), 0)
+
+    def test_weakly_connected_components(self):
+        znf_grn = grn.ZincFingerGRN()
+        node_types = {'A': 'TF', 'B': 'ZF', 'C': 'TE', 'D': 'ZF', 'E': 'TE'}
+        znf_grn.from_edge_list([('A', 'B'), ('D', 'E'), ('B', 'C')], node_types)
+        znf_grn.tes.append(grn.Node('F', ntype='TE'))
+        labels = [[znf_grn.nodes[i].label for i in c]
+                  for c in znf_grn.weakly_connected_components()]
+        self.assertEqual(labels, [['A', 'B', 'Het_2', 'C'], ['D', 'Het_1', 'E'], ['F']])
+
+        sub = grn.ZincFingerGRN.from_dict(znf_grn.to_dict(znf_grn.weakly_connected_components()[1]))
+        self.assertEqual([n.label for n in sub.nodes], ['D', 'Het_1', 'E'])
+        self.assertEqual(len(sub.edges), 2)
+
+    def test_from_cluster_bed(self):
+        znf_grn = grn.ZincFingerGRN()
+        node_types = {'T': 'TF', 'U': 'TF', 'ZNF1_0': 'ZF', 'ZNF2_1': 'ZF', 'ZNF4_3': 'ZF',
+                      'L1': 'TE'}
+        znf_grn.from_edge_list([('T', 'ZNF1_0'), ('U', 'ZNF2_1'), ('T', 'ZNF2_1'),
+                                ('T', 'ZNF4_3'), ('ZNF1_0', 'L1')], node_types)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            bedfile = os.path.join(tmpdir, 'clusters.bed')
+            with open(bedfile, 'w') as output:
+                output.writelines(CLUSTER_BED)
+            self.assertEqual(grn.read_cluster_bed(bedfile)[1], ('chr19_1', ['ZNF4_3']))
+            clusters = znf_grn.from_cluster_bed(bedfile)
+
+        # Missing genes are added, and each cluster is regulated once per TF
+        self.assertEqual([c.label for c in clusters], ['chr19_0', 'chr19_1'])
+        self.assertEqual(znf_grn.n_zfs, 4)
+        self.assertEqual(sorted(e.x.label for e in clusters[0].input), ['T', 'U'])
+        for zf in znf_grn.zfs:
+            self.assertEqual(len(zf.input), 1)
+            self.assertEqual(zf.input[0].x.ntype, 'Cluster')
+        self.assertEqual(len(znf_grn['T'].output), 2)
+        self.assertEqual(len(znf_grn.edges), 2 + 3 + 4)
+        self.assertEqual(sum(len(node.input) for node in znf_grn.nodes), len(znf_grn.edges))
+
+        copy = grn.ZincFingerGRN.from_dict(znf_grn.to_dict())
+        self.assertEqual([n.label for n in copy.clusters], ['chr19_0', 'chr19_1'])
+
+        # A gene can only belong to one cluster
+        with self.assertRaises(ValueError):
+            znf_grn.add_cluster('chr19_2', [znf_grn['ZNF4_3']])
+
+    def test_single_member_cluster(self):
+        """A single-member cluster unit follows the unclustered ZF exactly."""
+        def network(clustered):
+            znf_grn = grn.ZincFingerGRN()
+            znf_grn.from_edge_list([('T', 'Z')], {'T': 'TF', 'Z': 'ZF'})
+            znf_grn['T'].pop, znf_grn['T'].beta = 3, 0.5
+            znf_grn['Z'].beta, znf_grn['Z'].gamma = 2.0, 0.2
+            if clustered:
+                znf_grn.add_cluster('chr1_0', [znf_grn['Z']])
+            return ode.CompiledGRN.from_grn(znf_grn)
+
+        unclustered, clustered = network(False), network(True)
+        _, expected = unclustered.integrate(30, sample_interval=1.0)
+        _, plog = clustered.integrate(30, sample_interval=1.0)
+        unit = clustered.indices(ntype='Cluster')[0]
+        self.assertTrue(np.allclose(plog[0, :, unit], expected[0, :, 1]))
+
+        # Members are half-maximal at half the unit's maximum, so they still follow the TF
+        unit_max = 2.0/0.2
+        self.assertEqual(clustered.k[-1], unit_max/2)
+        params = clustered.parameters(batch_size=2)
+        params['beta'][:, 0] = [0.1, 10.0]
+        steady = clustered.steady_state(params)
+        member = clustered.indices(ntype='ZF')[0]
+        self.assertLess(steady[0, member], 0.7*steady[1, member])
+        self.assertLess(steady[1, member], 0.9*2.0/0.2)
+
+
+class TestImports(unittest.TestCase):
+
+    def test_lightweight_core(self):
+        """Simulation core should not import plotting or graph libraries until they are used."""
+        code = ('import sys; import zfnetwork.grn, zfnetwork.ssa; '
+                'print(sorted({m.split(".")[0] for m in sys.modules} & '
+                '{"networkx", "matplotlib", "cProfile", "scipy"}))')
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                check=True)
+        self.assertEqual(result.stdout.strip(), '[]')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,109 @@
+from zfnetwork import expression, grn, ode, sensitivity, inference
+import os
+import tempfile
+import unittest
+import numpy as np
+from scipy import sparse
+
+
+class CountingEvaluator:
+    """Wraps an evaluator, counting the parameter sets it is asked to simulate."""
+
+    def __init__(self, evaluator):
+        self.evaluator = evaluator
+        self.n_evaluated = 0
+
+    def settings(self):
+        return self.evaluator.settings()
+
+    def __call__(self, params, output):
+        self.n_evaluated += params['pop'].shape[0]
+        return self.evaluator(params, output)
+
+
+class TestInference(unittest.TestCase):
+
+    def setUp(self):
+        self.znf_grn = grn.ZincFingerGRN()
+        self.znf_grn.from_edge_list([('A', 'B')], {'A': 'TF', 'B': 'ZF'})
+        self.compiled = ode.CompiledGRN.from_grn(self.znf_grn)
+        factors = [('beta[A]', 'beta', [0], 0.25, 4.0), ('gamma[B]', 'gamma', [1], 0.25, 4.0)]
+        self.space = sensitivity.ParameterSpace(self.compiled, factors)
+        self.summaries = inference.SummaryStatistics([0, 1], stats=('mean',))
+        self.evaluator = CountingEvaluator(sensitivity.ODEEvaluator(self.compiled, duration=100.0,
+                                                                    dt=0.5))
+
+    def test_summary_statistics(self):
+        pop_log = np.zeros((2, 3, 4, 2))
+        pop_log[0, :, -1, 0] = [1, 2, 3]
+        pop_log[1, :, 0, 1] = [2, 2, 8]
+        summaries = inference.SummaryStatistics([0, 1], stats=('mean', 'var', 'fano'),
+                                                times=(0, -1))
+        values = summaries(pop_log)
+        self.assertEqual(values.shape, (2, 12))
+        # time 0: mean, var, fano of nodes 0 and 1; then the same at the last time
+        self.assertEqual(list(values[0, 6:]), [2, 0, 1, 0, 0.5, 0])
+        self.assertEqual(list(values[1, :6]), [0, 4, 0, 12, 0, 3])
+
+    def test_expression_summaries(self):
+        counts = sparse.csr_matrix(np.array([[10, 20, 30], [1, 1, 4]]))
+        matrix = expression.ExpressionMatrix(counts, ['"gene-ZNF91"', 'L1HS:L1:LINE'],
+                                             ['c1', 'c2', 'c3'])
+        observed = inference.expression_summaries(matrix, ['L1HS', 'ZNF91', 'SOX2'], scale=0.5)
+        self.assertTrue(np.allclose(observed, [1.0, 10.0, 0.0, 0.75, 25.0, 0.0]))
+
+    def test_simulator_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = os.path.join(tmpdir, 'sims.npz')
+            simulator = inference.Simulator(self.space, self.evaluator, self.summaries, cache)
+            unit = np.array([[0.5, 0.5], [0.1, 0.9], [0.5, 0.5]])
+            first = simulator(unit)
+            self.assertEqual(first.shape, (3, 2))
+            self.assertEqual(self.evaluator.n_evaluated, 2)
+            self.assertEqual((simulator.n_simulations, simulator.n_cached), (2, 1))
+            self.assertTrue(np.array_equal(simulator(unit[:2]), first[:2]))
+            self.assertEqual(self.evaluator.n_evaluated, 2)
+            simulator.save()
+
+            simulator = inference.Simulator(self.space, self.evaluator, self.summaries, cache)
+            self.assertTrue(np.array_equal(simulator(unit), first))
+            self.assertEqual(simulator.n_simulations, 0)
+
+            # Results of other evaluator or summaries settings are not reused
+            evaluator = sensitivity.ODEEvaluator(self.compiled, duration=50.0, dt=0.5)
+            simulator = inference.Simulator(self.space, evaluator, self.summaries, cache)
+            self.assertEqual(simulator.cache, {})
+            summaries = inference.SummaryStatistics([0, 1], stats=('mean', 'var'))
+            simulator = inference.Simulator(self.space, self.evaluator, summaries, cache)
+            self.assertEqual(simulator(unit).shape, (3, 4))
+            self.assertEqual(simulator.n_simulations, 2)
+            # Worker count does not change results
+            evaluator = sensitivity.ODEEvaluator(self.compiled, duration=100.0, dt=0.5, n_jobs=2)
+            simulator = inference.Simulator(self.space, evaluator, self.summaries, cache)
+            self.assertEqual(len(simulator.cache), 2)
+
+    def test_ssa_seeding(self):
+        evaluator = sensitivity.SSAEvaluator(self.znf_grn, duration=5, replicates=2, seed=None)
+        summaries = inference.SummaryStatistics([0, 1], stats=('mean', 'var'))
+        params = self.space.transform([[0.5, 0.5], [0.5, 0.5], [0.6, 0.5]])
+        values = evaluator(params, summaries)
+        self.assertEqual(values.shape, (3, 4))
+        self.assertTrue(np.array_equal(values[0], values[1]))
+
+    def test_abc_smc(self):
+        # Synthetic observations from the model itself, at beta[A] x2 and gamma[B] x0.5
+        truth = np.array([[0.75, 0.25]])
+        simulator = inference.Simulator(self.space, self.evaluator, self.summaries)
+        observed = simulator(truth)[0]
+        result = inference.abc_smc(simulator, observed, n_particles=200, n_generations=6, seed=1)
+        self.assertEqual(result.particles.shape, (200, 2))
+        self.assertAlmostEqual(result.weights.sum(), 1.0)
+        self.assertTrue(np.all(np.diff(result.epsilons[1:]) < 0))
+        self.assertTrue(np.allclose(result.posterior_mean(), [2.0, 0.5], rtol=0.1))
+        low, _, high = result.quantiles()
+        self.assertTrue(np.all((low <= [2.0, 0.5]) & ([2.0, 0.5] <= high)))
+        self.assertEqual(result.n_simulations, self.evaluator.n_evaluated)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import numpy as np
+from zfnetwork import grn, ssa, ode
+
+
+class TestCompiledGRN(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(0)
+        self.znf_grn = grn.ZincFingerGRN(4, 4, 4)
+        self.znf_grn.generate_erdos_renyi(0.3)
+        for node in self.znf_grn.nodes:
+            node.pop = np.random.randint(10)
+        self.compiled = ode.CompiledGRN.from_grn(self.znf_grn)
+
+    def test_layout(self):
+        self.assertEqual(self.compiled.n_nodes, len(self.znf_grn.nodes))
+        self.assertEqual(self.compiled.n_edges, len(self.znf_grn.edges))
+        statedict = self.znf_grn.save_state()
+        params = self.compiled.parameters()
+        for name in ode.NODE_PARAMETERS:
+            self.assertEqual(list(params[name]), statedict['nodes'][name])
+        for name in ode.EDGE_PARAMETERS:
+            self.assertEqual(list(params[name]), statedict['edges'][name])
+        n_nodes = self.compiled.n_nodes
+        self.assertEqual(list(self.compiled.indices(ntype='TE')), list(range(n_nodes - 4, n_nodes)))
+        self.assertEqual(list(self.compiled.indices(group='tfs')), [0, 1, 2, 3])
+
+    def test_production_matches_ssa(self):
+        params = self.compiled._batch(None)
+        rates = self.compiled.production(params['pop'], params['beta'], params['k'], params['n'])
+        expected = [ssa.GillespieSSA.production_rate(node) for node in self.znf_grn.nodes]
+        self.assertTrue(np.allclose(rates[0], expected))
+
+    def test_integrate(self):
+        # TF produced at rate beta, decaying at rate gamma: x(t) = beta/gamma + (x0 - beta/gamma)e^-gamma*t
+        znf_grn = grn.ZincFingerGRN()
+        znf_grn.from_edge_list([('A', 'B')], {'A': 'TF', 'B': 'TF'})
+        compiled = ode.CompiledGRN.from_grn(znf_grn)
+        params = compiled.parameters(batch_size=3)
+        params['beta'][:, 0] = [0.0, 1.0, 2.0]
+        params['pop'][:, 0] = 100.0
+        tlog, plog = compiled.integrate(10, params, sample_interval=2.5)
+        self.assertEqual(list(tlog), [0.0, 2.5, 5.0, 7.5])
+        self.assertEqual(plog.shape, (3, 4, 2))
+        expected = params['beta'][:, 0]/0.1 + (100.0 - params['beta'][:, 0]/0.1)*np.exp(-0.1*7.5)
+        self.assertTrue(np.allclose(plog[:, -1, 0], expected, rtol=1e-6))
+
+        tlog, plog = compiled.integrate(10, params)
+        self.assertEqual(list(tlog), [10.0])
+
+    def test_mean_field_steady_state(self):
+        znf_grn = grn.ZincFingerGRN()
+        znf_grn.from_edge_list([('A', 'B')], {'A': 'TF', 'B': 'ZF'})
+        znf_grn['A'].beta, znf_grn['A'].gamma = 10.0, 1.0
+        znf_grn['B'].beta, znf_grn['B'].gamma = 5.0, 2.0
+        _, plog = ode.CompiledGRN.from_grn(znf_grn).integrate(50)
+        self.assertAlmostEqual(plog[0, -1, 0], 10.0, places=4)
+        self.assertAlmostEqual(plog[0, -1, 1], 5.0*100/101/2.0, places=4)
+
+    def test_steady_state(self):
+        # Feed-forward: exact levels match long integration
+        znf_grn = grn.ZincFingerGRN()
+        znf_grn.from_edge_list([('A', 'B'), ('B', 'C')], {'A': 'TF', 'B': 'ZF', 'C': 'TE'})
+        for node in znf_grn.nodes:
+            node.gamma = 1.0
+        compiled = ode.CompiledGRN.from_grn(znf_grn)
+        self.assertIsNotNone(compiled._levels)
+        params = compiled.parameters(batch_size=2)
+        params['beta'][1, 0] = 3.0
+        steady = compiled.steady_state(params)
+        _, plog = compiled.integrate(100, params)
+        self.assertTrue(np.allclose(steady, plog[:, -1], rtol=1e-6))
+
+        # Masked edges and nodes
+        params['edge_active'] = np.ones((2, compiled.n_edges), dtype=bool)
+        params['edge_active'][1, -1] = False
+        params['node_active'] = np.ones((2, compiled.n_nodes), dtype=bool)
+        params['node_active'][0, 1] = False
+        steady = compiled.steady_state(params)
+        _, plog = compiled.integrate(100, params)
+        self.assertTrue(np.allclose(steady, plog[:, -1], rtol=1e-6))
+        self.assertEqual(steady[0, 1], 0.0)
+        # Unrepressed TE is produced at beta
+        self.assertAlmostEqual(steady[1, -1], znf_grn['C'].beta)
+
+        # ZF autoregulation makes a cycle, solved by integration
+        znf_grn.add_tf_edge(znf_grn['B'], znf_grn['B'])
+        compiled = ode.CompiledGRN.from_grn(znf_grn)
+        self.assertIsNone(compiled._levels)
+        params = compiled.parameters()
+        params['pop'][:] = 1.0
+        steady = compiled.steady_state(params)
+        rates = compiled.production(steady, params['beta'][None], params['k'][None],
+                                    params['n'][None])
+        self.assertTrue(np.allclose(rates, params['gamma']*steady, atol=1e-4))
+
+
+if __name__ == '__main__':
+    unittest.main()
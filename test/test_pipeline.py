@@ -0,0 +1,128 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts', 'grn'))
+import pipeline
+
+
+def copy_command(src, dst, delay=0.0):
+    """Stand-in command that copies src to dst, recording start and end times alongside dst."""
+    code = ('import sys, time, shutil; start = time.time(); time.sleep(float(sys.argv[3])); '
+            'shutil.copy(sys.argv[1], sys.argv[2]); '
+            'open(sys.argv[2] + ".times", "w").write(f"{start} {time.time()}")')
+    return [sys.executable, '-c', code, src, dst, str(delay)]
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.workdir = self.tmpdir.name
+        self.write('input.txt', 'motifs\n')
+        self.write('seqs_a.fa', '>a\nACGT\n')
+        self.write('seqs_b.fa', '>b\nTTTT\n')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, path, contents):
+        with open(os.path.join(self.workdir, path), 'w') as output:
+            output.write(contents)
+
+    def read(self, path):
+        with open(os.path.join(self.workdir, path)) as input:
+            return input.read()
+
+    def stages(self, delay=0.0):
+        return [
+            pipeline.Stage('prepare', copy_command('input.txt', 'motifs.txt'),
+                           inputs=['input.txt'], outputs=['motifs.txt']),
+            pipeline.Stage('scan_a', copy_command('seqs_a.fa', 'out/a.tsv', delay),
+                           inputs=['motifs.txt', 'seqs_a.fa'], outputs=['out/a.tsv']),
+            pipeline.Stage('scan_b', copy_command('seqs_b.fa', 'out/b.tsv', delay),
+                           inputs=['motifs.txt', 'seqs_b.fa'], outputs=['out/b.tsv']),
+            pipeline.Stage('network', 'cat out/a.tsv out/b.tsv > edges.txt',
+                           inputs=['out'], outputs=['edges.txt']),
+        ]
+
+    def run_pipeline(self, stages=None, select=None, force=False):
+        pipe = pipeline.Pipeline(stages or self.stages(), workdir=self.workdir, log=None)
+        records = pipe.run(select, force=force)
+        return pipe, {record['stage']: record['status'] for record in records}
+
+    def test_dependencies(self):
+        pipe = pipeline.Pipeline(self.stages(), workdir=self.workdir, log=None)
+        self.assertEqual(pipe.dependencies['prepare'], set())
+        self.assertEqual(pipe.dependencies['scan_a'], {'prepare'})
+        self.assertEqual(pipe.dependencies['network'], {'scan_a', 'scan_b'})
+
+    def test_cycle(self):
+        stages = [pipeline.Stage('a', 'true', inputs=['y'], outputs=['x']),
+                  pipeline.Stage('b', 'true', inputs=['x'], outputs=['y'])]
+        with self.assertRaises(ValueError):
+            pipeline.Pipeline(stages, workdir=self.workdir, log=None)
+
+    def test_incremental(self):
+        pipe, statuses = self.run_pipeline()
+        self.assertEqual(set(statuses.values()), {'ran'})
+        self.assertEqual(self.read('edges.txt'), '>a\nACGT\n>b\nTTTT\n')
+        for name in statuses:
+            self.assertGreater(pipe.state['stages'][name]['seconds'], 0.0)
+
+        # Nothing changed, so nothing reruns
+        _, statuses = self.run_pipeline()
+        self.assertEqual(set(statuses.values()), {'skipped'})
+
+        # Touching a file without changing its contents does not trigger a rerun
+        os.utime(os.path.join(self.workdir, 'seqs_a.fa'), (0, 0))
+        _, statuses = self.run_pipeline()
+        self.assertEqual(set(statuses.values()), {'skipped'})
+
+        # Changing one input only reruns the stages downstream of it
+        self.write('seqs_b.fa', '>b\nGGGG\n')
+        _, statuses = self.run_pipeline()
+        self.assertEqual(statuses, {'prepare': 'skipped', 'scan_a': 'skipped', 'scan_b': 'ran',
+                                    'network': 'ran'})
+        self.assertEqual(self.read('edges.txt'), '>a\nACGT\n>b\nGGGG\n')
+
+        # Missing outputs trigger a rerun
+        os.remove(os.path.join(self.workdir, 'out', 'a.tsv'))
+        _, statuses = self.run_pipeline()
+        self.assertEqual(statuses['scan_a'], 'ran')
+
+        _, statuses = self.run_pipeline(force=True)
+        self.assertEqual(set(statuses.values()), {'ran'})
+
+    def test_parallel(self):
+        self.run_pipeline(self.stages(delay=0.5))
+        start_a, end_a = map(float, self.read('out/a.tsv.times').split())
+        start_b, end_b = map(float, self.read('out/b.tsv.times').split())
+        self.assertLess(max(start_a, start_b), min(end_a, end_b))
+
+    def test_subset(self):
+        _, statuses = self.run_pipeline(select=['scan_a'])
+        self.assertEqual(statuses, {'prepare': 'ran', 'scan_a': 'ran'})
+
+    def test_failure(self):
+        stages = self.stages()
+        stages[1].command = 'exit 1'
+        _, statuses = self.run_pipeline(stages)
+        self.assertEqual(statuses, {'prepare': 'ran', 'scan_a': 'failed', 'scan_b': 'ran',
+                                    'network': 'blocked'})
+
+        # Failed stages are not recorded as complete
+        stages = self.stages()
+        _, statuses = self.run_pipeline(stages)
+        self.assertEqual(statuses['scan_a'], 'ran')
+        self.assertEqual(statuses['scan_b'], 'skipped')
+
+    def test_missing_output(self):
+        stages = [pipeline.Stage('a', 'true', inputs=['input.txt'], outputs=['never.txt'])]
+        _, statuses = self.run_pipeline(stages)
+        self.assertEqual(statuses, {'a': 'failed'})
+
+
+if __name__ == '__main__':
+    unittest.main()
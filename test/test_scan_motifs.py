@@ -0,0 +1,197 @@
+import os
+import sys
+import itertools
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts', 'grn'))
+import scan_motifs
+import cres_to_network
+
+
+MEME = """MEME version 4
+
+ALPHABET= ACGT
+
+strands: + -
+
+Background letter frequencies
+A 0.25 C 0.25 G 0.25 T 0.25
+
+MOTIF MA0001.1 TFA
+letter-probability matrix: alength= 4 w= 4 nsites= 20 E= 0
+ 0.97 0.01 0.01 0.01
+ 0.01 0.97 0.01 0.01
+ 0.01 0.01 0.97 0.01
+ 0.01 0.01 0.01 0.97
+
+MOTIF MA0002.1 TFB
+letter-probability matrix: alength= 4 w= 3 nsites= 20 E= 0
+ 0.01 0.01 0.97 0.01
+ 0.01 0.01 0.97 0.01
+ 0.97 0.01 0.01 0.01
+"""
+
+BACKGROUND = """# order 0
+A 3.0e-01
+C 2.0e-01
+G 2.0e-01
+T 3.0e-01
+# order 1
+AA 1.0e-01
+AC 5.0e-02
+AG 6.0e-02
+AT 9.0e-02
+CA 6.0e-02
+CC 5.0e-02
+CG 1.0e-02
+CT 8.0e-02
+GA 6.0e-02
+GC 4.0e-02
+GG 5.0e-02
+GT 5.0e-02
+TA 8.0e-02
+TC 6.0e-02
+TG 8.0e-02
+TT 8.0e-02
+"""
+
+
+class TestScanMotifs(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.memefile = os.path.join(cls.tmpdir.name, 'motifs.meme')
+        cls.bfile = os.path.join(cls.tmpdir.name, 'background.bg')
+        with open(cls.memefile, 'w') as output:
+            output.write(MEME)
+        with open(cls.bfile, 'w') as output:
+            output.write(BACKGROUND)
+        cls.motifs = scan_motifs.read_meme(cls.memefile)
+        cls.background = scan_motifs.Background.from_file(cls.bfile)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def random_sequences(self, n, length, seed=0):
+        rng = np.random.default_rng(seed)
+        return [(f'seq_{i}', ''.join(rng.choice(list('ACGT'), size=length))) for i in range(n)]
+
+    def test_read_meme(self):
+        self.assertEqual([m.motif_id for m in self.motifs], ['MA0001.1', 'MA0002.1'])
+        self.assertEqual([m.alt_id for m in self.motifs], ['TFA', 'TFB'])
+        self.assertEqual(self.motifs[0].probs.shape, (4, 4))
+        self.assertEqual(self.motifs[1].width, 3)
+
+    def test_background(self):
+        self.assertEqual(self.background.order, 1)
+        np.testing.assert_allclose(self.background.letter_freqs, [0.3, 0.2, 0.2, 0.3])
+        # P(G|C) = 0.01/0.2
+        codes = scan_motifs.encode('CGNA')
+        log_probs = self.background.log_probs(codes)
+        self.assertAlmostEqual(log_probs[0], np.log2(0.2))
+        self.assertAlmostEqual(log_probs[1], np.log2(0.05))
+        self.assertEqual(log_probs[2], 0.0)
+        self.assertAlmostEqual(log_probs[3], np.log2(0.3))
+
+    def test_reverse_complement(self):
+        rc = self.motifs[1].reverse_complement()
+        self.assertEqual(''.join('ACGT'[i] for i in rc.probs.argmax(axis=1)), 'TCC')
+
+    def test_exact_pvalues(self):
+        """Compare dynamic programming null distribution to enumeration of all words."""
+        table = scan_motifs.ScoreTable(self.motifs[1], self.background)
+        cond = np.exp2(self.background.log_cond[1]).reshape(4, 4)
+        bg_scores = table.bg_scores[1].reshape(4, 4)
+        pmf = {}
+        for context in range(4):
+            for word in itertools.product(range(4), repeat=3):
+                prob, score, prev = self.background.joint[0][context], 0, context
+                for j, letter in enumerate(word):
+                    prob *= cond[prev, letter]
+                    score += table.motif_scores[j, letter] - bg_scores[prev, letter]
+                    prev = letter
+                pmf[score] = pmf.get(score, 0.0) + prob
+        scores = np.array(sorted(pmf))
+        expected = [sum(p for s, p in pmf.items() if s >= score) for score in scores]
+        np.testing.assert_allclose(table.pvalues(scores), expected)
+        self.assertEqual(table.pvalues(np.array([scores.max() + 1]))[0], 0.0)
+
+    def test_score_windows(self):
+        table = scan_motifs.ScoreTable(self.motifs[0], self.background)
+        sequence = 'TTACGTANNACGTGCA'
+        codes = scan_motifs.encode(sequence)
+        bg_logp = np.rint(100*self.background.log_probs(codes)).astype(np.int64)
+        scores = scan_motifs.score_windows(codes, [table], bg_logp)[0]
+        self.assertEqual(scores.size, len(sequence) - 3)
+        for i, score in enumerate(scores):
+            window = sequence[i:i+4]
+            if 'N' in window:
+                self.assertEqual(score, np.iinfo(np.int64).min)
+                continue
+            expected = sum(table.motif_scores[j, 'ACGT'.index(x)] for j, x in enumerate(window))
+            self.assertEqual(score, expected - bg_logp[i:i+4].sum())
+
+    def test_planted_motifs(self):
+        sequences = self.random_sequences(20, 200)
+        name, seq = sequences[3]
+        sequences[3] = (name, seq[:50] + 'ACGT' + seq[54:])
+        name, seq = sequences[7]
+        sequences[7] = (name, seq[:100] + 'TCC' + seq[103:])
+        hits = scan_motifs.scan(self.motifs, sequences, thresh=2e-2)
+        found = {(h.motif.alt_id, h.sequence_name, h.start, h.strand) for h in hits}
+        self.assertIn(('TFA', 'seq_3', 51, '+'), found)
+        # ACGT is its own reverse complement
+        self.assertIn(('TFA', 'seq_3', 51, '-'), found)
+        self.assertIn(('TFB', 'seq_7', 101, '-'), found)
+        for hit in hits:
+            self.assertLess(hit.pvalue, 2e-2)
+            self.assertGreaterEqual(hit.qvalue, hit.pvalue)
+        pvalues = [h.pvalue for h in hits]
+        self.assertEqual(pvalues, sorted(pvalues))
+
+    def test_reverse_strand_match(self):
+        self.assertEqual(scan_motifs.reverse_complement('ACCGTn'), 'nACGGT')
+        # TFB (GGA) matches TCC on the reverse strand; FIMO reports the motif-strand sequence
+        sequences = [('seq', 'ATATATTCCATATAT')]
+        hits = scan_motifs.scan(self.motifs, sequences, thresh=2e-2)
+        hit = [h for h in hits if h.motif.alt_id == 'TFB' and h.strand == '-'][0]
+        self.assertEqual((hit.start, hit.stop), (7, 9))
+        self.assertEqual(hit.matched, 'GGA')
+
+    def test_parallel(self):
+        sequences = self.random_sequences(30, 100, seed=1)
+        serial = scan_motifs.scan(self.motifs, sequences, self.background, thresh=1e-2)
+        parallel = scan_motifs.scan(self.motifs, sequences, self.background, thresh=1e-2,
+                                    n_jobs=2, chunk_size=500)
+        self.assertEqual([h.row() for h in serial], [h.row() for h in parallel])
+
+    def test_benjamini_hochberg(self):
+        qvalues = scan_motifs.benjamini_hochberg([0.01, 0.001, 0.04], 10)
+        np.testing.assert_allclose(qvalues, [0.05, 0.01, 0.4/3])
+
+    def test_fimo_tsv(self):
+        sequences = self.random_sequences(10, 100, seed=2)
+        hits = scan_motifs.scan(self.motifs, sequences, self.background, thresh=1e-2)
+        outfile = os.path.join(self.tmpdir.name, 'fimo.tsv')
+        scan_motifs.write_fimo_tsv(hits, outfile)
+        from_file = cres_to_network.parse_tf_te_fimo(outfile, 1.0)
+        from_records = cres_to_network.parse_tf_te_fimo([h.record() for h in hits], 1.0)
+        self.assertEqual(from_file, from_records)
+        self.assertEqual(set(from_file), {h.motif.alt_id for h in hits})
+
+        # Motifs without alt ID (e.g. from CisBP) are named by motif ID either way
+        motifs = [scan_motifs.Motif(m.motif_id, m.probs) for m in self.motifs]
+        hits = scan_motifs.scan(motifs, sequences, self.background, thresh=1e-2)
+        scan_motifs.write_fimo_tsv(hits, outfile)
+        from_file = cres_to_network.parse_tf_te_fimo(outfile, 1.0)
+        from_records = cres_to_network.parse_tf_te_fimo([h.record() for h in hits], 1.0)
+        self.assertEqual(from_file, from_records)
+        self.assertEqual(set(from_file), {'MA0001.1', 'MA0002.1'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from zfnetwork import grn, ode, sensitivity
+
+
+class TestSensitivity(unittest.TestCase):
+
+    def setUp(self):
+        # Two independent TFs; the output is dominated by A, C has no effect
+        self.znf_grn = grn.ZincFingerGRN()
+        self.znf_grn.from_edge_list([('A', 'B'), ('C', 'D')],
+                                    {'A': 'TF', 'B': 'TE', 'C': 'TF', 'D': 'TE'})
+        for label, beta in ('A', 10.0), ('B', 1.0), ('C', 1.0):
+            self.znf_grn[label].beta = beta
+        self.compiled = ode.CompiledGRN.from_grn(self.znf_grn)
+        self.factors = [('beta[A]', 'beta', [0]), ('gamma[A]', 'gamma', [0]),
+                        ('beta[C]', 'beta', [1])]
+        self.space = sensitivity.ParameterSpace(self.compiled, self.factors)
+        self.output = sensitivity.FinalPopulation([0])
+
+    def test_parameter_space(self):
+        self.assertEqual(len(sensitivity.entry_factors(self.compiled)), 4*2 + 2*2)
+        grouped = sensitivity.grouped_factors(self.compiled, params=('gamma', 'k'))
+        self.assertEqual([name for name, _, _ in grouped], ['gamma[TF]', 'gamma[TE]', 'k[TF->TE]'])
+
+        params = self.space.transform([[0.0, 0.5, 1.0], [0.5, 0.5, 0.5]])
+        self.assertEqual(params['beta'].shape, (2, 4))
+        self.assertTrue(np.allclose(params['beta'][:, 0], [5.0, 10.0]))
+        self.assertTrue(np.allclose(params['beta'][:, 1], [2.0, 1.0]))
+        self.assertTrue(np.allclose(params['gamma'][:, 0], [0.1, 0.1]))
+        self.assertTrue(np.allclose(params['beta'][:, 2:], 1.0))
+
+    def test_sobol(self):
+        evaluator = sensitivity.ODEEvaluator(self.compiled, duration=100.0, dt=0.5)
+        result = sensitivity.sobol_indices(self.space, evaluator, self.output, n_samples=512)
+        self.assertEqual(result.n_evaluations, 512*5)
+        ranked = [name for name, _ in result.ranked()]
+        self.assertEqual(ranked[2], 'beta[C]')
+        first, total = result.indices['S1'], result.indices['ST']
+        # Steady state beta/gamma is additive in log space, with equal log ranges
+        self.assertAlmostEqual(first[0], 0.5, delta=0.1)
+        self.assertAlmostEqual(first[1], 0.5, delta=0.1)
+        self.assertAlmostEqual(total[2], 0.0, delta=1e-6)
+        self.assertTrue(np.all(result.indices['ST_conf'] >= 0))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            outfile = os.path.join(tmpdir, 'sobol.tsv')
+            result.write_tsv(outfile)
+            with open(outfile) as input:
+                lines = input.read().splitlines()
+        self.assertEqual(lines[0], 'factor\tS1\tS1_conf\tST\tST_conf')
+        self.assertEqual(lines[-1].split('\t')[0], 'beta[C]')
+
+    def test_morris(self):
+        evaluator = sensitivity.ODEEvaluator(self.compiled, duration=100.0, dt=0.5, n_jobs=2)
+        result = sensitivity.morris_indices(self.space, evaluator, self.output, n_trajectories=10)
+        self.assertEqual(result.n_evaluations, 10*4)
+        self.assertEqual(result.ranked()[-1], ('beta[C]', 0.0))
+        mu = result.indices['mu']
+        self.assertGreater(mu[0], 0)
+        self.assertLess(mu[1], 0)
+
+    def test_ssa_common_random_numbers(self):
+        evaluator = sensitivity.SSAEvaluator(self.znf_grn, duration=10, replicates=3, seed=5)
+        params = self.space.transform([[0.5, 0.5, 0.5], [0.5, 0.5, 0.5], [1.0, 0.5, 0.5]])
+        outputs = evaluator(params, self.output)
+        # Same seed for every parameter set
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertGreater(outputs[2], outputs[0])
+        other_seed = sensitivity.SSAEvaluator(self.znf_grn, duration=10, replicates=3, seed=6)
+        self.assertNotEqual(other_seed(params, self.output)[0], outputs[0])
+        self.assertEqual(self.znf_grn['A'].pop, 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
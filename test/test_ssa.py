@@ -1,6 +1,10 @@
+import io
+import os
+import tempfile
 from zfnetwork import ssa, grn
 import numpy as np
 import unittest
+from unittest import mock
 
 
 class TestGillespieMethods(unittest.TestCase):
@@ -99,6 +103,38 @@ class TestGillespieMethods(unittest.TestCase):
         self.assertNotEqual(event_idx, None)
         self.assertNotEqual(tau, np.inf)
 
+    def test_cluster_propensities(self):
+        """Propensities of cluster members computed together match those of each member."""
+        znf_grn = grn.ZincFingerGRN(2, 6, 2)
+        np.random.seed(2)
+        znf_grn.generate_erdos_renyi(0.5)
+        znf_grn.add_cluster('chr1_0', znf_grn.zfs[:4])
+        znf_grn.add_tf_edge(znf_grn.tfs[1], znf_grn.zfs[4])
+        for tf in znf_grn.tfs:
+            tf.pop = 10
+        simulation = ssa.GillespieSSA(znf_grn)
+        self.assertEqual(len(simulation._shared), 1)
+        simulation.gillespie_ssa(20)
+        expected = [rate for node in znf_grn.nodes
+                    for rate in (simulation.production_rate(node), node.gamma*node.pop)]
+        self.assertTrue(np.allclose(simulation.propensities, expected))
+
+    def test_update_dependents(self):
+        """Propensities updated after each reaction match a full recomputation."""
+        znf_grn = grn.ZincFingerGRN(3, 8, 3)
+        np.random.seed(4)
+        znf_grn.generate_erdos_renyi(0.4)
+        for tf in znf_grn.tfs:
+            tf.pop = 10
+        simulation = ssa.GillespieSSA(znf_grn)
+        for _ in range(200):
+            event_idx = simulation.gillespie_draw()[0]
+            znf_grn.nodes[event_idx//2].pop += 1 if event_idx % 2 == 0 else -1
+            simulation.update_dependents(event_idx//2)
+        propensities = simulation.propensities.copy()
+        simulation.update_propensities()
+        self.assertTrue(np.allclose(propensities, simulation.propensities))
+
 
 class TestGillespieOutcomes(unittest.TestCase):
     
@@ -141,5 +177,117 @@ class TestGillespieOutcomes(unittest.TestCase):
         self.assertAlmostEqual(plog.mean(axis=0)[-1, 0], 10.0, delta=2)
         self.assertAlmostEqual(plog.mean(axis=0)[-1, 1], 2.5, delta=1)
 
+    def test_run_components(self):
+        znf_grn = grn.ZincFingerGRN()
+        node_types = {'A': 'TF', 'B': 'ZF', 'C': 'TF', 'D': 'ZF'}
+        znf_grn.from_edge_list([('A', 'B'), ('C', 'D')], node_types)
+        znf_grn.tes.append(grn.Node('E', ntype='TE', pop=0, gamma=0.5))
+        for label in 'AC':
+            znf_grn[label].pop = 10
+            znf_grn[label].beta = 10.0
+            znf_grn[label].gamma = 1.0
+        for label in 'BD':
+            znf_grn[label].beta = 5.0
+            znf_grn[label].gamma = 2.0
+
+        simulation = ssa.GillespieSSA(znf_grn)
+        for n_jobs in (1, 2):
+            tlog, plog = simulation.run_components(25, 100, n_jobs=n_jobs)
+            self.assertEqual(plog.shape, (100, 25, 5))
+            self.assertEqual(list(tlog[0]), list(range(25)))
+            # Node order is A, C, B, D, E
+            means = plog.mean(axis=0)[-1]
+            self.assertAlmostEqual(means[0], 10.0, delta=2)
+            self.assertAlmostEqual(means[1], 10.0, delta=2)
+            self.assertAlmostEqual(means[2], 2.5, delta=1)
+            self.assertAlmostEqual(means[3], 2.5, delta=1)
+            # Isolated non-TF node is produced at unit rate, see update_propensities
+            self.assertAlmostEqual(means[4], 2.0, delta=0.5)
+        self.assertEqual(znf_grn['A'].pop, 10)
+
+        # Simulating in this process leaves the caller's random stream as a pool would
+        draws = []
+        for n_jobs in (1, 2):
+            np.random.seed(3)
+            simulation.run_components(5, 2, n_jobs=n_jobs)
+            draws.append(np.random.random())
+        self.assertEqual(draws[0], draws[1])
+
+    def test_birth_death(self):
+        plog = ssa.birth_death(0.0, np.log(2)/10.0, 1000, 11, 200)
+        self.assertAlmostEqual(plog.mean(axis=0)[-1], 500, delta=10)
+        plog = ssa.birth_death(4.0, 0.0, 0, 6, 1000)
+        self.assertAlmostEqual(plog.mean(axis=0)[-1], 20, delta=1)
+        plog = ssa.birth_death(0.0, np.log(2)/10.0, 1000, 10.5, 200, sample_interval=0.5)
+        self.assertEqual(plog.shape, (200, 21))
+        self.assertAlmostEqual(plog.mean(axis=0)[-1], 500, delta=10)
+
+
+class TestRecording(unittest.TestCase):
+
+    def setUp(self):
+        self.znf_grn = grn.ZincFingerGRN()
+        node_types = {'A': 'TF', 'B': 'ZF', 'C': 'TE'}
+        self.znf_grn.from_edge_list([('A', 'B'), ('B', 'C')], node_types)
+        self.znf_grn['A'].pop = 5
+        self.znf_grn['A'].beta = 5.0
+        self.znf_grn['C'].pop = 3
+        self.state = self.znf_grn.save_state()
+        self.simulation = ssa.GillespieSSA(self.znf_grn)
+
+    def test_sample_interval(self):
+        tlog, plog = self.simulation.run(5, 3, sample_interval=0.25)
+        self.assertEqual(plog.shape, (3, 20, 4))
+        self.assertTrue(np.allclose(tlog[0], np.arange(20)*0.25))
+        self.assertEqual(list(plog[0, 0]), [5, 0, 0, 3])
+
+        # Default grid is unchanged: one sample per unit time
+        tlog, plog = self.simulation.run(10, 2)
+        self.assertEqual(list(tlog[0]), list(range(10)))
+
+    def test_record_subset(self):
+        tlog, plog = self.simulation.run(10, 2, record=self.znf_grn.tes)
+        self.assertEqual(plog.shape, (2, 10, 1))
+        # run() leaves the network in its final state
+        self.znf_grn.load_state(self.state)
+        tlog, plog = self.simulation.run(10, 2, record=['C', 'A'])
+        self.assertEqual(list(plog[0, 0]), [3, 5])
+
+    def test_progress(self):
+        for progress in True, False:
+            with mock.patch('sys.stderr', new_callable=io.StringIO) as stderr, \
+                    mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+                self.simulation.run(2, 6, progress=progress)
+            self.assertEqual(stderr.getvalue(), 'rep: 0\rrep: 5\r' if progress else '')
+            self.assertEqual(stdout.getvalue(), '')
+
+    def test_record_components(self):
+        tlog, plog = self.simulation.run_components(10, 2, sample_interval=0.5, record=['C', 'A'])
+        self.assertEqual(plog.shape, (2, 20, 2))
+        self.assertEqual(list(plog[0, 0]), [3, 5])
+
+    def test_event_log(self):
+        np.random.seed(1)
+        tlog, plog, log = self.simulation.gillespie_ssa(20, sample_interval=0.1, event_log=True)
+        self.assertGreater(len(log), 0)
+        self.assertTrue(np.all(np.diff(log.times) > 0))
+        self.assertLessEqual(log.times[-1], 20)
+        self.assertEqual(log.reactions.dtype, np.uint8)
+        # Any grid can be reconstructed from the log, including the recorded one
+        self.assertTrue(np.array_equal(log.populations(tlog), plog))
+        self.assertTrue(np.array_equal(log.populations(tlog[::7], nodes=[3, 0]),
+                                       plog[::7][:, [3, 0]]))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            outfile = os.path.join(tmpdir, 'events.npz')
+            log.save(outfile)
+            loaded = ssa.EventLog.load(outfile)
+        self.assertTrue(np.array_equal(loaded.populations(tlog), plog))
+
+        # The log alone can be kept without recording populations on a grid
+        tlog, plog, logs = self.simulation.run(20, 2, record=[], event_log=True)
+        self.assertEqual(plog.shape, (2, 20, 0))
+        self.assertEqual(len(logs), 2)
+
 if __name__ == '__main__':
     unittest.main(verbosity=3)
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from zfnetwork import grn, ssa
+
+"""
+Batch stochastic simulation of many networks (e.g. one per species) on a shared process pool.
+
+Networks are read from JSON files holding ZincFingerGRN.to_dict() representations. Their replicates
+are split into chunks, which are submitted largest network first so that the longest tasks do not
+start last and leave workers idle at the end. Results of every network go to a single SQLite file.
+"""
+
+
+def save_network(zf_grn, outfile):
+    """Write network to a JSON file, as returned by ZincFingerGRN.to_dict()."""
+    with open(outfile, 'w') as output:
+        json.dump(zf_grn.to_dict(), output)
+
+
+def load_network(infile):
+    """Read network representation written by save_network()."""
+    with open(infile) as input:
+        return json.load(input)
+
+
+def network_size(netdict):
+    """Cost estimate of simulating a network: its number of nodes plus edges."""
+    return len(netdict['nodes']) + len(netdict['edges'])
+
+
+def chunk_seed(seed, name, first):
+    """Seed of the chunk of replicates of a network starting at replicate first.
+
+    Seeds depend only on these values, so a network's trajectories do not change when other
+    networks are added to or skipped from a batch.
+    """
+    name_key = int(hashlib.sha1(name.encode()).hexdigest()[:16], 16)
+    return int(np.random.SeedSequence(seed, spawn_key=(name_key, first)).generate_state(1)[0])
+
+
+def _simulate_chunk(netdict, duration, replicates, seed, sample_interval):
+    """Simulate one chunk of replicates of a network, as a pool task.
+
+    Returns:
+        pop_log: array of shape (replicates, samples, nodes)
+        n_events: number of reactions fired
+        seconds: time spent simulating
+    """
+    start = time.perf_counter()
+    np.random.seed(seed)
+    simulation = ssa.GillespieSSA(grn.ZincFingerGRN.from_dict(netdict))
+    pop_log = simulation.run(duration, replicates, sample_interval=sample_interval,
+                             progress=False)[1]
+    return pop_log, simulation.n_events, time.perf_counter() - start
+
+
+class ResultStore:
+    """SQLite file holding simulated trajectories of many networks.
+
+    Table `networks` has one row per completed network, with its simulation settings, size, event
+    count and CPU time. Table `nodes` lists node labels in simulation order, and table
+    `trajectories` holds one float64 array of shape (samples, nodes) per replicate. Networks are
+    only listed once all their replicates are stored, so an interrupted batch can be resumed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS networks (
+                name TEXT PRIMARY KEY, n_nodes INTEGER, n_edges INTEGER, duration REAL,
+                sample_interval REAL, replicates INTEGER, n_events INTEGER, seconds REAL);
+            CREATE TABLE IF NOT EXISTS nodes (
+                network TEXT, idx INTEGER, label TEXT, ntype TEXT, PRIMARY KEY (network, idx));
+            CREATE TABLE IF NOT EXISTS trajectories (
+                network TEXT, replicate INTEGER, pop BLOB, PRIMARY KEY (network, replicate));
+            CREATE INDEX IF NOT EXISTS nodes_label ON nodes (label);
+        ''')
+
+    def networks(self):
+        """Names of completed networks."""
+        return [row[0] for row in
+                self.connection.execute('SELECT name FROM networks ORDER BY name')]
+
+    def info(self, name):
+        """Dictionary of the networks table row of a network, or None if not completed."""
+        cursor = self.connection.execute('SELECT * FROM networks WHERE name = ?', (name,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([column[0] for column in cursor.description], row))
+
+    def clear(self, name):
+        """Remove all rows of a network, e.g. partial results of an interrupted run."""
+        for table, column in ('networks', 'name'), ('nodes', 'network'), ('trajectories', 'network'):
+            self.connection.execute(f'DELETE FROM {table} WHERE {column} = ?', (name,))
+        self.connection.commit()
+
+    def add_replicates(self, name, first, pop_log):
+        """Store replicates first, first + 1, ... of a network from an array (replicates, samples,
+        nodes)."""
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO trajectories VALUES (?, ?, ?)',
+            [(name, first + i, np.ascontiguousarray(pop, dtype=np.float64).tobytes())
+             for i, pop in enumerate(pop_log)])
+        self.connection.commit()
+
+    def complete(self, name, netdict, duration, sample_interval, replicates, n_events, seconds):
+        """Record a network as completed, once all its replicates are stored."""
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO nodes VALUES (?, ?, ?, ?)',
+            [(name, i, node['label'], node['ntype']) for i, node in enumerate(netdict['nodes'])])
+        self.connection.execute(
+            'INSERT OR REPLACE INTO networks VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (name, len(netdict['nodes']), len(netdict['edges']), duration, sample_interval,
+             replicates, n_events, seconds))
+        self.connection.commit()
+
+    def load(self, name, replicates=None):
+        """Trajectories of a completed network.
+
+        Args:
+            replicates: optional list of replicate indices (default: all)
+
+        Returns:
+            time_log: array of sample times
+            pop_log: array of shape (replicates, samples, nodes)
+            labels: node labels
+        """
+        info = self.info(name)
+        if info is None:
+            raise KeyError(f'{name} is not in {self.path}')
+        time_log = ssa.sample_times(info['duration'], info['sample_interval'])
+        labels = [row[0] for row in self.connection.execute(
+            'SELECT label FROM nodes WHERE network = ? ORDER BY idx', (name,))]
+        if replicates is None:
+            replicates = range(info['replicates'])
+        pop_log = np.zeros((len(replicates), time_log.size, len(labels)))
+        for i, replicate in enumerate(replicates):
+            row = self.connection.execute(
+                'SELECT pop FROM trajectories WHERE network = ? AND replicate = ?',
+                (name, int(replicate))).fetchone()
+            pop_log[i] = np.frombuffer(row[0], dtype=np.float64).reshape(time_log.size, -1)
+        return time_log, pop_log, labels
+
+    def close(self):
+        self.connection.close()
+
+
+def simulate_batch(networks, store, duration, replicates, sample_interval=1.0, chunk_size=None,
+                   n_jobs=None, seed=0, log=None):
+    """Simulate replicates of many networks on one process pool, writing results to store.
+
+    Args:
+        networks: dictionary mapping names to network representations (ZincFingerGRN.to_dict())
+            or to JSON files written by save_network()
+        store: ResultStore; networks it already holds are skipped
+        duration, replicates, sample_interval: as for GillespieSSA.run()
+        chunk_size: replicates per task (default: all replicates of a network in one task). Smaller
+            chunks spread a few large networks across more workers.
+        n_jobs: number of worker processes; 1 runs everything in this process
+        seed: seed from which each chunk's seed is derived, together with the network name and
+            first replicate of the chunk (see chunk_seed())
+        log: optional file object for progress reports
+
+    Returns:
+        dictionary with the number of networks simulated, skipped and failed, the number of
+            events, wall time in seconds and throughput in networks and events per second. Failed
+            networks are not marked as completed in the store, so they are retried by the next
+            run.
+    """
+    start = time.perf_counter()
+    done = set(store.networks())
+    netdicts = {}
+    for name, network in networks.items():
+        if name in done:
+            continue
+        netdicts[name] = load_network(network) if isinstance(network, str) else network
+        store.clear(name)
+
+    # Largest networks first, each split into chunks of replicates
+    chunk_size = chunk_size or replicates
+    order = sorted(netdicts, key=lambda name: -network_size(netdicts[name]))
+    tasks = [(name, first, min(chunk_size, replicates - first))
+             for name in order for first in range(0, replicates, chunk_size)]
+    seeds = [chunk_seed(seed, name, first) for name, first, _ in tasks]
+    remaining = {name: -(-replicates//chunk_size) for name in order}
+    totals = {name: [0, 0.0] for name in order}
+    failed = set()
+
+    def collect(task, result, error=None):
+        name, first, _ = task
+        if name in failed:
+            return
+        if error is not None:
+            failed.add(name)
+            if log is not None:
+                log.write(f'{name}\tfailed: {type(error).__name__}: {error}\n')
+            return
+        pop_log, n_events, seconds = result
+        store.add_replicates(name, first, pop_log)
+        totals[name][0] += n_events
+        totals[name][1] += seconds
+        remaining[name] -= 1
+        if remaining[name] == 0:
+            store.complete(name, netdicts[name], duration, sample_interval, replicates,
+                           *totals[name])
+            if log is not None:
+                log.write(f'{name}\t{network_size(netdicts[name])}\t{totals[name][0]} events\t'
+                          f'{totals[name][1]:.3g} s\n')
+
+    # A failing task is reported and its network dropped, without stopping the batch
+    if n_jobs == 1:
+        for task, task_seed in zip(tasks, seeds):
+            try:
+                result = _simulate_chunk(netdicts[task[0]], duration, task[2], task_seed,
+                                         sample_interval)
+            except Exception as error:
+                collect(task, None, error)
+            else:
+                collect(task, result)
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            futures = {pool.submit(_simulate_chunk, netdicts[task[0]], duration, task[2],
+                                   task_seed, sample_interval): task
+                       for task, task_seed in zip(tasks, seeds)}
+            # Completed futures are dropped, so that results are freed once stored
+            for future in as_completed(futures):
+                task = futures.pop(future)
+                error = future.exception()
+                collect(task, None if error else future.result(), error)
+
+    seconds = time.perf_counter() - start
+    completed = [name for name in order if name not in failed]
+    n_events = sum(totals[name][0] for name in completed)
+    summary = {'networks': len(completed), 'skipped': len(networks) - len(order),
+               'failed': len(failed), 'events': n_events, 'seconds': seconds,
+               'networks_per_second': len(completed)/seconds if seconds > 0 else 0.0,
+               'events_per_second': n_events/seconds if seconds > 0 else 0.0}
+    if log is not None:
+        log.write(f'{summary["networks"]} networks ({summary["skipped"]} skipped, '
+                  f'{summary["failed"]} failed), '
+                  f'{n_events} events in {seconds:.3g} s: '
+                  f'{summary["networks_per_second"]:.3g} networks/s, '
+                  f'{summary["events_per_second"]:.3g} events/s\n')
+    return summary
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Simulate many serialized networks and store trajectories in one SQLite file.')
+    parser.add_argument('networks', nargs='+',
+                        help='JSON network files; each is named after its file name')
+    parser.add_argument('-o', '--output', required=True, help='SQLite results file')
+    parser.add_argument('-d', '--duration', type=float, default=100.0)
+    parser.add_argument('-r', '--replicates', type=int, default=10)
+    parser.add_argument('-s', '--sample-interval', type=float, default=1.0)
+    parser.add_argument('-c', '--chunk-size', type=int, default=None,
+                        help='replicates per task (default: all replicates of a network)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    networks = {os.path.splitext(os.path.basename(path))[0]: path for path in args.networks}
+    store = ResultStore(args.output)
+    try:
+        simulate_batch(networks, store, args.duration, args.replicates, args.sample_interval,
+                       args.chunk_size, args.jobs, args.seed, log=sys.stderr)
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from zfnetwork import grn, ode
+
+"""
+Population-level simulation of KZFP-TE arms races.
+
+Every individual is a sub-network of a fixed universe network with n_tfs TFs, max_zfs ZF slots and
+n_tes TEs, in which every TF can activate every ZF and every ZF can silence every TE through its
+own heterochromatin node. Individuals differ only in which ZFs and edges are present and in their
+parameter arrays, so a whole population is a handful of arrays: selection copies rows, mutations
+flip or scale entries, and fitness is evaluated for the whole population at once from the exact
+steady state of the mean-field model (CompiledGRN.steady_state).
+"""
+
+
+class ArmsRaceModel:
+    """Universe network and index tables shared by all individuals."""
+
+    def __init__(self, n_tfs=1, max_zfs=10, n_tes=10):
+        """ArmsRaceModel constructor
+
+        Args:
+            n_tfs: number of TFs, each able to activate every ZF
+            max_zfs: maximum number of ZF genes per individual
+            n_tes: number of TE families
+
+        Returns:
+            ArmsRaceModel instance
+        """
+        self.n_tfs, self.max_zfs, self.n_tes = n_tfs, max_zfs, n_tes
+        self.zf_grn = grn.ZincFingerGRN(n_tfs, max_zfs, n_tes)
+        for tf in self.zf_grn.tfs:
+            for zf in self.zf_grn.zfs:
+                self.zf_grn.add_tf_edge(tf, zf)
+        for zf in self.zf_grn.zfs:
+            for te in self.zf_grn.tes:
+                self.zf_grn.add_zf_edge(zf, te)
+        self.compiled = ode.CompiledGRN.from_grn(self.zf_grn)
+
+        # Node and edge indices, following the order in which they were created above
+        self.zf_nodes = n_tfs + np.arange(max_zfs)
+        self.het_nodes = (n_tfs + max_zfs + np.arange(max_zfs*n_tes)).reshape(max_zfs, n_tes)
+        self.te_nodes = n_tfs + max_zfs + max_zfs*n_tes + np.arange(n_tes)
+        self.tf_edges = np.arange(n_tfs*max_zfs).reshape(n_tfs, max_zfs)
+        zf_edges = n_tfs*max_zfs + np.arange(2*max_zfs*n_tes).reshape(max_zfs, n_tes, 2)
+        self.binding_edges = zf_edges[:, :, 0]    # ZF -> Het
+        self.silencing_edges = zf_edges[:, :, 1]  # Het -> TE
+
+    def masks(self, population):
+        """Edge and node activity masks of every individual, for CompiledGRN."""
+        size = population.size
+        tf_active = population.tf_edges & population.zf_present[:, None, :]
+        zf_active = population.zf_edges & population.zf_present[:, :, None]
+        edge_active = np.zeros((size, self.compiled.n_edges), dtype=bool)
+        edge_active[:, self.tf_edges.ravel()] = tf_active.reshape(size, -1)
+        edge_active[:, self.binding_edges.ravel()] = zf_active.reshape(size, -1)
+        edge_active[:, self.silencing_edges.ravel()] = zf_active.reshape(size, -1)
+        node_active = np.ones((size, self.compiled.n_nodes), dtype=bool)
+        node_active[:, self.zf_nodes] = population.zf_present
+        node_active[:, self.het_nodes.ravel()] = zf_active.reshape(size, -1)
+        return edge_active, node_active
+
+    def parameters(self, population):
+        """Parameter arrays of every individual, including activity masks."""
+        edge_active, node_active = self.masks(population)
+        return {'pop': np.zeros(population.beta.shape), 'beta': population.beta,
+                'gamma': population.gamma, 'k': population.k, 'n': population.n,
+                'edge_active': edge_active, 'node_active': node_active}
+
+    def to_grn(self, population, i):
+        """ZincFingerGRN of individual i, containing only its present nodes and edges."""
+        edge_active, node_active = self.masks(population.take([i]))
+        netdict = self.zf_grn.to_dict()
+        for j, node in enumerate(netdict['nodes']):
+            node.update(pop=0, beta=population.beta[i, j], gamma=population.gamma[i, j])
+        netdict['edges'] = [(x, y, population.k[i, j], population.n[i, j])
+                            for j, (x, y, _, _) in enumerate(netdict['edges']) if edge_active[0, j]]
+        # Renumber nodes after dropping inactive ones
+        kept = np.flatnonzero(node_active[0])
+        new_index = {old: new for new, old in enumerate(kept)}
+        netdict['nodes'] = [netdict['nodes'][j] for j in kept]
+        netdict['edges'] = [(new_index[x], new_index[y], k, n) for x, y, k, n in netdict['edges']]
+        return grn.ZincFingerGRN.from_dict(netdict)
+
+
+class Population:
+    """Arrays describing a population of networks within an ArmsRaceModel universe."""
+
+    def __init__(self, zf_present, tf_edges, zf_edges, beta, gamma, k, n):
+        """Population constructor
+
+        Args:
+            zf_present: boolean array (size, max_zfs) of ZF genes present in each individual
+            tf_edges: boolean array (size, n_tfs, max_zfs) of TF -> ZF activation edges
+            zf_edges: boolean array (size, max_zfs, n_tes) of ZF -> TE silencing edges
+            beta, gamma: node parameter arrays (size, n_nodes) in universe node order
+            k, n: edge parameter arrays (size, n_edges) in universe edge order
+
+        Returns:
+            Population instance
+        """
+        self.zf_present = zf_present
+        self.tf_edges = tf_edges
+        self.zf_edges = zf_edges
+        self.beta = beta
+        self.gamma = gamma
+        self.k = k
+        self.n = n
+
+    @classmethod
+    def initial(cls, model, size, n_zfs=1):
+        """Population of identical individuals with n_zfs ZFs activated by every TF and no TE
+        targets, with the universe's default parameters."""
+        zf_present = np.zeros((size, model.max_zfs), dtype=bool)
+        zf_present[:, :n_zfs] = True
+        params = model.compiled.parameters(batch_size=size)
+        return cls(zf_present,
+                   np.ones((size, model.n_tfs, model.max_zfs), dtype=bool),
+                   np.zeros((size, model.max_zfs, model.n_tes), dtype=bool),
+                   params['beta'], params['gamma'], params['k'], params['n'])
+
+    @property
+    def size(self):
+        return self.zf_present.shape[0]
+
+    def take(self, indices):
+        """New population made of copies of the given individuals (e.g. selected parents)."""
+        return Population(*[array[indices] for array in (self.zf_present, self.tf_edges,
+                                                          self.zf_edges, self.beta, self.gamma,
+                                                          self.k, self.n)])
+
+
+def _random_true(mask, rng):
+    """Uniformly random True column of each row of mask (rows without one get index 0).
+
+    Returns:
+        indices: array of column indices
+        valid: boolean array, True for rows with at least one True entry
+    """
+    scores = np.where(mask, rng.uniform(size=mask.shape), -1.0)
+    return scores.argmax(axis=1), mask.any(axis=1)
+
+
+def _steady_te_load(compiled, params, te_nodes):
+    """Total steady-state TE population of each individual; module-level for worker processes."""
+    return compiled.steady_state(params)[:, te_nodes].sum(axis=1)
+
+
+class Evolution:
+    """Wright-Fisher evolution of a population under mutation and selection against TE load."""
+
+    def __init__(self, model, population, duplication=0.01, loss=0.01, gain=0.05, escape=0.05,
+                 drift=0.05, drift_sigma=0.1, zf_cost=1.0, edge_cost=0.1, selection=1.0,
+                 n_jobs=1, seed=0):
+        """Evolution constructor
+
+        Args:
+            model: ArmsRaceModel
+            population: initial Population
+            duplication: per-individual probability per generation of duplicating a ZF (with its
+                regulation, targets and parameters) into an empty slot
+            loss: probability of losing a ZF
+            gain: probability of a present ZF acquiring a new TE target
+            escape: probability of a TE escaping one of its silencing ZFs (edge loss)
+            drift: probability of each drifting parameter (ZF beta, ZF-TE binding k) being
+                multiplied by a log-normal factor
+            drift_sigma: standard deviation of the log of drift factors
+            zf_cost, edge_cost: fitness cost of each ZF gene and each ZF -> TE edge
+            selection: strength of selection; parents are drawn with probability proportional
+                to exp(selection*fitness)
+            n_jobs: number of worker processes used to evaluate fitness
+
+        Returns:
+            Evolution instance
+        """
+        self.model = model
+        self.population = population
+        self.duplication, self.loss, self.gain, self.escape = duplication, loss, gain, escape
+        self.drift, self.drift_sigma = drift, drift_sigma
+        self.zf_cost, self.edge_cost = zf_cost, edge_cost
+        self.selection = selection
+        self.n_jobs = n_jobs
+        self.rng = np.random.RandomState(seed)
+        self.generation = 0
+        self.history = {key: [] for key in ('mean_fitness', 'max_fitness', 'mean_te_load',
+                                            'mean_zfs', 'mean_targets')}
+
+    def te_load(self, population, pool=None):
+        """Steady-state TE load of every individual."""
+        params = self.model.parameters(population)
+        if pool is None:
+            return _steady_te_load(self.model.compiled, params, self.model.te_nodes)
+        chunks = np.array_split(np.arange(population.size), self.n_jobs)
+        results = pool.map(_steady_te_load, [self.model.compiled]*len(chunks),
+                           [{name: value[idx] for name, value in params.items()} for idx in chunks],
+                           [self.model.te_nodes]*len(chunks))
+        return np.concatenate(list(results))
+
+    def fitness(self, population, pool=None):
+        """Fitness (negative TE load minus ZF and edge costs) and TE load of every individual."""
+        te_load = self.te_load(population, pool)
+        n_zfs = population.zf_present.sum(axis=1)
+        n_targets = (population.zf_edges & population.zf_present[:, :, None]).sum(axis=(1, 2))
+        return -te_load - self.zf_cost*n_zfs - self.edge_cost*n_targets, te_load
+
+    def mutate(self, population):
+        """Apply mutation operators in place, each to a random subset of individuals."""
+        model, rng, size = self.model, self.rng, population.size
+        rows = np.arange(size)
+
+        # ZF duplication into an empty slot
+        src, has_src = _random_true(population.zf_present, rng)
+        dst, has_dst = _random_true(~population.zf_present, rng)
+        r = rows[(rng.uniform(size=size) < self.duplication) & has_src & has_dst]
+        src, dst = src[r], dst[r]
+        population.zf_present[r, dst] = True
+        population.tf_edges[r, :, dst] = population.tf_edges[r, :, src]
+        population.zf_edges[r, dst, :] = population.zf_edges[r, src, :]
+        for array, index in ((population.beta, model.zf_nodes[:, None]),
+                             (population.gamma, model.zf_nodes[:, None]),
+                             (population.beta, model.het_nodes),
+                             (population.gamma, model.het_nodes),
+                             (population.k, model.tf_edges.T),
+                             (population.n, model.tf_edges.T),
+                             (population.k, model.binding_edges),
+                             (population.n, model.binding_edges),
+                             (population.k, model.silencing_edges),
+                             (population.n, model.silencing_edges)):
+            array[r[:, None], index[dst]] = array[r[:, None], index[src]]
+
+        # ZF loss
+        z, has_zf = _random_true(population.zf_present, rng)
+        r = rows[(rng.uniform(size=size) < self.loss) & has_zf]
+        population.zf_present[r, z[r]] = False
+        population.tf_edges[r, :, z[r]] = False
+        population.zf_edges[r, z[r], :] = False
+
+        # New ZF -> TE edge
+        z, has_zf = _random_true(population.zf_present, rng)
+        t = rng.randint(model.n_tes, size=size)
+        r = rows[(rng.uniform(size=size) < self.gain) & has_zf]
+        population.zf_edges[r, z[r], t[r]] = True
+
+        # TE escape from one of the ZFs silencing it
+        active = (population.zf_edges & population.zf_present[:, :, None]).reshape(size, -1)
+        edge, has_edge = _random_true(active, rng)
+        r = rows[(rng.uniform(size=size) < self.escape) & has_edge]
+        z, t = np.unravel_index(edge[r], (model.max_zfs, model.n_tes))
+        population.zf_edges[r, z, t] = False
+
+        # Parameter drift of ZF expression and ZF-TE binding affinity
+        for array, index in ((population.beta, model.zf_nodes),
+                             (population.k, model.silencing_edges.ravel())):
+            drifting = rng.uniform(size=(size, index.size)) < self.drift
+            factors = np.exp(self.drift_sigma*rng.normal(size=(size, index.size)))
+            array[:, index] *= np.where(drifting, factors, 1.0)
+
+    def step(self, pool=None):
+        """Evaluate fitness, record statistics, select parents and mutate their offspring."""
+        population = self.population
+        fitness, te_load = self.fitness(population, pool)
+        self.history['mean_fitness'].append(fitness.mean())
+        self.history['max_fitness'].append(fitness.max())
+        self.history['mean_te_load'].append(te_load.mean())
+        self.history['mean_zfs'].append(population.zf_present.sum(axis=1).mean())
+        self.history['mean_targets'].append(
+            (population.zf_edges & population.zf_present[:, :, None]).sum(axis=(1, 2)).mean())
+
+        weights = np.exp(self.selection*(fitness - fitness.max()))
+        parents = self.rng.choice(population.size, size=population.size, p=weights/weights.sum())
+        self.population = population.take(parents)
+        self.mutate(self.population)
+        self.generation += 1
+
+    def run(self, generations, log=None):
+        """Run generations, reusing one process pool throughout.
+
+        Returns:
+            history: dictionary mapping statistics to arrays with one entry per generation
+        """
+        if self.n_jobs == 1:
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(max_workers=self.n_jobs)
+        try:
+            for _ in range(generations):
+                self.step(pool)
+                if log is not None:
+                    log.write(f'generation {self.generation}\t'
+                              f'fitness {self.history["mean_fitness"][-1]:.4g}\t'
+                              f'TE load {self.history["mean_te_load"][-1]:.4g}\t'
+                              f'ZFs {self.history["mean_zfs"][-1]:.3g}\n')
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return {key: np.array(values) for key, values in self.history.items()}
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import numpy as np
+from scipy import sparse
+from concurrent.futures import ProcessPoolExecutor
+
+
+def normalize_label(feature):
+    """Convert TEcount feature ID to network node label.
+
+    Quotes are removed, genes lose their 'gene-' prefix and TEs ('subfamily:family:class') are
+    reduced to their subfamily, e.g. '"gene-ZNF91"' -> 'ZNF91', '"L1HS:L1:LINE"' -> 'L1HS'.
+    """
+    feature = feature.strip('"')
+    if feature.startswith('gene-'):
+        return feature[5:]
+    return feature.split(':')[0]
+
+
+def read_cnt_table(cnt_table):
+    """Read TEcount .cntTable file.
+
+    Returns:
+        features: list of feature IDs, with quotes removed
+        counts: array of read counts
+    """
+    features, counts = [], []
+    with open(cnt_table) as input:
+        header = input.readline()
+        for line in input:
+            line = line.rstrip('\n').split('\t')
+            if len(line) < 2:
+                continue
+            features.append(line[0].strip('"'))
+            counts.append(float(line[1]))
+    return features, np.array(counts)
+
+
+def read_label_list(infile):
+    """Read one label per line, e.g. kzfp_list.txt."""
+    with open(infile) as input:
+        return [line.strip() for line in input if line.strip()]
+
+
+def _signature(paths):
+    """Identify a set of input files by path, size and modification time."""
+    return [[os.path.abspath(path), os.path.getsize(path), os.path.getmtime(path)]
+            for path in paths]
+
+
+class ExpressionMatrix:
+    """Sparse features x samples matrix of read counts from TEcount tables."""
+
+    def __init__(self, counts, features, samples):
+        """ExpressionMatrix constructor
+
+        Args:
+            counts: scipy sparse matrix of shape (n_features, n_samples)
+            features: array of feature IDs (genes and TEs), interned so that each occurs once
+            samples: list of sample names
+
+        Returns:
+            ExpressionMatrix instance
+        """
+        self.counts = sparse.csr_matrix(counts)
+        self.features = np.asarray(features, dtype=str)
+        self.samples = list(samples)
+        self.labels = np.array([normalize_label(f) for f in self.features], dtype=str)
+        self.is_te = np.char.count(self.features, ':') > 0
+        self._feature_index = {f: i for i, f in enumerate(self.features)}
+        self._sample_index = {s: i for i, s in enumerate(self.samples)}
+
+    @classmethod
+    def from_cnt_tables(cls, cnt_tables, samples=None, cache=None, n_jobs=None):
+        """Load many TEcount tables in parallel into a single matrix.
+
+        Args:
+            cnt_tables: list of paths to .cntTable files
+            samples: sample names, defaulting to file names without extension
+            cache: optional .npz file. If it was built from the same (unmodified) tables it is
+                loaded instead; otherwise the tables are parsed and the cache is rewritten.
+            n_jobs: number of worker processes used to parse tables
+
+        Returns:
+            ExpressionMatrix instance
+        """
+        if samples is None:
+            samples = [os.path.basename(path).split('.')[0] for path in cnt_tables]
+        signature = _signature(cnt_tables)
+        if cache is not None and os.path.exists(cache):
+            matrix, cached_signature = cls._load(cache)
+            if cached_signature == signature and matrix.samples == list(samples):
+                return matrix
+
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            tables = list(pool.map(read_cnt_table, cnt_tables))
+
+        # Intern feature IDs across all tables, then assemble in COO format
+        all_features = np.concatenate([np.array(f, dtype=str) for f, _ in tables] +
+                                      [np.zeros(0, dtype=str)])
+        features, rows = np.unique(all_features, return_inverse=True)
+        cols = np.concatenate([np.full(len(f), j) for j, (f, _) in enumerate(tables)] +
+                              [np.zeros(0, dtype=int)])
+        data = np.concatenate([c for _, c in tables] + [np.zeros(0)])
+        nonzero = data != 0
+        counts = sparse.coo_matrix((data[nonzero], (rows[nonzero], cols[nonzero])),
+                                   shape=(features.size, len(cnt_tables))).tocsr()
+        matrix = cls(counts, features, samples)
+        if cache is not None:
+            matrix.save(cache, signature)
+        return matrix
+
+    @classmethod
+    def load(cls, cache):
+        """Load matrix from binary .npz cache."""
+        return cls._load(cache)[0]
+
+    @classmethod
+    def _load(cls, cache):
+        with np.load(cache, allow_pickle=False) as data:
+            counts = sparse.csr_matrix((data['data'], data['indices'], data['indptr']),
+                                       shape=tuple(data['shape']))
+            matrix = cls(counts, data['features'], list(data['samples']))
+            signature = json.loads(str(data['signature']))
+        return matrix, signature
+
+    def save(self, cache, signature=None):
+        """Save matrix to binary .npz cache."""
+        np.savez_compressed(cache,
+                            data=self.counts.data,
+                            indices=self.counts.indices,
+                            indptr=self.counts.indptr,
+                            shape=np.array(self.counts.shape),
+                            features=self.features,
+                            samples=np.array(self.samples, dtype=str),
+                            signature=np.array(json.dumps(signature)))
+
+    @property
+    def shape(self):
+        return self.counts.shape
+
+    def expressed_mask(self, min_counts=10, min_samples=1, samples=None):
+        """Boolean mask of features with at least min_counts reads in at least min_samples samples.
+
+        Args:
+            samples: restrict to these sample names (default: all samples)
+        """
+        counts = self.counts
+        if samples is not None:
+            counts = counts[:, [self._sample_index[s] for s in samples]]
+        n_samples = np.asarray((counts >= min_counts).sum(axis=1)).ravel()
+        return n_samples >= min_samples
+
+    def expressed(self, min_counts=10, min_samples=1, samples=None, exclude=(), kind=None):
+        """Set of node labels of expressed features.
+
+        Args:
+            min_counts: minimum number of reads
+            min_samples: minimum number of samples in which min_counts must be reached
+            samples: restrict to these sample names (default: all samples)
+            exclude: labels to omit (case-insensitive), e.g. read_label_list('kzfp_list.txt')
+            kind: 'gene' or 'TE' to return only one kind of feature, or None for both
+        """
+        mask = self.expressed_mask(min_counts, min_samples, samples)
+        if exclude:
+            mask &= ~np.isin(np.char.upper(self.labels), np.char.upper(np.asarray(exclude,
+                                                                                  dtype=str)))
+        if kind == 'gene':
+            mask &= ~self.is_te
+        elif kind == 'TE':
+            mask &= self.is_te
+        elif kind is not None:
+            raise ValueError(f'kind must be gene, TE or None, not {kind}')
+        return set(self.labels[mask])
+
+    def sample_counts(self, sample):
+        """Dictionary mapping node labels to read counts in a sample."""
+        column = self.counts[:, self._sample_index[sample]].tocoo()
+        sample_counts = {}
+        for row, count in zip(column.row, column.data):
+            label = self.labels[row]
+            sample_counts[label] = sample_counts.get(label, 0.0) + count
+        return sample_counts
+
+    def apply_to_grn(self, zf_grn, sample, scale=1.0, set_beta=True):
+        """Initialise node populations (and optionally TF production rates) from a sample.
+
+        Each node with a matching label has pop set to the integer count nearest scale*count, since
+        GillespieSSA changes populations one molecule at a time. If set_beta is True, TFs get
+        beta = gamma*pop, so that the observed level is their steady state. Other nodes are
+        produced at a product of Hill terms of their regulators, so their beta is left unchanged.
+        Heterochromatin nodes are left unchanged.
+
+        Returns:
+            missing: list of labels of TF, ZF and TE nodes without counts
+        """
+        sample_counts = self.sample_counts(sample)
+        missing = []
+        for node in zf_grn.tfs + zf_grn.zfs + zf_grn.tes:
+            if node.label not in sample_counts:
+                missing.append(node.label)
+                continue
+            pop = int(round(scale*sample_counts[node.label]))
+            if pop < 0:
+                raise ValueError(f'{node.label} has negative count {sample_counts[node.label]} '
+                                 f'in {sample}')
+            node.pop = pop
+            if set_beta and node.ntype == 'TF':
+                node.beta = node.gamma*node.pop
+        return missing
+
+
+def filter_edge_list(edge_list, keep):
+    """Restrict edge list to edges whose nodes are both in keep, e.g. a set of expressed labels."""
+    return [(node_i, node_j) for node_i, node_j in edge_list if node_i in keep and node_j in keep]
@@ -1,9 +1,6 @@
 #!/usr/bin/env python3
 
 import numpy as np
-import networkx as nx
-from matplotlib import pyplot as plt
-from matplotlib.patches import ArrowStyle
 
 class Node:
     """Implementation of node in graph.
@@ -21,7 +18,7 @@ class Node:
 
         Args:
             label: name of noded
-            ntype: type of node, from 'TF', 'TE' or 'ZF'
+            ntype: type of node, from 'TF', 'TE', 'ZF', 'Het' or 'Cluster'
             pop: current population of the node
             beta: maximum production rate associated with this node
             gamma: degradation rate parameter
@@ -95,6 +92,22 @@ class Edge:
         return f'({self.x.label}, {self.y.label})'
 
 
+def read_cluster_bed(bedfile):
+    """Read ZF cluster BED file written by cluster_zfps.py.
+
+    Returns:
+        list of (cluster name, list of member gene names) tuples, in file order
+    """
+    clusters = []
+    with open(bedfile) as infile:
+        for line in infile:
+            if line.startswith(('#', 'track', 'browser')) or line == '\n':
+                continue
+            line = line.rstrip('\n').split('\t')
+            clusters.append((line[3], line[-1].split(',')))
+    return clusters
+
+
 class ZincFingerGRN:
     """Representation of a gene regulatory network including TFs, ZFs and TEs."""
 
@@ -110,16 +123,18 @@ class ZincFingerGRN:
             ZincFingerGRN instance
         """
         self.n_tfs, self.n_zfs, self.n_tes = n_tfs, n_zfs, n_tes
-        self.tfs = [Node(f'TF_{i}', mode='activator') for i in range(self.n_tfs)]
+        self.tfs = [Node(f'TF_{i}', 'TF', mode='activator') for i in range(self.n_tfs)]
         # ZF is a repressor but "activates" heterochromatin
-        self.zfs = [Node(f'ZF_{i}', mode='activator') for i in range(self.n_zfs)]
-        self.tes = [Node(f'TE_{i}') for i in range(self.n_tes)]
+        self.zfs = [Node(f'ZF_{i}', 'ZF', mode='activator') for i in range(self.n_zfs)]
+        self.tes = [Node(f'TE_{i}', 'TE') for i in range(self.n_tes)]
+        # Shared regulatory units of genomic ZF clusters, see add_cluster()
+        self.clusters = []
         self.het = []
         self.edges = []
     
     @property
     def nodes(self):
-        return self.tfs + self.zfs + self.het + self.tes
+        return self.tfs + self.zfs + self.clusters + self.het + self.tes
 
     def from_edge_list(self, edge_list, node_types):
         """Constructs network from list of edges.
@@ -130,20 +145,27 @@ class ZincFingerGRN:
         """
         node_labels = set(label for pair in edge_list for label in pair)
         nodes = {label: Node(label, node_types[label])  for label in node_labels}
+        # Labels already in each group, kept as sets to avoid quadratic membership checks
+        tf_labels = set(n.label for n in self.tfs)
+        zf_labels = set(n.label for n in self.zfs)
+        te_labels = set(n.label for n in self.tes)
         for node_i_label, node_j_label in edge_list:
             node_i, node_j = nodes[node_i_label], nodes[node_j_label]
             
             for node in node_i, node_j:
-                if node.ntype == 'TF' and node.label not in [n.label for n in self.tfs]:
+                if node.ntype == 'TF' and node.label not in tf_labels:
                     node.mode = 'activator'
                     self.tfs.append(node)
+                    tf_labels.add(node.label)
                     self.n_tfs += 1
-                elif node.ntype == 'ZF' and node.label not in [n.label for n in self.zfs]:
+                elif node.ntype == 'ZF' and node.label not in zf_labels:
                     node.mode = 'activator'
                     self.zfs.append(node)
+                    zf_labels.add(node.label)
                     self.n_zfs += 1
-                elif node.ntype == 'TE' and node.label not in [n.label for n in self.tes]:
+                elif node.ntype == 'TE' and node.label not in te_labels:
                     self.tes.append(node)
+                    te_labels.add(node.label)
                     self.n_tes += 1
 
             if node_i.ntype == 'TF':
@@ -169,6 +191,87 @@ class ZincFingerGRN:
         self.het[-1].add_edge(node_j, k_xy=1)
         self.edges.append(node_j.input[-1])
 
+    def add_cluster(self, label, zfs, beta=None, gamma=None, k_xy=None, n=2.0):
+        """Adds a cluster-level regulatory unit shared by the ZFs of one genomic cluster.
+
+        The unit is an activator of every member ZF. Incoming edges of the members (other than from
+        the unit) are rerouted to the unit, one edge per regulator keeping the parameters of the
+        first such edge, so that members are co-regulated through a single shared state.
+
+        By default the unit takes the mean beta and gamma of its members, so it follows the
+        trajectory its members would have without clustering; for a single member the unit's
+        dynamics are exactly those of the unclustered ZF. Members then respond to the unit through
+        a Hill function that, by default, is half-maximal at half the unit's maximum level
+        (beta**m/gamma for m regulators), so members keep the range of their original regulation
+        rather than saturating.
+
+        Args:
+            label: cluster name, e.g. 'chr19_12' as written by cluster_zfps.py
+            zfs: member ZF nodes, none of which may already belong to a cluster
+            beta, gamma: production and degradation parameters of the unit (default: the means
+                over members)
+            k_xy, n: Hill parameters of the unit -> member edges
+
+        Returns:
+            cluster: the new Node, of type 'Cluster'
+        """
+        for zf in zfs:
+            if any(edge.x.ntype == 'Cluster' for edge in zf.input):
+                clustered = [edge.x.label for edge in zf.input if edge.x.ntype == 'Cluster']
+                raise ValueError(f'{zf.label} is already in cluster {clustered[0]}, '
+                                 f'cannot add it to {label}')
+        if len(set(id(zf) for zf in zfs)) < len(zfs):
+            raise ValueError(f'cluster {label} lists the same ZF more than once')
+        if beta is None:
+            beta = float(np.mean([zf.beta for zf in zfs]))
+        if gamma is None:
+            gamma = float(np.mean([zf.gamma for zf in zfs]))
+        cluster = Node(label, ntype='Cluster', beta=beta, gamma=gamma, mode='activator')
+        self.clusters.append(cluster)
+        rerouted = {}
+        for zf in zfs:
+            for edge in zf.input:
+                edge.x.output.remove(edge)
+                if id(edge.x) not in rerouted:
+                    rerouted[id(edge.x)] = Edge(edge.x, cluster, k_xy=edge.k, n=edge.n)
+            zf.input = []
+        removed = set(id(zf) for zf in zfs)
+        self.edges = [edge for edge in self.edges if id(edge.y) not in removed]
+        self.edges.extend(rerouted.values())
+        if k_xy is None:
+            # Hill terms are at most beta each, and an empty product is 1
+            k_xy = 0.5*(beta**len(rerouted) if rerouted else 1.0)/gamma
+        for zf in zfs:
+            self.edges.append(Edge(cluster, zf, k_xy=k_xy, n=n))
+        return cluster
+
+    def from_cluster_bed(self, bedfile, beta=None, gamma=None, k_xy=None, n=2.0):
+        """Adds ZF clusters from a BED file written by cluster_zfps.py.
+
+        Member ZFs are taken from the last column (comma-separated gene names) and looked up by
+        label; genes not yet in the network are added as unconnected ZF nodes, so that whole-genome
+        clustered architectures can be built before any regulatory edges are known. A gene listed
+        in more than one cluster raises ValueError.
+
+        Args:
+            bedfile: cluster BED file, with cluster names in column 4
+            beta, gamma, k_xy, n: parameters of each unit and its edges, as in add_cluster()
+
+        Returns:
+            clusters: list of the new cluster nodes
+        """
+        zfs = {node.label: node for node in self.zfs}
+        clusters = []
+        for label, members in read_cluster_bed(bedfile):
+            for member in members:
+                if member not in zfs:
+                    zfs[member] = Node(member, 'ZF', mode='activator')
+                    self.zfs.append(zfs[member])
+                    self.n_zfs += 1
+            clusters.append(self.add_cluster(label, [zfs[m] for m in members], beta, gamma, k_xy,
+                                             n))
+        return clusters
+
     def generate_erdos_renyi(self, p):
         """Generate Erdos-Renyi-like graph.
 
@@ -212,6 +315,80 @@ class ZincFingerGRN:
             edge.k = statedict['edges']['k'][i]
             edge.n = statedict['edges']['n'][i]
     
+    def to_dict(self, node_indices=None):
+        """Flat, picklable representation of the network.
+
+        Unlike the network itself, the representation contains no references between objects, so
+        it can be pickled (e.g. to send to worker processes) regardless of network size.
+
+        Args:
+            node_indices: optional indices into self.nodes. If given, only these nodes and the edges
+                between them are included.
+
+        Returns:
+            netdict: dictionary with 'nodes', a list of node attribute dictionaries in the order of
+                self.nodes, and 'edges', a list of (x index, y index, k, n) tuples in the order of
+                self.edges.
+        """
+        nodes = self.nodes
+        if node_indices is None:
+            node_indices = range(len(nodes))
+        node_indices = sorted(node_indices)
+        new_index = {id(nodes[i]): j for j, i in enumerate(node_indices)}
+        groups = ['tfs']*len(self.tfs) + ['zfs']*len(self.zfs) + \
+                 ['clusters']*len(self.clusters) + ['het']*len(self.het) + ['tes']*len(self.tes)
+        netdict = {'nodes': [], 'edges': []}
+        for i in node_indices:
+            node = nodes[i]
+            netdict['nodes'].append({'label': node.label, 'ntype': node.ntype, 'pop': node.pop,
+                                     'beta': node.beta, 'gamma': node.gamma, 'mode': node.mode,
+                                     'group': groups[i]})
+        for edge in self.edges:
+            if id(edge.x) in new_index and id(edge.y) in new_index:
+                netdict['edges'].append((new_index[id(edge.x)], new_index[id(edge.y)], edge.k,
+                                         edge.n))
+        return netdict
+
+    @classmethod
+    def from_dict(cls, netdict):
+        """Construct network from representation returned by to_dict."""
+        zf_grn = cls()
+        nodes = []
+        for attrs in netdict['nodes']:
+            node = Node(attrs['label'], ntype=attrs['ntype'], pop=attrs['pop'],
+                        beta=attrs['beta'], gamma=attrs['gamma'], mode=attrs['mode'])
+            getattr(zf_grn, attrs['group']).append(node)
+            nodes.append(node)
+        for i, j, k, n in netdict['edges']:
+            zf_grn.edges.append(Edge(nodes[i], nodes[j], k_xy=k, n=n))
+        zf_grn.n_tfs, zf_grn.n_zfs, zf_grn.n_tes = len(zf_grn.tfs), len(zf_grn.zfs), len(zf_grn.tes)
+        return zf_grn
+
+    def weakly_connected_components(self):
+        """Partition nodes into weakly connected components, including heterochromatin nodes.
+
+        Returns:
+            components: list of sorted lists of indices into self.nodes, ordered by smallest index
+        """
+        nodes = self.nodes
+        index = {id(node): i for i, node in enumerate(nodes)}
+        parent = list(range(len(nodes)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for edge in self.edges:
+            root_x, root_y = find(index[id(edge.x)]), find(index[id(edge.y)])
+            if root_x != root_y:
+                parent[max(root_x, root_y)] = min(root_x, root_y)
+        components = {}
+        for i in range(len(nodes)):
+            components.setdefault(find(i), []).append(i)
+        return list(components.values())
+
     def _extract_zf_edges(self):
         """Private method to extract ZF edge labels for networkx constructor."""
         edges = []
@@ -231,6 +408,8 @@ class ZincFingerGRN:
     
     def to_digraph(self):
         """Converts ZFNetwork to Networkx Digraph"""
+        # Imported here so that simulation workers do not pay for networkx at startup
+        import networkx as nx
         G = nx.DiGraph()
         G.add_nodes_from([n.label for n in self.tfs + self.zfs + self.tes])
         G.add_edges_from(self._extract_tf_edges() + self._extract_zf_edges())
@@ -238,6 +417,9 @@ class ZincFingerGRN:
 
     def draw(self):
         """Draw graphical representation of the GRN"""
+        import networkx as nx
+        from matplotlib import pyplot as plt
+        from matplotlib.patches import ArrowStyle
         G = nx.DiGraph()
         G.add_nodes_from([n.label for n in self.tfs + self.zfs + self.tes])
         G.add_edges_from(self._extract_tf_edges() + self._extract_zf_edges())
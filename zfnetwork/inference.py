@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+
+import os
+import hashlib
+import numpy as np
+from zfnetwork.sensitivity import parameter_hash
+
+"""
+Approximate Bayesian computation (ABC-SMC) of network parameters from summary statistics.
+
+Parameters are the factors of a sensitivity.ParameterSpace, i.e. log-uniform scalings of the
+beta, gamma, k and n vectors of ZincFingerGRN.save_state, with a uniform prior on the unit
+hypercube. Observed summaries can be computed from expression counts (expression_summaries) or
+from simulations (SummaryStatistics), for testing on synthetic data.
+"""
+
+STATISTICS = ('mean', 'var', 'fano')
+
+
+class SummaryStatistics:
+    """Vectorized summary statistics of simulated populations.
+
+    Instances are picklable, so they can be passed to evaluators that run in worker processes.
+    """
+
+    def __init__(self, nodes, stats=('mean', 'var'), times=(-1,)):
+        """SummaryStatistics constructor
+
+        Args:
+            nodes: indices into zf_grn.nodes of the nodes to summarise
+            stats: statistics across replicates, from 'mean', 'var' and 'fano' (var/mean)
+            times: sample indices at which statistics are taken
+
+        Returns:
+            SummaryStatistics instance
+        """
+        for stat in stats:
+            if stat not in STATISTICS:
+                raise ValueError(f'stats must be from {STATISTICS}, not {stat}')
+        self.nodes = np.asarray(nodes, dtype=int)
+        self.stats = tuple(stats)
+        self.times = np.asarray(times, dtype=int)
+
+    def settings(self):
+        """Settings that summaries depend on, as used by Simulator to validate its cache."""
+        return {'nodes': self.nodes, 'stats': self.stats, 'times': self.times}
+
+    def __call__(self, pop_log):
+        """Args:
+            pop_log: array of shape (batch, replicates, samples, n_nodes)
+
+        Returns:
+            array of shape (batch, len(times)*len(stats)*len(nodes)), ordered by time, then
+            statistic, then node
+        """
+        pops = pop_log[:, :, self.times][:, :, :, self.nodes]
+        mean = pops.mean(axis=1)
+        var = pops.var(axis=1, ddof=1) if pops.shape[1] > 1 else np.zeros(mean.shape)
+        values = {'mean': mean, 'var': var}
+        if 'fano' in self.stats:
+            values['fano'] = np.divide(var, mean, out=np.zeros(mean.shape), where=mean > 0)
+        summaries = np.stack([values[stat] for stat in self.stats], axis=2)
+        return summaries.reshape(pop_log.shape[0], -1)
+
+
+def expression_summaries(matrix, labels, samples=None, stats=('mean', 'var'), scale=1.0):
+    """Observed summaries across samples (e.g. cells or replicate libraries) of an ExpressionMatrix.
+
+    The result is laid out like a single time point of SummaryStatistics(nodes, stats), where
+    nodes are the indices of labels.
+
+    Args:
+        matrix: zfnetwork.expression.ExpressionMatrix
+        labels: node labels, in the order of SummaryStatistics.nodes
+        samples: sample names (default: all)
+        scale: factor applied to counts, as in ExpressionMatrix.apply_to_grn
+
+    Returns:
+        array of length len(stats)*len(labels)
+    """
+    samples = matrix.samples if samples is None else samples
+    counts = np.zeros((len(samples), len(labels)))
+    for i, sample in enumerate(samples):
+        sample_counts = matrix.sample_counts(sample)
+        counts[i] = [scale*sample_counts.get(label, 0.0) for label in labels]
+    summaries = SummaryStatistics(np.arange(len(labels)), stats)
+    return summaries(counts[None, :, None, :])[0]
+
+
+def settings_signature(*objects):
+    """Hex digest identifying the settings of evaluators and summary functions.
+
+    Objects with a settings() method are identified by what it returns, other objects by their
+    class and public attributes, and functions by their module and name.
+    """
+    digest = hashlib.sha1()
+    _update_signature(digest, objects)
+    return digest.hexdigest()
+
+
+def _update_signature(digest, value):
+    if isinstance(value, np.ndarray):
+        digest.update(f'array{value.dtype}{value.shape}'.encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        digest.update(f'dict{len(value)}'.encode())
+        for key in sorted(value, key=str):
+            digest.update(repr(key).encode())
+            _update_signature(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        digest.update(f'list{len(value)}'.encode())
+        for item in value:
+            _update_signature(digest, item)
+    elif hasattr(value, 'settings'):
+        _update_signature(digest, value.settings())
+    elif callable(value) and hasattr(value, '__qualname__'):
+        digest.update(f'{value.__module__}.{value.__qualname__}'.encode())
+    elif hasattr(value, '__dict__'):
+        digest.update(type(value).__qualname__.encode())
+        _update_signature(digest, {key: item for key, item in vars(value).items()
+                                   if not key.startswith('_')})
+    else:
+        digest.update(repr(value).encode())
+
+
+class Simulator:
+    """Simulate summaries for batches of parameter sets, caching results by parameter hash."""
+
+    def __init__(self, space, evaluator, summaries, cache=None):
+        """Simulator constructor
+
+        Args:
+            space: sensitivity.ParameterSpace
+            evaluator: sensitivity.ODEEvaluator or SSAEvaluator (with seed=None, so that distinct
+                parameter sets get independent noise)
+            summaries: SummaryStatistics or other vector output function
+            cache: optional .npz file holding results from previous runs; updated by save(). It is
+                only used if it was written with the same evaluator and summaries settings (see
+                settings_signature()); otherwise it is discarded and rewritten.
+
+        Returns:
+            Simulator instance
+        """
+        self.space = space
+        self.evaluator = evaluator
+        self.summaries = summaries
+        self.cache_file = cache
+        self.cache = {}
+        self.signature = settings_signature(evaluator, summaries)
+        self.n_simulations = 0
+        self.n_cached = 0
+        if cache is not None and os.path.exists(cache):
+            with np.load(cache) as data:
+                if 'signature' in data and str(data['signature']) == self.signature:
+                    self.cache = dict(zip(data['keys'], data['values']))
+
+    def __call__(self, unit):
+        """Summaries of points of the unit hypercube, shape (batch, n_factors).
+
+        Returns:
+            array of shape (batch, n_summaries)
+        """
+        params = self.space.transform(unit)
+        keys = [parameter_hash(params, i) for i in range(params['pop'].shape[0])]
+        # First occurrence of each parameter set not simulated before
+        first = {}
+        for i, key in enumerate(keys):
+            if key not in self.cache:
+                first.setdefault(key, i)
+        missing = list(first.values())
+        if missing:
+            subset = {name: value[missing] for name, value in params.items()}
+            results = np.atleast_2d(self.evaluator(subset, self.summaries))
+            for i, result in zip(missing, results.reshape(len(missing), -1)):
+                self.cache[keys[i]] = result
+        self.n_simulations += len(missing)
+        self.n_cached += len(keys) - len(missing)
+        return np.array([self.cache[key] for key in keys])
+
+    def save(self):
+        """Write cache to the file given to the constructor."""
+        if self.cache_file is None or not self.cache:
+            return
+        keys = np.array(list(self.cache), dtype=str)
+        np.savez_compressed(self.cache_file, keys=keys,
+                            values=np.array([self.cache[key] for key in keys]),
+                            signature=np.array(self.signature))
+
+
+class ABCResult:
+    """Weighted particle approximation of the posterior, with the history of the run."""
+
+    def __init__(self, space, particles, weights, distances, epsilons, n_simulations, n_cached):
+        self.space = space
+        self.particles = particles
+        self.weights = weights
+        self.distances = distances
+        self.epsilons = epsilons
+        self.n_simulations = n_simulations
+        self.n_cached = n_cached
+
+    @property
+    def scales(self):
+        """Particles as parameter scale factors."""
+        return self.space.scales(self.particles)
+
+    def posterior_mean(self):
+        """Weighted posterior mean of the log scale factors, returned as scale factors."""
+        return np.exp(np.average(np.log(self.scales), axis=0, weights=self.weights))
+
+    def quantiles(self, q=(0.025, 0.5, 0.975)):
+        """Weighted quantiles of the scale factors, shape (len(q), n_factors)."""
+        quantiles = np.zeros((len(q), self.space.n_factors))
+        for j in range(self.space.n_factors):
+            order = np.argsort(self.scales[:, j])
+            cumulative = np.cumsum(self.weights[order])
+            cumulative /= cumulative[-1]
+            idx = np.minimum(np.searchsorted(cumulative, q), order.size - 1)
+            quantiles[:, j] = self.scales[order[idx], j]
+        return quantiles
+
+    def write_tsv(self, outfile):
+        """Write posterior summary of each factor."""
+        mean = self.posterior_mean()
+        low, median, high = self.quantiles()
+        with open(outfile, 'w') as output:
+            output.write('factor\tmean\tmedian\tq2.5\tq97.5\n')
+            for j, name in enumerate(self.space.names):
+                output.write(f'{name}\t{mean[j]:.6g}\t{median[j]:.6g}\t{low[j]:.6g}\t'
+                             f'{high[j]:.6g}\n')
+
+
+def abc_smc(simulator, observed, n_particles=500, n_generations=10, quantile=0.5,
+            min_acceptance=0.01, max_simulations=None, batch_size=None, seed=0, log=None):
+    """Fit parameters with sequential Monte Carlo ABC (Beaumont et al. 2009).
+
+    The first generation samples the uniform prior. Each later generation perturbs particles of
+    the previous one with a Gaussian kernel of twice their weighted covariance, accepting those
+    whose distance to the observed summaries is below the given quantile of the previous
+    generation's distances. Distances are Euclidean, after scaling each summary by its median
+    absolute deviation under the prior.
+
+    Args:
+        simulator: Simulator
+        observed: observed summaries, laid out as simulator.summaries
+        n_particles: particles per generation
+        n_generations: maximum number of generations
+        quantile: quantile of previous distances used as the next tolerance
+        min_acceptance: stop once the acceptance rate of a generation falls below this
+        max_simulations: stop once this many proposals have been evaluated
+        batch_size: proposals simulated together (default: n_particles)
+        log: optional file object for progress reports
+
+    Returns:
+        ABCResult
+    """
+    rng = np.random.RandomState(seed)
+    space = simulator.space
+    d = space.n_factors
+    observed = np.asarray(observed, dtype=float)
+    batch_size = batch_size or n_particles
+
+    # Generation 0: prior predictive, also used to scale summaries
+    particles = rng.uniform(size=(n_particles, d))
+    summaries = simulator(particles)
+    scale = np.median(np.abs(summaries - np.median(summaries, axis=0)), axis=0)
+    scale[scale == 0] = 1.0
+
+    def distance(simulated):
+        return np.sqrt((((simulated - observed)/scale)**2).sum(axis=1))
+
+    distances = distance(summaries)
+    weights = np.full(n_particles, 1.0/n_particles)
+    epsilons = [np.inf]
+    n_proposed = n_particles
+
+    for generation in range(1, n_generations):
+        epsilon = np.quantile(distances, quantile)
+        covariance = 2.0*np.atleast_2d(np.cov(particles.T, aweights=weights))
+        covariance += 1e-12*np.eye(d)
+        cholesky = np.linalg.cholesky(covariance)
+        inverse = np.linalg.inv(covariance)
+
+        accepted, accepted_distances, n_tried = [], [], 0
+        while sum(len(a) for a in accepted) < n_particles:
+            if max_simulations is not None and n_proposed + n_tried >= max_simulations:
+                break
+            parents = particles[rng.choice(n_particles, size=batch_size, p=weights)]
+            proposals = parents + rng.normal(size=(batch_size, d)) @ cholesky.T
+            # Proposals outside the prior support are rejected without simulation
+            proposals = proposals[np.all((proposals >= 0) & (proposals <= 1), axis=1)]
+            n_tried += batch_size
+            if not proposals.size:
+                continue
+            proposal_distances = distance(simulator(proposals))
+            keep = proposal_distances <= epsilon
+            accepted.append(proposals[keep])
+            accepted_distances.append(proposal_distances[keep])
+
+        n_proposed += n_tried
+        new_particles = np.concatenate(accepted + [np.zeros((0, d))])[:n_particles]
+        if len(new_particles) < n_particles:
+            break
+        new_distances = np.concatenate(accepted_distances)[:n_particles]
+
+        # Importance weights: uniform prior over the mixture of perturbation kernels
+        diffs = new_particles[:, None, :] - particles[None, :, :]
+        kernel = np.exp(-0.5*np.einsum('ijk,kl,ijl->ij', diffs, inverse, diffs))
+        new_weights = 1.0/(kernel @ weights)
+        particles, distances = new_particles, new_distances
+        weights = new_weights/new_weights.sum()
+        epsilons.append(epsilon)
+
+        acceptance = n_particles/n_tried
+        if log is not None:
+            log.write(f'generation {generation}\tepsilon {epsilon:.4g}\t'
+                      f'acceptance {acceptance:.3f}\tsimulations {simulator.n_simulations}\n')
+        if acceptance < min_acceptance:
+            break
+
+    return ABCResult(space, particles, weights, distances, np.array(epsilons),
+                     simulator.n_simulations, simulator.n_cached)
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+
+import numpy as np
+from zfnetwork.ssa import sample_times
+
+
+PARAMETERS = ('pop', 'beta', 'gamma', 'k', 'n')
+NODE_PARAMETERS = ('pop', 'beta', 'gamma')
+EDGE_PARAMETERS = ('k', 'n')
+MASKS = ('edge_active', 'node_active')
+
+
+class CompiledGRN:
+    """Array representation of a ZincFingerGRN for vectorized mean-field simulation.
+
+    Nodes and edges are stored in the order of zf_grn.nodes and zf_grn.edges, i.e. the order of the
+    parameter vectors returned by ZincFingerGRN.save_state. Rate laws are those of GillespieSSA:
+    TFs are produced at rate beta, other nodes at the product of the Hill functions of their
+    incoming edges (1 if they have none), and every node decays at rate gamma*pop.
+    """
+
+    def __init__(self, labels, ntypes, groups, src, dst, activator, pop, beta, gamma, k, n):
+        """CompiledGRN constructor
+
+        Args:
+            labels, ntypes, groups: node labels, types and ZincFingerGRN groups ('tfs', 'zfs',
+                'clusters', 'het' or 'tes')
+            src, dst: node indices of each edge's regulator and target
+            activator: boolean array, True for edges whose regulator is an activator
+            pop, beta, gamma: node parameter arrays
+            k, n: edge parameter arrays
+
+        Returns:
+            CompiledGRN instance
+        """
+        self.labels = list(labels)
+        self.ntypes = list(ntypes)
+        self.groups = list(groups)
+        self.src = np.asarray(src, dtype=int)
+        self.dst = np.asarray(dst, dtype=int)
+        self.activator = np.asarray(activator, dtype=bool)
+        self.pop = np.asarray(pop, dtype=float)
+        self.beta = np.asarray(beta, dtype=float)
+        self.gamma = np.asarray(gamma, dtype=float)
+        self.k = np.asarray(k, dtype=float)
+        self.n = np.asarray(n, dtype=float)
+        self.is_tf = np.array([ntype == 'TF' for ntype in self.ntypes], dtype=bool)
+
+        # Edges grouped by target, so that products over incoming edges are a single reduceat
+        self._order = np.argsort(self.dst, kind='stable')
+        self._targets, self._starts = np.unique(self.dst[self._order], return_index=True)
+        self._levels = self._topological_levels()
+
+    def _topological_levels(self):
+        """Nodes grouped so that each depends only on earlier groups, or None if there are cycles."""
+        n_inputs = np.bincount(self.dst, minlength=self.n_nodes)
+        # TF production does not depend on inputs
+        n_inputs[self.is_tf] = 0
+        outputs = [[] for _ in range(self.n_nodes)]
+        for x, y in zip(self.src, self.dst):
+            if not self.is_tf[y]:
+                outputs[x].append(y)
+        levels, level = [], list(np.flatnonzero(n_inputs == 0))
+        while level:
+            levels.append(np.array(level, dtype=int))
+            next_level = []
+            for x in level:
+                for y in outputs[x]:
+                    n_inputs[y] -= 1
+                    if n_inputs[y] == 0:
+                        next_level.append(y)
+            level = next_level
+        if sum(level.size for level in levels) < self.n_nodes:
+            return None
+        return levels
+
+    @classmethod
+    def from_grn(cls, zf_grn):
+        """Compile a ZincFingerGRN."""
+        netdict = zf_grn.to_dict()
+        nodes, edges = netdict['nodes'], netdict['edges']
+        src = [edge[0] for edge in edges]
+        return cls([node['label'] for node in nodes],
+                   [node['ntype'] for node in nodes],
+                   [node['group'] for node in nodes],
+                   src,
+                   [edge[1] for edge in edges],
+                   [nodes[i]['mode'] == 'activator' for i in src],
+                   [node['pop'] for node in nodes],
+                   [node['beta'] for node in nodes],
+                   [node['gamma'] for node in nodes],
+                   [edge[2] for edge in edges],
+                   [edge[3] for edge in edges])
+
+    @property
+    def n_nodes(self):
+        return len(self.labels)
+
+    @property
+    def n_edges(self):
+        return self.src.size
+
+    def indices(self, ntype=None, group=None):
+        """Indices of nodes of the given type ('TF', 'ZF', 'Cluster', 'Het', 'TE') and/or group."""
+        return np.array([i for i in range(self.n_nodes)
+                         if (ntype is None or self.ntypes[i] == ntype) and
+                            (group is None or self.groups[i] == group)], dtype=int)
+
+    def parameters(self, batch_size=None):
+        """Copy of the parameter arrays, keyed as in save_state.
+
+        Args:
+            batch_size: if given, every array gets a leading batch axis of this length
+
+        Returns:
+            dictionary mapping 'pop', 'beta', 'gamma', 'k' and 'n' to arrays
+        """
+        params = {name: getattr(self, name).copy() for name in PARAMETERS}
+        if batch_size is not None:
+            params = {name: np.tile(value, (batch_size, 1)) for name, value in params.items()}
+        return params
+
+    def _batch(self, params):
+        """Broadcast parameters (defaults for any missing) to arrays with a leading batch axis."""
+        params = {} if params is None else params
+        arrays = {name: np.asarray(params.get(name, getattr(self, name)), dtype=float)
+                  for name in PARAMETERS}
+        arrays.update({name: np.asarray(params[name], dtype=bool)
+                       for name in MASKS if params.get(name) is not None})
+        batch_size = max([1] + [value.shape[0] for value in arrays.values() if value.ndim == 2])
+        return {name: np.broadcast_to(value, (batch_size, value.shape[-1]))
+                for name, value in arrays.items()}
+
+    def production(self, x, beta, k, n, edge_active=None, node_active=None):
+        """Production rates of every node, for a batch of states and parameters.
+
+        Args:
+            x, beta: arrays of shape (batch, n_nodes)
+            k, n: arrays of shape (batch, n_edges)
+            edge_active: optional boolean array of shape (batch, n_edges); inactive edges are
+                left out of their target's product of Hill functions
+            node_active: optional boolean array of shape (batch, n_nodes); inactive nodes are not
+                produced
+
+        Returns:
+            array of shape (batch, n_nodes)
+        """
+        return self._production(x, self._prepare(beta, k, n, edge_active, node_active))
+
+    def _prepare(self, beta, k, n, edge_active=None, node_active=None):
+        """Parameter-dependent terms of the rate laws, with edges ordered by target."""
+        order = self._order
+        prepared = {'beta': beta,
+                    'beta_dst': np.ascontiguousarray(beta[:, self.dst[order]]),
+                    'log_k': np.ascontiguousarray(np.log(k[:, order])),
+                    'n': np.ascontiguousarray(n[:, order]),
+                    # Activators contribute beta*(1 - f) and repressors beta*f,
+                    # with f = 1/(1 + (x/k)^n)
+                    'offset': self.activator[order].astype(float),
+                    'sign': np.where(self.activator[order], -1.0, 1.0),
+                    'node_active': None}
+        if edge_active is not None:
+            # Inactive edges contribute a factor of 1*(1 + 0*f)
+            active = edge_active[:, order]
+            prepared['beta_dst'] = np.where(active, prepared['beta_dst'], 1.0)
+            prepared['offset'] = np.where(active, prepared['offset'], 1.0)
+            prepared['sign'] = np.where(active, prepared['sign'], 0.0)
+        if node_active is not None:
+            prepared['node_active'] = node_active.astype(float)
+        return prepared
+
+    def _production(self, x, prepared):
+        rates = np.ones(x.shape)
+        if self.n_edges:
+            with np.errstate(divide='ignore'):
+                log_x = np.log(x)
+            ratio = np.exp(prepared['n']*(log_x[:, self.src[self._order]] - prepared['log_k']))
+            hill = prepared['beta_dst']*(prepared['offset'] + prepared['sign']/(1.0 + ratio))
+            rates[:, self._targets] = np.multiply.reduceat(hill, self._starts, axis=1)
+        rates[:, self.is_tf] = prepared['beta'][:, self.is_tf]
+        if prepared['node_active'] is not None:
+            rates *= prepared['node_active']
+        return rates
+
+    def derivative(self, x, params):
+        return self.production(x, params['beta'], params['k'], params['n']) - params['gamma']*x
+
+    def integrate(self, duration, params=None, dt=0.05, sample_interval=None):
+        """Integrate mean-field rate equations with fixed-step fourth-order Runge-Kutta.
+
+        Args:
+            duration: the duration of the simulation.
+            params: dictionary of parameter arrays as returned by parameters(), each either 1D
+                (shared) or with a leading batch axis; missing entries take the compiled values.
+                'pop' holds the initial state. Optional 'edge_active' and 'node_active' masks are
+                applied as in production().
+            dt: maximum integration step.
+            sample_interval: time between samples, as in GillespieSSA.gillespie_ssa(). If None,
+                only the state at t = duration is returned.
+
+        Returns:
+            time_log: array of sample times
+            pop_log: array of shape (batch, len(time_log), n_nodes)
+        """
+        params = self._batch(params)
+        if sample_interval is None:
+            time_log = np.array([float(duration)])
+        else:
+            time_log = sample_times(duration, sample_interval)
+        prepared = self._prepare(params['beta'], params['k'], params['n'],
+                                 params.get('edge_active'), params.get('node_active'))
+        gamma = params['gamma']
+
+        def derivative(x):
+            return self._production(x, prepared) - gamma*x
+
+        x = params['pop'].copy()
+        if prepared['node_active'] is not None:
+            x *= prepared['node_active']
+        pop_log = np.zeros((x.shape[0], time_log.size, self.n_nodes))
+        t = 0.0
+        for t_idx, t_sample in enumerate(time_log):
+            n_steps = int(np.ceil((t_sample - t)/dt - 1e-9))
+            if n_steps > 0:
+                h = (t_sample - t)/n_steps
+                for _ in range(n_steps):
+                    k1 = derivative(x)
+                    k2 = derivative(np.maximum(x + 0.5*h*k1, 0.0))
+                    k3 = derivative(np.maximum(x + 0.5*h*k2, 0.0))
+                    k4 = derivative(np.maximum(x + h*k3, 0.0))
+                    x = np.maximum(x + h*(k1 + 2*k2 + 2*k3 + k4)/6.0, 0.0)
+                t = t_sample
+            pop_log[:, t_idx] = x
+        return time_log, pop_log
+
+    def steady_state(self, params=None, dt=0.05, tol=1e-8, max_time=1e4):
+        """Fixed point of the mean-field rate equations.
+
+        For feed-forward networks (e.g. TF -> ZF -> Het -> TE) the fixed point is computed exactly,
+        one topological level at a time, as production/gamma given the levels above. Networks
+        with cycles are integrated from params['pop'] until the state stops changing.
+
+        Args:
+            params: parameter arrays, as for integrate()
+            dt: integration step for networks with cycles
+            tol: relative change per unit time below which the state is taken as steady
+            max_time: maximum integration time for networks with cycles
+
+        Returns:
+            array of shape (batch, n_nodes)
+        """
+        params = self._batch(params)
+        if self._levels is None:
+            return self._integrate_to_steady_state(params, dt, tol, max_time)
+        prepared = self._prepare(params['beta'], params['k'], params['n'],
+                                 params.get('edge_active'), params.get('node_active'))
+        x = np.zeros(params['pop'].shape)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for level in self._levels:
+                x[:, level] = self._production(x, prepared)[:, level]/params['gamma'][:, level]
+        return x
+
+    def _integrate_to_steady_state(self, params, dt, tol, max_time):
+        params = dict(params)
+        chunk = 10.0/max(np.min(params['gamma']), 1e-3)
+        x, t = params['pop'], 0.0
+        while t < max_time:
+            params['pop'] = x
+            x_next = self.integrate(chunk, params, dt)[1][:, -1]
+            t += chunk
+            if np.all(np.abs(x_next - x) <= tol*chunk*(1.0 + np.abs(x))):
+                return x_next
+            x = x_next
+        return x
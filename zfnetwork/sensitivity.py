@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+
+import hashlib
+import warnings
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from zfnetwork import ode
+
+"""
+Global sensitivity analysis of network outputs to the parameters exposed by
+ZincFingerGRN.save_state (pop, beta, gamma, k and n).
+
+Each factor scales a set of entries of one parameter vector by a log-uniform factor between its
+bounds. Designs are generated in the unit hypercube, mapped to batches of parameter arrays, and
+evaluated by an evaluator (ODEEvaluator, or SSAEvaluator with common random numbers).
+"""
+
+
+class FinalPopulation:
+    """Output: mean over replicates of the summed population of some nodes at the last sample.
+
+    Instances are picklable, so they can be sent to worker processes.
+    """
+
+    def __init__(self, nodes):
+        """Args:
+            nodes: indices into zf_grn.nodes, e.g. CompiledGRN.indices(ntype='TE')
+        """
+        self.nodes = np.asarray(nodes, dtype=int)
+
+    def __call__(self, pop_log):
+        """Args:
+            pop_log: array of shape (batch, replicates, samples, n_nodes)
+
+        Returns:
+            array of shape (batch,)
+        """
+        return pop_log[:, :, -1, self.nodes].sum(axis=-1).mean(axis=1)
+
+
+def entry_factors(compiled, params=('beta', 'gamma', 'k', 'n')):
+    """One factor per entry of each parameter vector, e.g. 'beta[ZF_1]' or 'k[TF_0->ZF_1]'."""
+    factors = []
+    for param in params:
+        if param in ode.NODE_PARAMETERS:
+            factors.extend((f'{param}[{label}]', param, [i])
+                           for i, label in enumerate(compiled.labels))
+        else:
+            factors.extend((f'{param}[{compiled.labels[x]}->{compiled.labels[y]}]', param, [i])
+                           for i, (x, y) in enumerate(zip(compiled.src, compiled.dst)))
+    return factors
+
+
+def grouped_factors(compiled, params=('beta', 'gamma', 'k', 'n')):
+    """One factor per parameter and node type (e.g. 'gamma[TE]'), or for edge parameters per
+    regulator and target type (e.g. 'k[Het->TE]')."""
+    factors = []
+    for param in params:
+        if param in ode.NODE_PARAMETERS:
+            keys = compiled.ntypes
+        else:
+            keys = [f'{compiled.ntypes[x]}->{compiled.ntypes[y]}'
+                    for x, y in zip(compiled.src, compiled.dst)]
+        groups = {}
+        for i, key in enumerate(keys):
+            groups.setdefault(key, []).append(i)
+        factors.extend((f'{param}[{key}]', param, indices) for key, indices in groups.items())
+    return factors
+
+
+class ParameterSpace:
+    """Multiplicative perturbations of a network's parameter vectors."""
+
+    def __init__(self, compiled, factors=None, bounds=(0.5, 2.0)):
+        """ParameterSpace constructor
+
+        Args:
+            compiled: CompiledGRN holding the baseline parameters
+            factors: list of (name, param, indices) or (name, param, indices, low, high) tuples,
+                where param is one of 'pop', 'beta', 'gamma', 'k' or 'n' and indices select entries
+                of that vector. Defaults to entry_factors(compiled).
+            bounds: default (low, high) range of the scale factors
+
+        Returns:
+            ParameterSpace instance
+        """
+        self.compiled = compiled
+        factors = entry_factors(compiled) if factors is None else factors
+        self.names, self.params, self.indices, self.bounds = [], [], [], []
+        for factor in factors:
+            name, param, indices = factor[:3]
+            if param not in ode.PARAMETERS:
+                raise ValueError(f'param must be one of {ode.PARAMETERS}, not {param}')
+            self.names.append(name)
+            self.params.append(param)
+            self.indices.append(np.asarray(indices, dtype=int))
+            self.bounds.append(tuple(factor[3:5]) if len(factor) == 5 else tuple(bounds))
+        self.bounds = np.log(np.array(self.bounds, dtype=float).reshape(-1, 2))
+
+    @property
+    def n_factors(self):
+        return len(self.names)
+
+    def scales(self, unit):
+        """Map points of the unit hypercube, shape (batch, n_factors), to scale factors."""
+        return np.exp(self.bounds[:, 0] + unit*(self.bounds[:, 1] - self.bounds[:, 0]))
+
+    def transform(self, unit):
+        """Map points of the unit hypercube to batched parameter arrays for CompiledGRN."""
+        unit = np.atleast_2d(unit)
+        scales = self.scales(unit)
+        params = self.compiled.parameters(batch_size=unit.shape[0])
+        for j, (param, indices) in enumerate(zip(self.params, self.indices)):
+            params[param][:, indices] *= scales[:, [j]]
+        return params
+
+
+class ODEEvaluator:
+    """Evaluate outputs of the mean-field ODE, in batches spread over worker processes."""
+
+    def __init__(self, compiled, duration=100.0, dt=0.05, sample_interval=None, n_jobs=1):
+        self.compiled = compiled
+        self.duration = duration
+        self.dt = dt
+        self.sample_interval = sample_interval
+        self.n_jobs = n_jobs
+
+    def settings(self):
+        """Settings that outputs depend on (the number of workers does not change them)."""
+        return {'compiled': self.compiled, 'duration': self.duration, 'dt': self.dt,
+                'sample_interval': self.sample_interval}
+
+    def __call__(self, params, output):
+        """Args:
+            params: dictionary of batched parameter arrays, e.g. from ParameterSpace.transform
+            output: function mapping pop_log of shape (batch, replicates, samples, n_nodes) to an
+                array of shape (batch,), or (batch, n_outputs) for vector outputs
+
+        Returns:
+            array of outputs, one per parameter set
+        """
+        batch_size = params['pop'].shape[0]
+        n_chunks = min(batch_size, self.n_jobs or 1)
+        chunks = [{name: value[idx] for name, value in params.items()}
+                  for idx in np.array_split(np.arange(batch_size), n_chunks)]
+        args = (self.compiled, self.duration, self.dt, self.sample_interval, output)
+        if n_chunks == 1:
+            return _ode_outputs(chunks[0], *args)
+        with ProcessPoolExecutor(max_workers=self.n_jobs) as pool:
+            results = pool.map(_ode_outputs, chunks, *[[arg]*n_chunks for arg in args])
+            return np.concatenate(list(results))
+
+
+def _ode_outputs(params, compiled, duration, dt, sample_interval, output):
+    pop_log = compiled.integrate(duration, params, dt, sample_interval)[1]
+    return np.asarray(output(pop_log[:, None]), dtype=float)
+
+
+class SSAEvaluator:
+    """Evaluate outputs of stochastic simulations.
+
+    By default every parameter set is simulated from the same random seed (common random numbers),
+    so that differences between outputs reflect the parameters rather than sampling noise. With
+    seed=None each parameter set is seeded from its parameter_hash instead, giving independent
+    noise across parameter sets that is still reproducible, as needed for inference.
+    """
+
+    def __init__(self, zf_grn, duration=100, replicates=10, sample_interval=1.0, seed=0,
+                 n_jobs=1):
+        self.netdict = zf_grn.to_dict()
+        self.duration = duration
+        self.replicates = replicates
+        self.sample_interval = sample_interval
+        self.seed = seed
+        self.n_jobs = n_jobs
+
+    def settings(self):
+        """See ODEEvaluator.settings."""
+        return {'netdict': self.netdict, 'duration': self.duration,
+                'replicates': self.replicates, 'sample_interval': self.sample_interval,
+                'seed': self.seed}
+
+    def __call__(self, params, output):
+        """See ODEEvaluator.__call__."""
+        batch_size = params['pop'].shape[0]
+        n_chunks = min(batch_size, self.n_jobs or 1)
+        chunks = [{name: value[idx] for name, value in params.items()}
+                  for idx in np.array_split(np.arange(batch_size), n_chunks)]
+        args = (self.netdict, self.duration, self.replicates, self.sample_interval, self.seed,
+                output)
+        if n_chunks == 1:
+            return _ssa_outputs(chunks[0], *args)
+        with ProcessPoolExecutor(max_workers=self.n_jobs) as pool:
+            results = pool.map(_ssa_outputs, chunks, *[[arg]*n_chunks for arg in args])
+            return np.concatenate(list(results))
+
+
+def parameter_hash(params, i):
+    """Hex digest identifying parameter set i of a batch of parameter arrays."""
+    digest = hashlib.sha1()
+    for name in ode.PARAMETERS:
+        digest.update(np.ascontiguousarray(params[name][i], dtype=float).tobytes())
+    return digest.hexdigest()
+
+
+def _ssa_outputs(params, netdict, duration, replicates, sample_interval, seed, output):
+    from zfnetwork import grn, ssa
+    simulation = ssa.GillespieSSA(grn.ZincFingerGRN.from_dict(netdict))
+    outputs = []
+    for i in range(params['pop'].shape[0]):
+        statedict = {'nodes': {name: params[name][i] for name in ode.NODE_PARAMETERS},
+                     'edges': {name: params[name][i] for name in ode.EDGE_PARAMETERS}}
+        simulation.zf_grn.load_state(statedict)
+        np.random.seed(seed if seed is not None else int(parameter_hash(params, i)[:8], 16))
+        pop_log = simulation.run(duration, replicates, sample_interval=sample_interval,
+                                 progress=False)[1]
+        outputs.append(output(pop_log[None])[0])
+    return np.array(outputs, dtype=float)
+
+
+class SensitivityResult:
+    """Sensitivity indices for each factor."""
+
+    def __init__(self, method, names, indices, n_evaluations):
+        """Args:
+            method: 'sobol' or 'morris'
+            names: factor names
+            indices: dictionary mapping index names (e.g. 'S1', 'ST', 'mu_star') to arrays
+            n_evaluations: number of model evaluations used
+        """
+        self.method = method
+        self.names = list(names)
+        self.indices = indices
+        self.n_evaluations = n_evaluations
+
+    def ranked(self, index=None):
+        """(name, value) pairs in decreasing order of index (default 'ST' or 'mu_star')."""
+        if index is None:
+            index = 'ST' if self.method == 'sobol' else 'mu_star'
+        values = self.indices[index]
+        order = np.argsort(-values, kind='stable')
+        return [(self.names[i], float(values[i])) for i in order]
+
+    def write_tsv(self, outfile, index=None):
+        """Write factors and all indices, in ranked order."""
+        keys = list(self.indices)
+        position = {name: i for i, name in enumerate(self.names)}
+        with open(outfile, 'w') as output:
+            output.write('\t'.join(['factor'] + keys) + '\n')
+            for name, _ in self.ranked(index):
+                i = position[name]
+                output.write('\t'.join([name] + [f'{self.indices[k][i]:.6g}' for k in keys]) + '\n')
+
+
+def _unit_samples(n_samples, dimension, seed):
+    """Scrambled Sobol sequence (or uniform random points if scipy is unavailable)."""
+    try:
+        from scipy.stats import qmc
+    except ImportError:
+        return np.random.RandomState(seed).uniform(size=(n_samples, dimension))
+    with warnings.catch_warnings():
+        # Balance properties need powers of two, but any sample size is valid
+        warnings.simplefilter('ignore', UserWarning)
+        return qmc.Sobol(dimension, scramble=True, seed=seed).random(n_samples)
+
+
+def _sobol_estimates(f_a, f_b, f_ab):
+    """First-order (Saltelli 2010) and total (Jansen 1999) indices from model outputs."""
+    variance = np.var(np.concatenate([f_a, f_b]))
+    if variance == 0:
+        return np.zeros(f_ab.shape[1]), np.zeros(f_ab.shape[1])
+    first = np.mean(f_b[:, None]*(f_ab - f_a[:, None]), axis=0)/variance
+    total = 0.5*np.mean((f_a[:, None] - f_ab)**2, axis=0)/variance
+    return first, total
+
+
+def sobol_indices(space, evaluator, output, n_samples=256, n_bootstrap=100, seed=0):
+    """Variance-based first-order and total sensitivity indices.
+
+    Uses the Saltelli design: two independent sample matrices A and B and, for each factor i, the
+    matrix A with column i taken from B, for n_samples*(n_factors + 2) evaluations in total.
+
+    Args:
+        space: ParameterSpace
+        evaluator: ODEEvaluator, SSAEvaluator or any callable(params, output)
+        output: scalar output function, e.g. FinalPopulation
+        n_samples: number of base samples
+        n_bootstrap: bootstrap resamples for 95% confidence intervals (0 to skip)
+
+    Returns:
+        SensitivityResult with indices 'S1', 'S1_conf', 'ST' and 'ST_conf'
+    """
+    d = space.n_factors
+    base = _unit_samples(n_samples, 2*d, seed)
+    a, b = base[:, :d], base[:, d:]
+    ab = np.repeat(a[None], d, axis=0)
+    for i in range(d):
+        ab[i, :, i] = b[:, i]
+
+    design = np.concatenate([a, b, ab.reshape(-1, d)])
+    outputs = evaluator(space.transform(design), output)
+    f_a, f_b = outputs[:n_samples], outputs[n_samples:2*n_samples]
+    f_ab = outputs[2*n_samples:].reshape(d, n_samples).T
+
+    first, total = _sobol_estimates(f_a, f_b, f_ab)
+    indices = {'S1': first, 'S1_conf': np.zeros(d), 'ST': total, 'ST_conf': np.zeros(d)}
+    if n_bootstrap:
+        rng = np.random.RandomState(seed)
+        resampled = [_sobol_estimates(f_a[idx], f_b[idx], f_ab[idx])
+                     for idx in rng.randint(n_samples, size=(n_bootstrap, n_samples))]
+        indices['S1_conf'] = 1.96*np.std([r[0] for r in resampled], axis=0)
+        indices['ST_conf'] = 1.96*np.std([r[1] for r in resampled], axis=0)
+    return SensitivityResult('sobol', space.names, indices, outputs.size)
+
+
+def morris_indices(space, evaluator, output, n_trajectories=20, levels=4, seed=0):
+    """Elementary-effects screening (Morris 1991, with mu_star of Campolongo et al. 2007).
+
+    Each trajectory starts from a random point of a grid with the given number of levels and moves
+    every factor once, in random order, by delta = levels/(2*(levels - 1)), for
+    n_trajectories*(n_factors + 1) evaluations in total.
+
+    Returns:
+        SensitivityResult with indices 'mu_star', 'mu' and 'sigma', the mean absolute, mean and
+        standard deviation of the elementary effects of each factor in unit-hypercube coordinates
+    """
+    d = space.n_factors
+    rng = np.random.RandomState(seed)
+    delta = levels/(2.0*(levels - 1))
+    grid = np.arange(levels//2)/(levels - 1.0)
+
+    design = np.zeros((n_trajectories, d + 1, d))
+    orders = np.zeros((n_trajectories, d), dtype=int)
+    for r in range(n_trajectories):
+        point = rng.choice(grid, size=d)
+        # Move up from the lower half of the grid, or down from the upper half
+        direction = rng.choice([-1, 1], size=d)
+        point = np.where(direction > 0, point, point + delta)
+        orders[r] = rng.permutation(d)
+        design[r, 0] = point
+        for step, i in enumerate(orders[r]):
+            point = point.copy()
+            point[i] += direction[i]*delta
+            design[r, step + 1] = point
+
+    outputs = evaluator(space.transform(design.reshape(-1, d)), output).reshape(n_trajectories,
+                                                                                d + 1)
+    effects = np.zeros((n_trajectories, d))
+    for r in range(n_trajectories):
+        changes = np.diff(outputs[r])
+        steps = np.array([design[r, s + 1, i] - design[r, s, i] for s, i in enumerate(orders[r])])
+        effects[r, orders[r]] = changes/steps
+    indices = {'mu_star': np.abs(effects).mean(axis=0), 'mu': effects.mean(axis=0),
+               'sigma': effects.std(axis=0, ddof=1) if n_trajectories > 1 else np.zeros(d)}
+    return SensitivityResult('morris', space.names, indices, outputs.size)
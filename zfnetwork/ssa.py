@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 
-import cProfile
+import sys
 import numpy as np
-from zfnetwork import grn
+from concurrent.futures import ProcessPoolExecutor
 
 
 class GillespieSSA:
@@ -11,15 +11,9 @@ class GillespieSSA:
         self.zf_grn = zf_grn
         self.n_nodes = len(zf_grn.nodes)
         self.propensities = np.zeros(2*self.n_nodes)
+        # Total number of reactions fired by gillespie_ssa()
+        self.n_events = 0
         self.update_propensities()
-
-        # Generate lookup table for possible events for each node (+1, -1)
-        self.events = np.zeros((self.propensities.size, self.n_nodes))
-        j = 0
-        for i in range(0, self.events.shape[0], 2):
-            self.events[i, j] = 1
-            self.events[i+1, j] = -1
-            j += 1
     
     def step_tf(self, pop=None, beta=None, gamma=None):
         """Manually update TF parameters."""
@@ -42,24 +36,81 @@ class GillespieSSA:
             i += 1
         return i - 1
 
+    @staticmethod
+    def production_rate(node):
+        """Production propensity of node given the current populations of its regulators."""
+        # Take care here - what are the effects of this?
+        if node.ntype == 'TF':
+            return node.beta
+        # elif len(node.input) == 0:
+        #     return 0.0
+        # Production rate calculated as product of Hill functions. This is equivalent to AND logic
+        return np.prod([edge.hill() for edge in node.input])
+
     def update_propensities(self):
-        """Updates propensities of gene regulatory network."""
+        """Updates propensities of gene regulatory network.
 
-        for i, node in enumerate(self.zf_grn.nodes):
+        Also rebuilds the dependency lists used by update_dependents(), so this must be called
+        after changing parameters or edges of the network (as gillespie_ssa() does after user
+        events).
+        """
+        self._nodes = self.zf_grn.nodes
+        self._build_dependencies()
+        for i, node in enumerate(self._nodes):
             idx = 2*i # Accounting for 2 propensities per node
-            
-            # Take care here - what are the effects of this?
-            if node.ntype == 'TF':
-                production_rate = node.beta
-            # elif len(node.input) == 0:
-            #     production_rate = 0.0
-            else:
-                # Production rate calculated as product of Hill functions. This is equivalent to AND logic
-                production_rate = np.prod([edge.hill() for edge in node.input])
-            degradation_rate = node.gamma*node.pop
-            
-            self.propensities[idx] = production_rate
-            self.propensities[idx + 1] = degradation_rate
+            if i not in self._members:
+                self.propensities[idx] = self.production_rate(node)
+            self.propensities[idx + 1] = node.gamma*node.pop
+        for i in self._shared:
+            self._update_members(i)
+
+    def _build_dependencies(self):
+        """Index, for each node, the production propensities that depend on its population.
+
+        Members of a genomic cluster whose only regulator is the cluster unit (see
+        ZincFingerGRN.add_cluster) are updated together, with the unit's Hill term computed once
+        per cluster whenever members share k and n.
+        """
+        index = {id(node): i for i, node in enumerate(self._nodes)}
+        self._dependents = [[] for _ in self._nodes]
+        self._shared = {}
+        self._members = set()
+        for i, node in enumerate(self._nodes):
+            members, targets, seen = [], [], set()
+            for edge in node.output:
+                j = index[id(edge.y)]
+                if edge.y.ntype == 'TF' or j in seen:
+                    continue
+                seen.add(j)
+                if node.ntype == 'Cluster' and len(edge.y.input) == 1:
+                    members.append(j)
+                else:
+                    targets.append(j)
+            self._dependents[i] = targets
+            if members:
+                edges = [self._nodes[j].input[0] for j in members]
+                k = np.array([edge.k for edge in edges], dtype=float)
+                n = np.array([edge.n for edge in edges], dtype=float)
+                self._shared[i] = (2*np.array(members),
+                                   np.array([self._nodes[j].beta for j in members], dtype=float),
+                                   k[0] if np.all(k == k[0]) else k,
+                                   n[0] if np.all(n == n[0]) else n)
+                self._members.update(members)
+
+    def update_dependents(self, i):
+        """Updates the propensities affected by a change in the population of node i."""
+        node = self._nodes[i]
+        self.propensities[2*i + 1] = node.gamma*node.pop
+        for j in self._dependents[i]:
+            self.propensities[2*j] = self.production_rate(self._nodes[j])
+        if i in self._shared:
+            self._update_members(i)
+
+    def _update_members(self, i):
+        """Updates the production propensities of the members of cluster unit i."""
+        idx, beta, k, n = self._shared[i]
+        ratio = (self._nodes[i].pop/k)**n
+        self.propensities[idx] = beta*ratio/(1.0 + ratio)
 
     def gillespie_draw(self):
         """Draws an event and reaction time according to propensities.
@@ -84,77 +135,327 @@ class GillespieSSA:
         return event_idx, tau
 
 
-    def gillespie_ssa(self, duration, initial_pop, user_events={}):
+    def record_indices(self, record=None):
+        """Indices into zf_grn.nodes of the nodes in record, given as Node instances or labels."""
+        nodes = self.zf_grn.nodes
+        if record is None:
+            return np.arange(len(nodes))
+        by_id = {id(node): i for i, node in enumerate(nodes)}
+        by_label = {node.label: i for i, node in enumerate(nodes)}
+        return np.array([by_id[id(n)] if id(n) in by_id else by_label[n] for n in record],
+                        dtype=int)
+
+    def gillespie_ssa(self, duration, initial_pop=None, user_events={}, sample_interval=1.0,
+                      record=None, event_log=False):
         """Run Gillespie stochastic simulation algorithm.
         
         Arguments:
             duration: the duration of the simulation.
-            events: a dict mapping from time points to events, where an event is a function that
-                will be called.
+            initial_pop: population of each node at t0, in the order of zf_grn.nodes. Defaults to
+                the current node populations.
+            user_events: a dict mapping from sample indices (time points, if sample_interval is 1)
+                to events, where an event is a function that will be called after that sample is
+                recorded.
+            sample_interval: time between recorded samples; samples are taken at
+                0, sample_interval, ... up to but not including duration.
+            record: nodes to record, as Node instances or labels (default: all nodes). Pass an
+                empty list to record only the event log.
+            event_log: if True, also return an EventLog of every reaction. Populations changed by
+                user events are not part of the log.
 
         Returns:
-            time_log: array of time steps from t0 to t0+duration
-            pop_log: array of population records for each node
+            time_log: array of sample times
+            pop_log: array of population records, of shape (len(time_log), number of recorded nodes)
+            event_log: EventLog instance, only returned if event_log is True
         """
+        nodes = self.zf_grn.nodes
+        if initial_pop is not None:
+            for node, pop in zip(nodes, initial_pop):
+                node.pop = pop
+        self.update_propensities()
 
-        time_log = np.zeros(duration)
-        pop_log = np.zeros((duration, self.n_nodes))
-        pop_log[0, :] = initial_pop
+        time_log = sample_times(duration, sample_interval)
+        record_nodes = [nodes[i] for i in self.record_indices(record)]
+        pop_log = np.zeros((time_log.size, len(record_nodes)))
+        log = EventLog([node.pop for node in nodes]) if event_log else None
     
         # Run Gillespie SSA loop
-        t, t_idx = 0, 1
-        while t_idx < duration:
+        t, t_idx = 0.0, 0
+        while True:
             
+            # event_idx is None and tau infinite if no reaction can fire (see gillespie_draw())
             event_idx, tau = self.gillespie_draw()
-            
-            # See gillespie_draw() for trigger conditions.
-            if event_idx is None:
-                for k in range(t_idx, duration):
-                    time_log[k] = time_log[k-1] + 1
-                    pop_log[k] = [node.pop for node in self.zf_grn.nodes]
-                return time_log, pop_log
-
-            t += tau
-            for j, node in enumerate(self.zf_grn.nodes):
-                node.pop += self.events[event_idx, j]
-            self.update_propensities()
-            
-            if t < t_idx:
-                continue
+            t_next = t + tau
 
-            for _ in range(int(np.ceil(t-t_idx))):
-                if t_idx >= duration:
-                    break
-                pop_log[t_idx] = [node.pop for node in self.zf_grn.nodes]
-                time_log[t_idx] = time_log[t_idx-1] + 1
-                # Call user events. Seems this is not triggering when it should...
-                if t_idx in user_events:
-                    user_events[t_idx]()
+            # Samples between now and the next reaction see the current state
+            interrupted = False
+            while t_idx < time_log.size and time_log[t_idx] < t_next:
+                pop_log[t_idx] = [node.pop for node in record_nodes]
                 t_idx += 1
+                if t_idx - 1 in user_events:
+                    # Restart from the sample time, since the event may change propensities
+                    user_events[t_idx - 1]()
+                    self.update_propensities()
+                    t = time_log[t_idx - 1]
+                    interrupted = True
+                    break
+            if interrupted:
+                continue
+            if t_next > duration:
+                break
+
+            # Reaction 2*i produces one unit of node i, reaction 2*i + 1 removes one. Changing the
+            # population is O(1); the cost of an event is then that of recomputing the
+            # propensities that depend on node i (see update_dependents())
+            t = t_next
+            nodes[event_idx//2].pop += 1 if event_idx % 2 == 0 else -1
+            self.update_dependents(event_idx//2)
+            self.n_events += 1
+            if log is not None:
+                log.append(t, event_idx)
 
+        if event_log:
+            return time_log, pop_log, log
         return time_log, pop_log
 
-    def run(self, duration, replicates, user_events={}):
-        """Run Gillespie stochastic simulation algorithm."""
+    def run(self, duration, replicates, user_events={}, sample_interval=1.0, record=None,
+            event_log=False, progress=True):
+        """Run Gillespie stochastic simulation algorithm.
+
+        See gillespie_ssa() for arguments. If event_log is True, a list with the EventLog of each
+        replicate is returned as a third value. If progress is True, the replicate count is
+        reported on stderr.
+        """
 
         # Initialize time and population storage arrays
-        time_log = np.zeros((replicates, duration))
-        pop_log = np.zeros((replicates, duration, self.n_nodes))
+        n_samples = sample_times(duration, sample_interval).size
+        n_recorded = self.record_indices(record).size
+        time_log = np.zeros((replicates, n_samples))
+        pop_log = np.zeros((replicates, n_samples, n_recorded))
+        event_logs = []
         statedict = self.zf_grn.save_state()
 
         for rep in range(replicates):
-            if rep % 5 == 0:
-                print(f'rep: {rep}', end='\r')
+            if progress and rep % 5 == 0:
+                print(f'rep: {rep}', end='\r', file=sys.stderr)
             
             # Reset node populations to original values
             self.zf_grn.load_state(statedict)
-            tlog, plog = self.gillespie_ssa(duration, statedict['nodes']['pop'], user_events)
-            time_log[rep, :] = tlog
-            pop_log[rep, :, :] = plog
+            result = self.gillespie_ssa(duration, statedict['nodes']['pop'], user_events,
+                                        sample_interval, record, event_log)
+            time_log[rep, :] = result[0]
+            pop_log[rep, :, :] = result[1]
+            if event_log:
+                event_logs.append(result[2])
+        if event_log:
+            return time_log, pop_log, event_logs
         return time_log, pop_log
 
+    def run_components(self, duration, replicates, n_jobs=None, sample_interval=1.0, record=None):
+        """Run Gillespie SSA separately on each weakly connected component of the network.
+
+        Reactions in different components never affect each other's propensities, so simulating
+        components independently gives exact trajectories while keeping each propensity vector
+        small. Components are distributed across a process pool. Isolated nodes (no edges) are
+        birth-death processes and are sampled directly from their closed-form transition
+        distribution rather than simulated. Components without recorded nodes are not simulated.
+        User events and event logs are not supported, since events may couple components.
+
+        Arguments:
+            duration: the duration of the simulation.
+            replicates: number of independent replicates.
+            n_jobs: number of worker processes; 1 runs all components in this process.
+            sample_interval: time between recorded samples, as in gillespie_ssa().
+            record: nodes to record, as Node instances or labels (default: all nodes).
+
+        Returns:
+            time_log: array of sample times for each replicate
+            pop_log: array of population records for each recorded node, in the order of
+                zf_grn.nodes if record is None, otherwise in the order of record
+        """
+        statedict = self.zf_grn.save_state()
+        times = sample_times(duration, sample_interval)
+        record_idx = self.record_indices(record)
+        column = {node_idx: col for col, node_idx in enumerate(record_idx)}
+        time_log = np.tile(times, (replicates, 1))
+        pop_log = np.zeros((replicates, times.size, record_idx.size))
+
+        nodes = self.zf_grn.nodes
+        jobs = []
+        for component in self.zf_grn.weakly_connected_components():
+            local = [i for i, node_idx in enumerate(component) if node_idx in column]
+            if not local:
+                continue
+            cols = [column[component[i]] for i in local]
+            if len(component) == 1 and nodes[component[0]].degree == 0:
+                node = nodes[component[0]]
+                pop_log[:, :, cols[0]] = birth_death(self.production_rate(node), node.gamma,
+                                                     node.pop, duration, replicates,
+                                                     sample_interval)
+            else:
+                jobs.append((cols, self.zf_grn.to_dict(component), local))
+        seeds = np.random.randint(2**32 - 1, size=len(jobs))
+
+        if n_jobs == 1 or len(jobs) <= 1:
+            results = [_simulate_component(netdict, duration, replicates, seed, sample_interval,
+                                           local)
+                       for (_, netdict, local), seed in zip(jobs, seeds)]
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+                results = list(pool.map(_simulate_component, [job[1] for job in jobs],
+                                        [duration]*len(jobs), [replicates]*len(jobs), seeds,
+                                        [sample_interval]*len(jobs), [job[2] for job in jobs]))
+
+        for (cols, _, _), plog in zip(jobs, results):
+            pop_log[:, :, cols] = plog
+        self.zf_grn.load_state(statedict)
+        return time_log, pop_log
+
+
+class EventLog:
+    """Exact record of the reactions fired during one simulation.
+
+    Reaction 2*i produces one unit of node i and reaction 2*i + 1 removes one, so storing each
+    reaction's time and index is enough to reconstruct every population at any time, on any grid.
+    Indices are stored in the smallest unsigned integer type that can hold them.
+    """
+
+    def __init__(self, initial_pop, times=None, reactions=None):
+        """EventLog constructor
+
+        Args:
+            initial_pop: population of each node at t0
+            times: reaction times, in increasing order
+            reactions: reaction indices
+
+        Returns:
+            EventLog instance
+        """
+        self.initial_pop = np.asarray(initial_pop, dtype=float)
+        self.dtype = np.min_scalar_type(max(2*self.initial_pop.size - 1, 0))
+        times = np.zeros(0) if times is None else np.asarray(times, dtype=float)
+        self.n_events = times.size
+        self._times = np.zeros(max(self.n_events, 1024))
+        self._times[:self.n_events] = times
+        self._reactions = np.zeros(self._times.size, dtype=self.dtype)
+        if reactions is not None:
+            self._reactions[:self.n_events] = reactions
+
+    def __len__(self):
+        return self.n_events
+
+    @property
+    def times(self):
+        return self._times[:self.n_events]
+
+    @property
+    def reactions(self):
+        return self._reactions[:self.n_events]
+
+    def append(self, t, reaction):
+        """Add reaction fired at time t, growing storage geometrically."""
+        if self.n_events == self._times.size:
+            self._times = np.concatenate([self._times, np.zeros(self._times.size)])
+            self._reactions = np.concatenate([self._reactions,
+                                              np.zeros(self._reactions.size, dtype=self.dtype)])
+        self._times[self.n_events] = t
+        self._reactions[self.n_events] = reaction
+        self.n_events += 1
+
+    def populations(self, times, nodes=None):
+        """Reconstruct populations at arbitrary time points.
+
+        Args:
+            times: array of time points
+            nodes: indices of nodes to reconstruct (default: all nodes)
+
+        Returns:
+            pop_log: array of shape (len(times), len(nodes)) holding the state after every
+                reaction at or before each time point
+        """
+        times = np.asarray(times, dtype=float)
+        nodes = np.arange(self.initial_pop.size) if nodes is None else np.asarray(nodes, dtype=int)
+        reactions = self.reactions.astype(np.int64)
+        node_of = reactions//2
+        steps = 1 - 2*(reactions % 2)
+
+        # Group reactions by node, keeping time order within each node
+        order = np.argsort(node_of, kind='stable')
+        node_of, steps, event_times = node_of[order], steps[order], self.times[order]
+        bounds = np.searchsorted(node_of, np.arange(self.initial_pop.size + 1))
+
+        pop_log = np.zeros((times.size, nodes.size))
+        for col, node in enumerate(nodes):
+            start, end = bounds[node], bounds[node + 1]
+            change = np.concatenate([[0], np.cumsum(steps[start:end])])
+            idx = np.searchsorted(event_times[start:end], times, side='right')
+            pop_log[:, col] = self.initial_pop[node] + change[idx]
+        return pop_log
+
+    def save(self, outfile):
+        """Save log to compressed .npz file."""
+        np.savez_compressed(outfile, initial_pop=self.initial_pop, times=self.times,
+                            reactions=self.reactions)
+
+    @classmethod
+    def load(cls, infile):
+        """Load log from .npz file written by save()."""
+        with np.load(infile) as data:
+            return cls(data['initial_pop'], data['times'], data['reactions'])
+
+
+def sample_times(duration, sample_interval=1.0):
+    """Sample times 0, sample_interval, ... up to but not including duration."""
+    n_samples = int(np.ceil(duration/sample_interval - 1e-9))
+    return np.arange(n_samples)*sample_interval
+
+
+def birth_death(production_rate, gamma, initial_pop, duration, replicates, sample_interval=1.0):
+    """Sample birth-death trajectories at regular time points from the exact transition law.
+
+    Over an interval dt, surviving molecules are Binomial(pop, exp(-gamma*dt)) and newly produced
+    survivors are Poisson(production_rate*(1 - exp(-gamma*dt))/gamma).
+
+    Returns:
+        pop_log: array of shape (replicates, number of sample times)
+    """
+    n_samples = sample_times(duration, sample_interval).size
+    pop_log = np.zeros((replicates, n_samples))
+    pop_log[:, 0] = initial_pop
+    if gamma > 0:
+        survival = np.exp(-gamma*sample_interval)
+        immigration = production_rate*(1.0 - survival)/gamma
+    else:
+        survival, immigration = 1.0, production_rate*sample_interval
+    pop = np.full(replicates, int(round(initial_pop)))
+    for t in range(1, n_samples):
+        pop = np.random.binomial(pop, survival) + np.random.poisson(immigration, size=replicates)
+        pop_log[:, t] = pop
+    return pop_log
+
+
+def _simulate_component(netdict, duration, replicates, seed, sample_interval=1.0, record=None):
+    """Simulate one network component; module-level so that it can run in worker processes.
+
+    record holds indices of nodes to record, in the order of netdict['nodes']. The global random
+    state is restored afterwards, so that running in the caller's process (n_jobs=1) does not
+    reseed the caller's random stream.
+    """
+    from zfnetwork import grn
+    state = np.random.get_state()
+    np.random.seed(seed)
+    try:
+        simulation = GillespieSSA(grn.ZincFingerGRN.from_dict(netdict))
+        if record is not None:
+            record = [simulation.zf_grn.nodes[i] for i in record]
+        return simulation.run(duration, replicates, sample_interval=sample_interval,
+                              record=record, progress=False)[1]
+    finally:
+        np.random.set_state(state)
+
 
 def main():
+    from zfnetwork import grn
     node_types = {1: 'TF', 2: 'ZF', 3: 'TE'}
     edges = [(1, 2), (1, 3), (2, 3), (2, 2)]
     zf_grn = grn.ZincFingerGRN()
@@ -164,4 +465,5 @@ def main():
     simulation.run(600, 50)
 
 if __name__ == '__main__':
+    import cProfile
     cProfile.run('main()')